@@ -0,0 +1,159 @@
+"""
+Papers per year, and per year and journal or MeSH term, as Markdown tables.
+
+The counts are read from the summary tables that database.py keeps
+current as papers are loaded, so no XML needs to be parsed. They can also
+be computed directly from XML files in a single streaming pass, or
+rebuilt from the papers already in the database.
+
+`usage: aggregate.py [-h] [--db DB] [--files [FILES ...]] [--by {year,journal,mesh}]
+                    [--top TOP] [--rebuild]`
+"""
+
+import argparse
+from collections import Counter
+from itertools import chain
+import logging
+import sqlite3
+import sys
+from typing import List, Tuple
+
+from database import connect_to_database, create_tables
+from markdown_table import HEADINGS, convert_to_markdown
+from parse_xml import DB, extract_data_from_file
+from summaries import Summary, summarize_papers, year_of_publication
+
+
+def read_summary(connection: sqlite3.Connection) -> Summary:
+    """
+    Read the counts from the summary tables.
+    """
+    summary = Summary()
+    for year, papers in connection.execute("SELECT year, papers FROM year_count"):
+        summary.years[year] = papers
+    for year, journal, papers in connection.execute(
+        "SELECT year, journal, papers FROM year_journal_count"
+    ):
+        summary.year_journals[(year, journal)] = papers
+    for year, term, papers in connection.execute(
+        "SELECT year, mesh_term, papers FROM year_mesh_term_count"
+    ):
+        summary.year_mesh_terms[(year, term)] = papers
+    return summary
+
+
+def rebuild_summaries(connection: sqlite3.Connection) -> None:
+    """
+    Recompute the summary tables from the papers in the database with one
+    GROUP BY query each, for databases loaded before the tables existed.
+    """
+    connection.create_function(
+        "year_of_publication", 2, year_of_publication, deterministic=True
+    )
+    connection.execute("BEGIN")
+    for table in ("year_count", "year_journal_count", "year_mesh_term_count"):
+        connection.execute(f"DELETE FROM {table}")
+    connection.execute("""INSERT INTO year_count
+        SELECT year_of_publication(year, pub_date), count(*) FROM paper
+        GROUP BY 1""")
+    connection.execute("""INSERT INTO year_journal_count
+        SELECT year_of_publication(year, pub_date), coalesce(journal, 'Unknown'), count(*)
+        FROM paper GROUP BY 1, 2""")
+    connection.execute("""INSERT INTO year_mesh_term_count
+        SELECT year_of_publication(paper.year, paper.pub_date), mesh_term.term,
+            count(DISTINCT paper.pmid)
+        FROM paper
+        JOIN paper_mesh_term ON paper_mesh_term.paper_id = paper.pmid
+        JOIN mesh_term ON mesh_term.id = paper_mesh_term.mesh_term_id
+        GROUP BY 1, 2""")
+    connection.execute("COMMIT")
+
+
+def summarize_files(list_of_files: List[str]) -> Summary:
+    """
+    Count the papers in XML files in a single streaming pass.
+    """
+    return summarize_papers(
+        chain.from_iterable(
+            extract_data_from_file(fn, stream=True) for fn in list_of_files
+        )
+    )
+
+
+def table_rows(summary: Summary, by: str, top: int = None) -> List[Tuple]:
+    """
+    Rows of the table for a breakdown of the summary, sorted by year, with the
+    journals or MeSH terms of each year in descending order of papers.
+    When top is given, only that many journals or terms are kept per year.
+    """
+    if by == "year":
+        return sorted(summary.years.items())
+    counts: Counter = (
+        summary.year_journals if by == "journal" else summary.year_mesh_terms
+    )
+    rows = sorted(counts.items(), key=lambda item: (item[0][0], -item[1], item[0][1]))
+    kept = []
+    per_year = Counter()
+    for (year, name), papers in rows:
+        per_year[year] += 1
+        if top is None or per_year[year] <= top:
+            kept.append((year, name, papers))
+    return kept
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed Papers per Year")
+    parser.add_argument("--db", default=DB, help="Database file (default: %(default)s)")
+    parser.add_argument(
+        "--files",
+        nargs="*",
+        help="Count the papers in these XML files instead of the database",
+    )
+    parser.add_argument(
+        "--by",
+        choices=sorted(HEADINGS),
+        default="year",
+        help="Break the counts down by year, journal or MeSH term (default: year)",
+    )
+    parser.add_argument(
+        "--top", type=int, help="Only show the top journals or MeSH terms of each year"
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Recompute the summary tables from the papers in the database",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    args = parser.parse_args(args)
+    if args.files is not None and args.rebuild:
+        parser.error("--rebuild applies to the database, not to --files")
+    return args
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    if args.files is not None:
+        summary = summarize_files(args.files)
+    else:
+        connection = connect_to_database(args.db)
+        try:
+            create_tables(connection)
+            if args.rebuild:
+                rebuild_summaries(connection)
+            summary = read_summary(connection)
+        finally:
+            connection.close()
+    print(
+        convert_to_markdown(table_rows(summary, args.by, args.top), HEADINGS[args.by])
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,502 @@
+"""
+Resolve author name variants across papers to stable author ids.
+
+The same person appears as "Marmot Michael M", "Marmot M" or "Marmot
+Michael G" on different papers, and different people share a name.
+Each author occurrence (one author of one paper) is put in a block keyed
+on the normalized surname and first initial, so only occurrences in the
+same block are ever compared and resolution stays near-linear in the
+number of occurrences. Within a block, an occurrence is only compared
+with the authors that share some evidence with it (a forename, an
+affiliation word or a co-author), found through an index of that
+evidence, so a block of a common name such as "Wang Y" is not resolved
+by comparing every occurrence with every author.
+
+Within a block, occurrences are merged into authors when their names are
+compatible (the initials of one are a prefix of the other and the
+forenames do not conflict) and there is enough evidence: the same full
+forename, similar affiliations, or shared co-authors.
+
+Ids are stored in the database and kept stable across runs: a resolved
+author keeps the id most of its occurrences had in the previous run, and
+only new authors get new ids.
+
+`usage: authors.py [-h] [--db DB] [--files [FILES ...]] [--threshold THRESHOLD]
+                  [names ...]`
+"""
+
+import argparse
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from itertools import chain
+import logging
+import re
+import sqlite3
+import sys
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from database import connect_to_database, create_tables
+from parse_xml import DB, Paper, extract_data_from_file
+
+# score needed to merge an occurrence into an author
+THRESHOLD = 1.0
+FORENAME_SCORE = 1.0
+AFFILIATION_WEIGHT = 2.0
+COAUTHOR_SCORE = 0.5
+COLLECTIVE_SUFFIX = " (Collective)"
+INITIALS_PATTERN = re.compile(r"[A-Z]+")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+AFFILIATION_STOPWORDS = {
+    "and",
+    "for",
+    "the",
+    "department",
+    "university",
+    "institute",
+    "school",
+    "faculty",
+    "centre",
+    "center",
+    "health",
+    "medicine",
+    "medical",
+    "sciences",
+    "science",
+}
+
+TABLES = [
+    """CREATE TABLE IF NOT EXISTS resolved_author (
+        id INTEGER PRIMARY KEY,
+        block TEXT NOT NULL,
+        name TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS author_occurrence (
+        paper_id INTEGER NOT NULL REFERENCES paper (pmid),
+        position INTEGER NOT NULL,
+        resolved_author_id INTEGER NOT NULL REFERENCES resolved_author (id),
+        PRIMARY KEY (paper_id, position)
+    )""",
+    """CREATE INDEX IF NOT EXISTS author_occurrence_author
+        ON author_occurrence (resolved_author_id)""",
+]
+
+
+@dataclass
+class Occurrence:
+    paper_id: int
+    position: int
+    name: str
+    affiliation: str
+    surname: str
+    forename: str
+    initials: str
+    coauthors: Set[str]
+
+
+@dataclass
+class ResolvedAuthor:
+    block: str
+    occurrences: List[Occurrence] = field(default_factory=list)
+    forenames: Set[str] = field(default_factory=set)
+    initials: str = ""
+    affiliation_words: Set[str] = field(default_factory=set)
+    coauthors: Counter = field(default_factory=Counter)
+    id: Optional[int] = None
+
+    def add(self, occurrence: Occurrence) -> None:
+        self.occurrences.append(occurrence)
+        if occurrence.forename:
+            self.forenames.add(occurrence.forename)
+        if len(occurrence.initials) > len(self.initials):
+            self.initials = occurrence.initials
+        self.affiliation_words.update(affiliation_words(occurrence.affiliation))
+        self.coauthors.update(occurrence.coauthors)
+
+    @property
+    def name(self) -> str:
+        """
+        The most common name variant, the longest on a tie.
+        """
+        counts = Counter(occurrence.name for occurrence in self.occurrences)
+        return max(counts, key=lambda name: (counts[name], len(name), name))
+
+
+def normalize(text: str) -> str:
+    """
+    Lower case and strip accents and punctuation, e.g. "O'Brien-Núñez" -> "obriennunez".
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return "".join(WORD_PATTERN.findall(stripped.lower()))
+
+
+def split_name(name: str) -> Tuple[str, str, str]:
+    """
+    Split a name built by retrieve_name_of_author into (surname, forename, initials),
+    e.g. "de Negri Armando A" -> ("de Negri", "Armando", "A").
+
+    The initials are the last word. The forename is the run of words before
+    them whose first letters match the initials, and the rest is the surname.
+    Collective names are returned whole as the surname.
+    """
+    if name.endswith(COLLECTIVE_SUFFIX):
+        return name, "", ""
+    words = name.split()
+    if len(words) < 2 or not INITIALS_PATTERN.fullmatch(words[-1]):
+        return name, "", ""
+    initials = words[-1]
+    words = words[:-1]
+    remaining = initials
+    start = len(words)
+    # consume forename words from the end, matching initials right to left
+    while start > 1 and remaining:
+        parts = [part for part in words[start - 1].split("-") if part]
+        letters = "".join(part[0].upper() for part in parts)
+        if not remaining.endswith(letters):
+            break
+        remaining = remaining[: -len(letters)]
+        start -= 1
+    return " ".join(words[:start]), " ".join(words[start:]), initials
+
+
+def block_key(surname: str, initials: str) -> str:
+    """
+    The blocking key of a name: normalized surname and first initial.
+    """
+    return "{} {}".format(normalize(surname), initials[:1].lower()).strip()
+
+
+def name_block_key(name: str) -> str:
+    surname, _, initials = split_name(name)
+    return block_key(surname, initials)
+
+
+def affiliation_words(affiliation: str) -> Set[str]:
+    """
+    Distinctive words of an affiliation, for comparing affiliations.
+    """
+    decomposed = unicodedata.normalize("NFKD", affiliation or "").lower()
+    return {
+        word
+        for word in WORD_PATTERN.findall(decomposed)
+        if len(word) > 2 and word not in AFFILIATION_STOPWORDS
+    }
+
+
+def make_occurrences(
+    paper_id: int, authors: List[Tuple[str, str]]
+) -> Iterator[Occurrence]:
+    """
+    Yield an occurrence for each (name, affiliation) author of a paper, with
+    the block keys of the other authors as its co-authors.
+    """
+    keys = [name_block_key(name) for name, _ in authors]
+    for position, (name, affiliation) in enumerate(authors):
+        surname, forename, initials = split_name(name)
+        coauthors = set(keys[:position] + keys[position + 1 :])
+        yield Occurrence(
+            paper_id,
+            position,
+            name,
+            affiliation or "",
+            surname,
+            normalize(forename),
+            initials,
+            coauthors,
+        )
+
+
+def iterate_occurrences_from_papers(papers: Iterable[Paper]) -> Iterator[Occurrence]:
+    for paper in papers:
+        yield from make_occurrences(
+            int(paper.pmc_id),
+            [(author.name, author.affiliation) for author in paper.authors],
+        )
+
+
+def iterate_occurrences_from_database(
+    connection: sqlite3.Connection,
+) -> Iterator[Occurrence]:
+    current = None
+    authors = []
+    for paper_id, name, affiliation in connection.execute(
+        """SELECT author_paper.paper_id, author.name, author.affiliation
+        FROM author_paper JOIN author ON author.id = author_paper.author_id
+        ORDER BY author_paper.paper_id, author_paper.position"""
+    ):
+        if paper_id != current:
+            if authors:
+                yield from make_occurrences(current, authors)
+            current = paper_id
+            authors = []
+        authors.append((name, affiliation))
+    if authors:
+        yield from make_occurrences(current, authors)
+
+
+def names_are_compatible(author: ResolvedAuthor, occurrence: Occurrence) -> bool:
+    """
+    Check that the initials of one are a prefix of the other's, and that a
+    full forename, if both have one, is the same or an abbreviation of it.
+    """
+    shorter, longer = sorted((author.initials, occurrence.initials), key=len)
+    if not longer.startswith(shorter):
+        return False
+    if occurrence.forename and author.forenames:
+        return any(
+            forename.startswith(occurrence.forename)
+            or occurrence.forename.startswith(forename)
+            for forename in author.forenames
+        )
+    return True
+
+
+def score(author: ResolvedAuthor, occurrence: Occurrence) -> float:
+    """
+    Evidence that an occurrence belongs to an author with a compatible name.
+    """
+    total = 0.0
+    if occurrence.forename and occurrence.forename in author.forenames:
+        total += FORENAME_SCORE
+    words = affiliation_words(occurrence.affiliation)
+    if words and author.affiliation_words:
+        overlap = len(words & author.affiliation_words)
+        total += (
+            AFFILIATION_WEIGHT
+            * overlap
+            / min(len(words), len(author.affiliation_words))
+        )
+    total += COAUTHOR_SCORE * sum(
+        1 for coauthor in occurrence.coauthors if coauthor in author.coauthors
+    )
+    return total
+
+
+def evidence(occurrence: Occurrence) -> Set[Tuple[str, str]]:
+    """
+    The forename, affiliation words and co-authors of an occurrence. Only
+    an author sharing one of them can give the occurrence a positive score.
+    """
+    features = {
+        ("affiliation", word) for word in affiliation_words(occurrence.affiliation)
+    }
+    features.update(("coauthor", coauthor) for coauthor in occurrence.coauthors)
+    if occurrence.forename:
+        features.add(("forename", occurrence.forename))
+    return features
+
+
+def resolve_block(
+    key: str, occurrences: List[Occurrence], threshold: float = THRESHOLD
+) -> List[ResolvedAuthor]:
+    """
+    Merge the occurrences of one block into authors.
+
+    Occurrences with the most complete names go first, so that abbreviated
+    variants are compared against authors that already have full forenames.
+    Each occurrence joins the best scoring compatible author, or starts a new one.
+    As the threshold is positive, only the authors sharing some evidence with
+    the occurrence are scored, found through an index from each piece of
+    evidence to the authors that have it.
+    """
+    authors: List[ResolvedAuthor] = []
+    author_evidence: List[Set[Tuple[str, str]]] = []
+    index: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    ordered = sorted(
+        occurrences,
+        key=lambda o: (-len(o.initials), -len(o.forename), o.paper_id, o.position),
+    )
+    for occurrence in ordered:
+        features = evidence(occurrence)
+        if threshold > 0:
+            # in creation order, so ties go to the same author as a full scan
+            candidates = sorted(
+                set(chain.from_iterable(index.get(f, ()) for f in features))
+            )
+        else:
+            candidates = range(len(authors))
+        best, best_number, best_score = None, None, threshold
+        for number in candidates:
+            author = authors[number]
+            if not names_are_compatible(author, occurrence):
+                continue
+            author_score = score(author, occurrence)
+            if author_score >= best_score:
+                best, best_number, best_score = author, number, author_score
+        if best is None:
+            best, best_number = ResolvedAuthor(key), len(authors)
+            authors.append(best)
+            author_evidence.append(set())
+        best.add(occurrence)
+        for feature in features - author_evidence[best_number]:
+            index[feature].append(best_number)
+        author_evidence[best_number].update(features)
+    return authors
+
+
+def resolve(
+    occurrences: Iterable[Occurrence], threshold: float = THRESHOLD
+) -> List[ResolvedAuthor]:
+    """
+    Block the occurrences and resolve each block independently.
+    """
+    blocks: Dict[str, List[Occurrence]] = defaultdict(list)
+    for occurrence in occurrences:
+        blocks[block_key(occurrence.surname, occurrence.initials)].append(occurrence)
+    return list(
+        chain.from_iterable(
+            resolve_block(key, blocks[key], threshold) for key in sorted(blocks)
+        )
+    )
+
+
+def assign_ids(
+    authors: List[ResolvedAuthor], previous: Dict[Tuple[int, int], int]
+) -> None:
+    """
+    Give each author the id most of its occurrences had before, if no larger
+    author has already claimed it, and new ids to the rest.
+    """
+    used = set()
+    next_id = max(previous.values(), default=0) + 1
+    for author in sorted(authors, key=lambda a: -len(a.occurrences)):
+        votes = Counter(
+            previous[(o.paper_id, o.position)]
+            for o in author.occurrences
+            if (o.paper_id, o.position) in previous
+        )
+        for author_id, _ in votes.most_common():
+            if author_id not in used:
+                author.id = author_id
+                break
+        else:
+            author.id = next_id
+            next_id += 1
+        used.add(author.id)
+
+
+def create_author_tables(connection: sqlite3.Connection) -> None:
+    for table in TABLES:
+        connection.execute(table)
+
+
+def read_previous_ids(connection: sqlite3.Connection) -> Dict[Tuple[int, int], int]:
+    return {
+        (paper_id, position): author_id
+        for paper_id, position, author_id in connection.execute(
+            "SELECT paper_id, position, resolved_author_id FROM author_occurrence"
+        )
+    }
+
+
+def write_resolved_authors(
+    connection: sqlite3.Connection, authors: List[ResolvedAuthor]
+) -> None:
+    connection.execute("BEGIN")
+    connection.execute("DELETE FROM author_occurrence")
+    connection.execute("DELETE FROM resolved_author")
+    connection.executemany(
+        "INSERT INTO resolved_author VALUES (?, ?, ?)",
+        [(author.id, author.block, author.name) for author in authors],
+    )
+    connection.executemany(
+        "INSERT INTO author_occurrence VALUES (?, ?, ?)",
+        [
+            (occurrence.paper_id, occurrence.position, author.id)
+            for author in authors
+            for occurrence in author.occurrences
+        ],
+    )
+    connection.execute("COMMIT")
+
+
+def resolve_authors_in_database(
+    connection: sqlite3.Connection, threshold: float = THRESHOLD
+) -> List[ResolvedAuthor]:
+    """
+    Resolve every author occurrence in the database and store the ids,
+    keeping the ids of a previous run where the authors are unchanged.
+    """
+    create_author_tables(connection)
+    authors = resolve(iterate_occurrences_from_database(connection), threshold)
+    assign_ids(authors, read_previous_ids(connection))
+    write_resolved_authors(connection, authors)
+    return authors
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed Author Resolution")
+    parser.add_argument("--db", default=DB, help="Database file (default: %(default)s)")
+    parser.add_argument(
+        "--files",
+        nargs="*",
+        help="Resolve the authors of these XML files without storing the ids",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="Score needed to merge name variants (default: %(default)s)",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument(
+        "names", nargs="*", help='Show the resolved authors for names, e.g. "Marmot M"'
+    )
+    args = parser.parse_args(args)
+    if args.threshold <= 0:
+        parser.error("--threshold must be positive")
+    return args
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    if args.files is not None:
+        papers = chain.from_iterable(
+            extract_data_from_file(fn, stream=True) for fn in args.files
+        )
+        authors = resolve(iterate_occurrences_from_papers(papers), args.threshold)
+        assign_ids(authors, {})
+    else:
+        connection = connect_to_database(args.db)
+        try:
+            create_tables(connection)
+            authors = resolve_authors_in_database(connection, args.threshold)
+        finally:
+            connection.close()
+    logging.info(
+        "Resolved {} author occurrences to {} authors in {} blocks".format(
+            sum(len(author.occurrences) for author in authors),
+            len(authors),
+            len({author.block for author in authors}),
+        )
+    )
+    for name in args.names:
+        key = name_block_key(name)
+        matches = [author for author in authors if author.block == key]
+        if not matches:
+            logging.error("No authors found for {}".format(name))
+            continue
+        for author in sorted(matches, key=lambda a: a.id):
+            variants = sorted({o.name for o in author.occurrences})
+            papers = sorted({o.paper_id for o in author.occurrences})
+            print(
+                "{} - {} ({} papers: {}; variants: {})".format(
+                    author.id,
+                    author.name,
+                    len(papers),
+                    ", ".join(str(p) for p in papers),
+                    "; ".join(variants),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
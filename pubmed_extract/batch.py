@@ -0,0 +1,320 @@
+"""
+Download the records of many author searches at once, fetching each paper once.
+
+The searches are read from a tab-separated file with one search per line,
+`author<TAB>start_year[<TAB>end_year]`, blank lines and lines starting
+with # being skipped. An esearch per search collects its PMIDs (paging the
+history server for searches of more than 10,000 papers), and the
+union of the PMIDs is fetched with efetch by id, so a paper found by
+several searches is only downloaded once.
+
+The records go to a single PubmedArticleSet file, each record once, and
+the mapping from each search to its PMIDs is written as JSON next to it
+(`<output>.queries.json` by default):
+
+    {"searches": [{"author": ..., "start_year": ..., "end_year": ...,
+                   "query": ..., "pmids": [...]}, ...],
+     "count": <distinct records>}
+
+`usage: batch.py [-h] [--output OUTPUT] [--mapping MAPPING] [--workers WORKERS]
+                [--batch-size BATCH_SIZE] [--cache-dir CACHE_DIR] [--metrics METRICS]
+                [--verbose] queries`
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import sys
+from typing import List, NamedTuple, Optional
+import urllib.parse
+import xml.etree.ElementTree as ET
+
+from cache import ResponseCache
+import main as downloader
+from metrics import METRICS
+
+# efetch takes ids in the query string, which NCBI asks to keep to about 200
+BATCH_SIZE = 200
+MAX_BATCH_SIZE = 200
+# esearch and efetch return at most 10,000 ids per request
+MAX_IDS_PER_SEARCH = 10000
+
+
+class Search(NamedTuple):
+    author: str
+    start_year: int
+    end_year: Optional[int]
+
+
+def read_searches(file_name: str) -> List[Search]:
+    """
+    Read the searches from a tab-separated file of author, start year and
+    optional end year.
+    """
+    searches = []
+    with open(file_name, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = [field.strip() for field in line.rstrip("\n").split("\t")]
+            try:
+                if len(fields) not in (2, 3) or not fields[0]:
+                    raise ValueError
+                end_year = int(fields[2]) if len(fields) == 3 and fields[2] else None
+                searches.append(Search(fields[0], int(fields[1]), end_year))
+            except ValueError:
+                raise ValueError(
+                    "{}:{}: expected author<TAB>start_year[<TAB>end_year]".format(
+                        file_name, line_number
+                    )
+                )
+    return searches
+
+
+def search_pmids(query_string: str) -> List[str]:
+    """
+    Get the PMIDs of all the papers in the search results. The esearch
+    returns the first MAX_IDS_PER_SEARCH of them; as esearch cannot page
+    past the first 10,000 results of a PubMed search, the rest are paged
+    off the history server with efetch rettype=uilist.
+    """
+    url = "{}/esearch.fcgi?db=pubmed&term={}&usehistory=y&retmax={}&tool={}&email={}".format(
+        downloader.EUTILS_URL,
+        query_string,
+        MAX_IDS_PER_SEARCH,
+        downloader.TOOL,
+        downloader.EMAIL,
+    )
+    logging.debug("URL: {}".format(url))
+    root = ET.fromstring(downloader.fetch_url(url))
+    count = int(root.find("Count").text)
+    pmids = [element.text for element in root.findall("IdList/Id")]
+    if len(pmids) >= count:
+        return pmids
+    webenv = root.find("WebEnv").text
+    querykey = root.find("QueryKey").text
+    downloader.SESSIONS[webenv] = "{}|{}".format(
+        urllib.parse.unquote(query_string), count
+    )
+    while len(pmids) < count:
+        url = "{}/efetch.fcgi?db=pubmed&rettype=uilist&retmode=text&retstart={}&retmax={}&tool={}&email={}&WebEnv={}&query_key={}".format(
+            downloader.EUTILS_URL,
+            len(pmids),
+            MAX_IDS_PER_SEARCH,
+            downloader.TOOL,
+            downloader.EMAIL,
+            webenv,
+            querykey,
+        )
+        logging.debug("URL: {}".format(url))
+        ids = downloader.fetch_url(url).decode("ascii").split()
+        if not ids:
+            logging.warning(
+                "Only {} of {} PMIDs returned for {}".format(
+                    len(pmids), count, urllib.parse.unquote(query_string)
+                )
+            )
+            break
+        pmids.extend(ids)
+    return pmids
+
+
+def create_url_for_efetch_by_ids(ids: List[str]) -> str:
+    """
+    Create the URL for efetch of the records with the given PMIDs.
+    """
+    return "{}/efetch.fcgi?db=pubmed&retmode=xml&rettype=abstract&id={}&tool={}&email={}".format(
+        downloader.EUTILS_URL, ",".join(ids), downloader.TOOL, downloader.EMAIL
+    )
+
+
+def retrieve_records_for_ids(ids: List[str]) -> list:
+    """
+    Get the records for a batch of PMIDs.
+    """
+    url = create_url_for_efetch_by_ids(ids)
+    logging.debug("URL: {}".format(url))
+    xml = downloader.fetch_url(url)
+    with METRICS.time("parse"):
+        root = ET.fromstring(xml)
+    return root.findall("PubmedArticle")
+
+
+def search_all(searches: List[Search], workers: int = 1) -> List[List[str]]:
+    """
+    Run the esearch for each search, up to `workers` at once, and return
+    their PMIDs in the order of the searches.
+    """
+
+    def run(search: Search) -> List[str]:
+        query_string = downloader.prepare_query_string(*search)
+        pmids = search_pmids(query_string)
+        logging.info("Found {} publications for {}".format(len(pmids), search.author))
+        return pmids
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, searches))
+
+
+def unique_pmids(results: List[List[str]]) -> List[str]:
+    """
+    The union of the PMIDs of all searches, each once, in order of first appearance.
+    """
+    return list(dict.fromkeys(pmid for pmids in results for pmid in pmids))
+
+
+def download_records_for_ids(
+    pmids: List[str],
+    output: str,
+    workers: int = 1,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    Stream the records of the PMIDs into a PubmedArticleSet in the output
+    file, batch_size ids per efetch request, and return the number of
+    records written. The output is gzip compressed if its name ends in .gz.
+    """
+    compress = output.endswith(".gz")
+    batches = [pmids[i : i + batch_size] for i in range(0, len(pmids), batch_size)]
+    written = 0
+    with open(downloader.partial_file_name(output), "wb") as f:
+        f.write(downloader.encode_chunk("<PubmedArticleSet>", compress))
+        for _, batch in downloader.download_batches(
+            lambda i: retrieve_records_for_ids(batches[i]),
+            range(len(batches)),
+            workers,
+        ):
+            with METRICS.time("tostring"):
+                text = "".join(
+                    ET.tostring(record, encoding="unicode") for record in batch
+                )
+            with METRICS.time("write"):
+                f.write(downloader.encode_chunk(text, compress))
+            METRICS.count("records", len(batch))
+            written += len(batch)
+            logging.debug("Written {} records".format(written))
+        f.write(downloader.encode_chunk("</PubmedArticleSet>", compress))
+    os.replace(downloader.partial_file_name(output), output)
+    return written
+
+
+def write_mapping(
+    file_name: str, searches: List[Search], results: List[List[str]], count: int
+) -> None:
+    """
+    Write the PMIDs found by each search as JSON.
+    """
+    mapping = {
+        "searches": [
+            {
+                **search._asdict(),
+                "query": urllib.parse.unquote(downloader.prepare_query_string(*search)),
+                "pmids": pmids,
+            }
+            for search, pmids in zip(searches, results)
+        ],
+        "count": count,
+    }
+    with open(file_name, "w") as f:
+        json.dump(mapping, f, indent=2)
+        f.write("\n")
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed Batch Extractor")
+    parser.add_argument(
+        "--output",
+        "-o",
+        default="./data/batch.xml",
+        help="Output file for the records (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--mapping",
+        "-m",
+        help="JSON file for the PMIDs of each search (default: <output>.queries.json)",
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=1,
+        help="Number of requests to make at once (default: 1)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        "-b",
+        type=int,
+        default=BATCH_SIZE,
+        help="Number of PMIDs per efetch request, at most {} (default: %(default)s)".format(
+            MAX_BATCH_SIZE
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=os.environ.get("PUBMED_CACHE_DIR"),
+        help="Cache responses in this directory (default: $PUBMED_CACHE_DIR)",
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write per-stage timings, counters and latencies to this JSON file",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument(
+        "queries", help="Tab-separated file of author, start year and end year"
+    )
+    args = parser.parse_args(args)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if not 1 <= args.batch_size <= MAX_BATCH_SIZE:
+        parser.error("--batch-size must be between 1 and {}".format(MAX_BATCH_SIZE))
+    if not args.mapping:
+        args.mapping = args.output + ".queries.json"
+    return args
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    if os.path.exists(args.output):
+        logging.error("Output file already exists: {}".format(args.output))
+        sys.exit(1)
+    try:
+        searches = read_searches(args.queries)
+    except (OSError, ValueError) as error:
+        logging.error(error)
+        sys.exit(1)
+    if args.cache_dir:
+        downloader.CACHE = ResponseCache(args.cache_dir)
+    if args.metrics:
+        METRICS.enable()
+
+    results = search_all(searches, args.workers)
+    pmids = unique_pmids(results)
+    logging.info(
+        "{} searches found {} papers, {} of them distinct".format(
+            len(searches), sum(len(result) for result in results), len(pmids)
+        )
+    )
+    count = download_records_for_ids(
+        pmids, args.output, workers=args.workers, batch_size=args.batch_size
+    )
+    write_mapping(args.mapping, searches, results, count)
+    logging.info("Downloaded {} records to {}".format(count, args.output))
+    logging.info("Search mapping written to {}".format(args.mapping))
+    if downloader.CACHE is not None:
+        downloader.CACHE.report()
+    if args.metrics:
+        METRICS.write(args.metrics)
+        logging.info("Metrics written to {}".format(args.metrics))
+
+
+if __name__ == "__main__":
+    main()
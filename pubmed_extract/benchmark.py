@@ -0,0 +1,407 @@
+"""
+Benchmark parsing, downloading and converting on synthetic corpora.
+
+For each corpus size, a synthetic XML file is generated (see synthetic.py)
+and cached in the corpus directory, then each benchmark is run in a fresh
+process so that its peak memory is measured on its own:
+
+    extract      extract_data_from_file, loading the whole file
+    stream       extract_data_from_file with stream=True
+    retrieve     retrieve_paper alone, on an already parsed tree
+    download     iterate_batches_of_records against a local stub server
+    celsius      number_stripper's table extraction and Celsius conversion
+
+Records per second and peak resident memory are appended to a JSON lines
+results file, tagged with the git commit, and compared with the most
+recent results from a different commit to show regressions.
+
+`usage: benchmark.py [-h] [--sizes SIZES [SIZES ...]] [--benchmarks ...]
+                    [--corpus-dir CORPUS_DIR] [--results RESULTS]
+                    [--tolerance TOLERANCE] [--no-save]`
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import gzip
+import http.server
+import importlib.util
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import urllib.parse
+
+import main as downloader
+from parse_xml import (
+    extract_data_from_file,
+    iterate_article_offsets,
+    load_xml_file,
+    retrieve_paper,
+)
+from synthetic import SEED, generate_corpus
+
+CORPUS_DIR = os.path.join("data", "synthetic")
+RESULTS_FILE = "benchmark_results.jsonl"
+NUMBER_STRIPPER_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "number_stripper"
+)
+DOWNLOAD_BATCH_SIZE = 500
+DOWNLOAD_WORKERS = 4
+# slower than this fraction of the previous result counts as a regression
+TOLERANCE = 0.1
+
+
+def corpus_file_name(corpus_dir: str, size: int, seed: int = SEED) -> str:
+    return os.path.join(corpus_dir, "synthetic-{}-{}.xml".format(size, seed))
+
+
+def ensure_corpus(corpus_dir: str, size: int, seed: int = SEED) -> str:
+    """
+    Return the synthetic corpus of a size, generating it if it is not cached.
+    """
+    file_name = corpus_file_name(corpus_dir, size, seed)
+    if not os.path.exists(file_name):
+        os.makedirs(corpus_dir, exist_ok=True)
+        logging.info("Generating {} articles in {}".format(size, file_name))
+        # generate then rename, so an interrupted run leaves no partial corpus
+        generate_corpus(file_name + ".tmp", size, seed)
+        os.replace(file_name + ".tmp", file_name)
+    return file_name
+
+
+def peak_memory_mb() -> float:
+    """
+    Peak resident memory of this process in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def load_number_stripper(module: str):
+    """
+    Import a module of number_stripper by path, as its names clash with this package.
+    """
+    spec = importlib.util.spec_from_file_location(
+        "number_stripper_" + module, os.path.join(NUMBER_STRIPPER_DIR, module + ".py")
+    )
+    loaded = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(loaded)
+    return loaded
+
+
+def bench_extract(corpus: str, size: int, url: str) -> int:
+    return sum(1 for _ in extract_data_from_file(corpus))
+
+
+def bench_stream(corpus: str, size: int, url: str) -> int:
+    return sum(1 for _ in extract_data_from_file(corpus, stream=True))
+
+
+def bench_retrieve(corpus: str, size: int, url: str) -> Tuple[int, float]:
+    # the tree is parsed before the clock starts, so only retrieve_paper is timed
+    articles = load_xml_file(corpus).findall("PubmedArticle")
+    start = time.perf_counter()
+    for article in articles:
+        retrieve_paper(article)
+    return len(articles), time.perf_counter() - start
+
+
+def bench_download(corpus: str, size: int, url: str) -> int:
+    downloader.EUTILS_URL = url
+    # the stub server has no rate limit, so neither does the client
+    downloader.RATE_LIMITER = downloader.TokenBucket(1e9, 1e9)
+    query = urllib.parse.quote("synthetic")
+    return sum(
+        len(batch)
+        for _, batch in downloader.iterate_batches_of_records(
+            query, workers=DOWNLOAD_WORKERS, batch_size=DOWNLOAD_BATCH_SIZE
+        )
+    )
+
+
+def bench_celsius(corpus: str, size: int, url: str) -> int:
+    stripper = load_number_stripper("main")
+    teas = load_number_stripper("tmp_tmp")
+    # one line per record, in the format of number_stripper/data.txt
+    text = "\n".join(
+        "Tea {}: {} to {} degrees".format(i, 150 + i % 60, 160 + i % 60)
+        for i in range(size)
+    )
+    lines = text.splitlines()
+    stripper.extract_headers_and_values_into_table(lines)
+    teas.create_dict_of_teas_and_temperature(text)
+    return 2 * size
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "extract": bench_extract,
+    "stream": bench_stream,
+    "retrieve": bench_retrieve,
+    "download": bench_download,
+    "celsius": bench_celsius,
+}
+
+
+def run_benchmark(
+    name: str, corpus: str, size: int, url: str
+) -> Tuple[int, float, float]:
+    """
+    Run one benchmark and return (records, seconds, peak memory in MB).
+    Benchmarks that time themselves return (records, seconds).
+    """
+    logging.basicConfig(level=logging.WARNING)
+    start = time.perf_counter()
+    result = BENCHMARKS[name](corpus, size, url)
+    seconds = time.perf_counter() - start
+    if isinstance(result, tuple):
+        result, seconds = result
+    return result, seconds, peak_memory_mb()
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Minimal E-utilities server: esearch returns a history session for the
+    whole corpus, and efetch pages through it with retstart and retmax,
+    serving the raw bytes of each article from the memory-mapped corpus.
+    """
+
+    protocol_version = "HTTP/1.1"
+    data: mmap.mmap = None
+    offsets: List[Tuple[int, int]] = []
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        parts = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parts.query))
+        if parts.path.endswith("esearch.fcgi"):
+            body = (
+                "<eSearchResult><Count>{}</Count><QueryKey>1</QueryKey>"
+                "<WebEnv>SYNTHETIC</WebEnv></eSearchResult>".format(len(self.offsets))
+            ).encode()
+        elif parts.path.endswith("efetch.fcgi"):
+            start = int(query.get("retstart", 0))
+            end = start + int(query.get("retmax", 20))
+            body = b"".join(
+                [b'<?xml version="1.0" ?>\n<PubmedArticleSet>\n']
+                + [
+                    self.data[offset : offset + length]
+                    for offset, length in self.offsets[start:end]
+                ]
+                + [b"</PubmedArticleSet>\n"]
+            )
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub_server(corpus: str) -> http.server.ThreadingHTTPServer:
+    """
+    Serve a corpus from a stub E-utilities server on a free local port.
+    """
+    with open(corpus, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    handler = type(
+        "CorpusHandler",
+        (StubHandler,),
+        {"data": data, "offsets": list(iterate_article_offsets(corpus))},
+    )
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def git_commit() -> str:
+    """
+    The current commit, marked as dirty when there are uncommitted changes.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def read_results(results_file: str) -> List[dict]:
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_results(results_file: str, results: List[dict]) -> None:
+    with open(results_file, "a") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+
+def find_baseline(previous: List[dict], result: dict) -> Optional[dict]:
+    """
+    The most recent earlier result of the same benchmark and size from another commit.
+    """
+    for candidate in reversed(previous):
+        if (
+            candidate["benchmark"] == result["benchmark"]
+            and candidate["size"] == result["size"]
+            and candidate["commit"] != result["commit"]
+        ):
+            return candidate
+    return None
+
+
+def convert_to_markdown(
+    results: List[dict], previous: List[dict], tolerance: float
+) -> str:
+    """
+    Convert the results to a Markdown table, with the change in records per
+    second from the baseline commit.
+    """
+    headings = ["Benchmark", "Size", "Records/s", "Peak MB", "Baseline", "Change"]
+    output = "| " + " | ".join(headings) + " |\n"
+    output += "| " + " | ".join(["---"] * len(headings)) + " |\n"
+    for result in results:
+        baseline = find_baseline(previous, result)
+        change = ""
+        if baseline:
+            ratio = result["records_per_second"] / baseline["records_per_second"] - 1
+            change = "{:+.1%}".format(ratio)
+            if ratio < -tolerance:
+                change += " (regression)"
+        output += "| {} | {} | {:,.0f} | {:.0f} | {} | {} |\n".format(
+            result["benchmark"],
+            result["size"],
+            result["records_per_second"],
+            result["peak_memory_mb"],
+            baseline["commit"] if baseline else "",
+            change,
+        )
+    return output
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed Extract Benchmarks")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10000],
+        help="Numbers of articles in the synthetic corpora, e.g. 10000 100000 1000000",
+    )
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="Benchmarks to run (default: all)",
+    )
+    parser.add_argument(
+        "--corpus-dir",
+        default=CORPUS_DIR,
+        help="Directory the synthetic corpora are cached in (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--results",
+        default=RESULTS_FILE,
+        help="JSON lines file the results are appended to (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="Slowdown flagged as a regression (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-save", action="store_true", help="Do not append to the results file"
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    args = parser.parse_args(args)
+    if min(args.sizes) < 1:
+        parser.error("--sizes must be at least 1")
+    return args
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    commit = git_commit()
+    previous = read_results(args.results)
+    results = []
+    # spawn, so each benchmark starts from a clean process and its own peak memory
+    context = multiprocessing.get_context("spawn")
+    for size in args.sizes:
+        corpus = ensure_corpus(args.corpus_dir, size)
+        server = start_stub_server(corpus) if "download" in args.benchmarks else None
+        url = "http://127.0.0.1:{}".format(server.server_port) if server else ""
+        try:
+            for name in args.benchmarks:
+                with ProcessPoolExecutor(1, mp_context=context) as executor:
+                    records, seconds, peak = executor.submit(
+                        run_benchmark, name, corpus, size, url
+                    ).result()
+                logging.info(
+                    "{} on {} articles: {} records in {:.2f}s".format(
+                        name, size, records, seconds
+                    )
+                )
+                results.append(
+                    {
+                        "commit": commit,
+                        "timestamp": datetime.datetime.now().isoformat(
+                            timespec="seconds"
+                        ),
+                        "python": platform.python_version(),
+                        "benchmark": name,
+                        "size": size,
+                        "records": records,
+                        "seconds": round(seconds, 4),
+                        "records_per_second": round(records / seconds, 1),
+                        "peak_memory_mb": round(peak, 1),
+                    }
+                )
+        finally:
+            if server:
+                server.shutdown()
+    if not args.no_save:
+        save_results(args.results, results)
+    print(convert_to_markdown(results, previous, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
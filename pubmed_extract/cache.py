@@ -0,0 +1,157 @@
+"""
+On-disk cache for E-utilities responses.
+
+Each response is stored in a file named by the SHA-256 of its cache key.
+Entries expire after a time-to-live, measured from the file's modification
+time, and the cache is kept under a size limit by evicting the least
+recently used entries, tracked through the file's access time.
+
+In offline mode every cached entry is served regardless of age, and a
+request that is not in the cache fails instead of going to the network.
+
+The cache is shared by the download worker threads: writes, eviction and
+the counters are serialized by a lock, while reads run concurrently.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+
+class OfflineCacheMiss(LookupError):
+    """
+    Raised in offline mode when a response is not in the cache.
+    """
+
+
+class ResponseCache:
+    """
+    Content-addressed response cache with TTL expiry and size-bounded LRU eviction.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        ttl: float = DEFAULT_TTL,
+        max_size: int = DEFAULT_MAX_SIZE,
+        offline: bool = False,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self.entries())
+
+    def entries(self) -> list:
+        """
+        List the paths of all the entries in the cache.
+        """
+        paths = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                paths.extend(
+                    sub.path
+                    for sub in os.scandir(entry.path)
+                    if sub.is_file() and not sub.name.endswith(".tmp")
+                )
+        return paths
+
+    def path(self, key: str) -> str:
+        """
+        Path of the file holding the entry for a key.
+        """
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key: str, ttl: float = None) -> Optional[bytes]:
+        """
+        Return the cached response for a key, or None if it is missing or
+        older than the time-to-live. Raise OfflineCacheMiss when offline.
+        """
+        path = self.path(key)
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            modified = os.path.getmtime(path)
+            if not self.offline and time.time() - modified > ttl:
+                raise FileNotFoundError(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            # record the access for LRU eviction, keeping the age intact
+            os.utime(path, (time.time(), modified))
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            if self.offline:
+                raise OfflineCacheMiss(key)
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Store the response for a key, then evict entries if over the size limit.
+        """
+        path = self.path(key)
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                self.size -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            # write then rename, so a reader never sees a partial entry
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            self.size += len(data)
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self) -> None:
+        """
+        Delete the least recently used entries until the cache is back to
+        90% of its size limit, so eviction does not run on every put.
+        Called with the lock held. Entries removed by another process in
+        the meantime are skipped.
+        """
+        entries = []
+        for path in self.entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        entries.sort()
+        target = self.max_size * 0.9
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            else:
+                self.evictions += 1
+            self.size -= size
+
+    def report(self) -> None:
+        """
+        Log the hit, miss and eviction counters.
+        """
+        logging.info(
+            "Cache: {} hits, {} misses, {} evictions, {} bytes in {}".format(
+                self.hits, self.misses, self.evictions, self.size, self.directory
+            )
+        )
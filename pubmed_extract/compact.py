@@ -0,0 +1,160 @@
+"""
+Compact in-memory representation of parsed papers.
+
+Every class uses __slots__, and repeated values are stored once: an
+Interner hands back the same Author object for every occurrence of an
+author, and the same string object for every occurrence of a journal,
+MeSH term or cited reference. The full XML of each paper is not held in
+memory; it is read back on demand from the record's byte offset in its file.
+
+CompactPaper has the same attributes as Paper, so it can be used wherever
+a Paper is read.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+import xml.etree.ElementTree as ET
+
+from parse_xml import Author, Paper, iterate_article_offsets, retrieve_paper
+
+
+@dataclass(frozen=True, slots=True)
+class CompactAuthor:
+    name: str
+    affiliation: str
+
+
+@dataclass(frozen=True, slots=True)
+class CompactReference:
+    citation: str
+    pmid: str
+
+
+@dataclass(slots=True)
+class CompactPaper:
+    title: str
+    journal: str
+    journal_abbreviation: str
+    year: str
+    month: str
+    day: str
+    pub_date: str
+    page_numbers: str
+    doi: str
+    pmc_id: str
+    authors: Tuple[CompactAuthor, ...]
+    abstract: str
+    mesh_terms: Tuple[str, ...]
+    references: Tuple[CompactReference, ...]
+    file_name: str
+    offset: int
+    length: int
+
+    @property
+    def quick_summary(self) -> str:
+        """
+        The ID, date, title and journal of the paper, built when asked for.
+        """
+        return f"{self.pmc_id} - {self.pub_date} - {self.title} - {self.journal_abbreviation}"
+
+    @property
+    def full_xml(self) -> bytes:
+        """
+        The XML of the paper, read from its offset in the file it came from.
+        """
+        with open(self.file_name, "rb") as f:
+            f.seek(self.offset)
+            return f.read(self.length)
+
+
+class Interner:
+    """
+    Keeps one copy of each repeated string, author and reference.
+    """
+
+    def __init__(self):
+        self.strings: Dict[str, str] = {}
+        self.authors: Dict[Tuple[str, str], CompactAuthor] = {}
+        self.references: Dict[Tuple[str, str], CompactReference] = {}
+
+    def string(self, value: Optional[str]) -> Optional[str]:
+        """
+        Return the stored copy of a string, storing it if it is new.
+        """
+        if value is None:
+            return None
+        return self.strings.setdefault(value, value)
+
+    def author(self, author: Author) -> CompactAuthor:
+        """
+        Return the stored copy of an author, storing it if it is new.
+        """
+        key = (author.name, author.affiliation)
+        compact = self.authors.get(key)
+        if compact is None:
+            compact = CompactAuthor(
+                self.string(author.name), self.string(author.affiliation)
+            )
+            self.authors[key] = compact
+        return compact
+
+    def reference(self, citation: str, pmid: str) -> CompactReference:
+        """
+        Return the stored copy of a reference, storing it if it is new.
+        """
+        key = (citation, pmid)
+        compact = self.references.get(key)
+        if compact is None:
+            compact = CompactReference(self.string(citation), self.string(pmid))
+            self.references[key] = compact
+        return compact
+
+
+def compact_paper(
+    paper: Paper, file_name: str, offset: int, length: int, interner: Interner
+) -> CompactPaper:
+    """
+    Create the compact form of a paper whose XML is at offset in file_name.
+    """
+    return CompactPaper(
+        paper.title,
+        interner.string(paper.journal),
+        interner.string(paper.journal_abbreviation),
+        interner.string(paper.year),
+        interner.string(paper.month),
+        interner.string(paper.day),
+        interner.string(paper.pub_date),
+        paper.page_numbers,
+        paper.doi,
+        paper.pmc_id,
+        tuple(interner.author(author) for author in paper.authors),
+        paper.abstract,
+        tuple(interner.string(term) for term in paper.mesh_terms),
+        tuple(
+            interner.reference(reference.citation, reference.pmid)
+            for reference in paper.references
+        ),
+        interner.string(file_name),
+        offset,
+        length,
+    )
+
+
+def extract_compact_data_from_files(
+    list_of_files: List[str], interner: Interner = None
+) -> Iterator[CompactPaper]:
+    """
+    Parse each record in the files into a CompactPaper, sharing one
+    interner across all of them so repeated values are stored once.
+    As the full XML is read back by byte offset, the files must not be
+    compressed (see iterate_article_offsets).
+    """
+    interner = interner or Interner()
+    for file_name in list_of_files:
+        with open(file_name, "rb") as f:
+            for offset, length in iterate_article_offsets(file_name):
+                f.seek(offset)
+                paper_element = ET.fromstring(f.read(length))
+                yield compact_paper(
+                    retrieve_paper(paper_element), file_name, offset, length, interner
+                )
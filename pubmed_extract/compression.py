@@ -0,0 +1,140 @@
+"""
+Compressed XML files and compressed XML records.
+
+open_xml_file opens a downloaded XML file for reading, decompressing
+.xml.gz files with gzip and .xml.zst files with the optional zstandard
+package, so the parsers read compressed and plain files alike.
+
+XmlCodec compresses single records, such as the full_xml stored for each
+paper in the database. One PubMed record is too small to compress well on
+its own, as most of it is tags and attribute values the compressor sees
+for the first time, so each record is compressed against a shared
+dictionary of the text common to all records. The dictionary is trained
+on a sample of records: with zstandard's dictionary trainer if it is
+installed, otherwise by picking the tags and lines repeated across the
+sample records, used as a zlib preset dictionary.
+"""
+
+from collections import Counter
+import gzip
+import re
+from typing import BinaryIO, List, Optional
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB, ZSTD = "zlib", "zstd"
+COMPRESSED_EXTENSIONS = (".gz", ".zst")
+# zlib can only refer back 32KB, so a larger preset dictionary is wasted
+ZLIB_DICTIONARY_SIZE = 32 * 1024
+ZSTD_DICTIONARY_SIZE = 64 * 1024
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+# the text a zlib dictionary is built from: a tag with the whitespace before it, or a line
+DICTIONARY_FRAGMENT_PATTERN = re.compile(rb"\s*<[^>]*>|[^\n]+\n")
+
+
+def is_compressed(file_name: str) -> bool:
+    return file_name.endswith(COMPRESSED_EXTENSIONS)
+
+
+def open_xml_file(file_name: str) -> BinaryIO:
+    """
+    Open an XML file for reading in binary mode, decompressing it on the
+    fly if its name ends in .gz or .zst.
+    """
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, "rb")
+    if file_name.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(
+                "The zstandard package is needed to read {}".format(file_name)
+            )
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(file_name, "rb"), read_across_frames=True, closefd=True
+        )
+    return open(file_name, "rb")
+
+
+def train_zlib_dictionary(
+    samples: List[bytes], size: int = ZLIB_DICTIONARY_SIZE
+) -> bytes:
+    """
+    Build a zlib preset dictionary from the fragments (tags and lines) that
+    occur in at least two samples, choosing those that save the most bytes
+    across the samples. The most valuable fragments are placed at the end,
+    where they are cheapest for zlib to refer to.
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(DICTIONARY_FRAGMENT_PATTERN.findall(sample)))
+    candidates = sorted(
+        (
+            (count * len(fragment), fragment)
+            for fragment, count in counts.items()
+            if count > 1
+        ),
+        reverse=True,
+    )
+    chosen = []
+    total = 0
+    for _, fragment in candidates:
+        if total + len(fragment) > size:
+            continue
+        chosen.append(fragment)
+        total += len(fragment)
+    return b"".join(reversed(chosen))
+
+
+class XmlCodec:
+    """
+    Compresses and decompresses single records against a shared dictionary.
+    dictionary_id is the id the dictionary is stored under, if any.
+    """
+
+    def __init__(self, name: str, dictionary: bytes, dictionary_id: int = None):
+        self.name = name
+        self.dictionary = dictionary
+        self.dictionary_id = dictionary_id
+        if name == ZSTD:
+            if zstandard is None:
+                raise ImportError("The zstandard package is needed for zstd records")
+            data = zstandard.ZstdCompressionDict(dictionary)
+            self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=data)
+            self.decompressor = zstandard.ZstdDecompressor(dict_data=data)
+        elif name != ZLIB:
+            raise ValueError("Unknown codec: {}".format(name))
+
+    @classmethod
+    def train(cls, samples: List[bytes], name: Optional[str] = None) -> "XmlCodec":
+        """
+        Train a dictionary on sample records, with zstd if zstandard is
+        installed and zlib otherwise.
+        """
+        if name is None:
+            name = ZLIB if zstandard is None else ZSTD
+        if name == ZSTD:
+            try:
+                dictionary = zstandard.train_dictionary(
+                    ZSTD_DICTIONARY_SIZE, samples
+                ).as_bytes()
+                return cls(ZSTD, dictionary)
+            except zstandard.ZstdError:
+                # too few or too small samples to train on
+                name = ZLIB
+        return cls(name, train_zlib_dictionary(samples))
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == ZSTD:
+            return self.compressor.compress(data)
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=self.dictionary)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.name == ZSTD:
+            return self.decompressor.decompress(data)
+        decompressor = zlib.decompressobj(zdict=self.dictionary)
+        return decompressor.decompress(data) + decompressor.flush()
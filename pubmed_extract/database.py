@@ -0,0 +1,697 @@
+"""
+Load parsed Pubmed records into the sqlite database in the data folder.
+
+Papers, authors and MeSH terms are stored once each in their own tables,
+with link tables between them (one author can write multiple papers and
+one paper can have multiple authors). References are stored per paper.
+
+Records are written in batches with executemany inside large transactions,
+and the secondary indexes are only built once the bulk load is complete.
+Titles, abstracts and MeSH terms are added to a full-text index (see
+search.py), and the counts of papers per year are updated (see aggregate.py),
+in the same transactions.
+
+Loading is incremental: files whose size, modification time and content
+hash are unchanged since they were last loaded are skipped, and within a
+changed file, papers already stored are skipped unless their XML differs.
+
+The full XML of each paper is stored compressed against a dictionary
+(see compression.py), and read back with read_full_xml. The dictionary is
+trained once at least MIN_DICTIONARY_SAMPLES papers have been seen, so a
+first load of a few records does not fix a poor dictionary for good;
+papers stored before then have no dictionary id and keep their raw XML.
+
+`usage: database.py [-h] [--db DB] [--batch-size BATCH_SIZE] [--workers WORKERS]
+                    [--keep-indexes] [files ...]`
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from compression import XmlCodec
+from parse_xml import (
+    DB,
+    SHARD_SIZE,
+    Paper,
+    extract_data_from_file,
+    extract_data_from_files_in_parallel,
+    find_xml_files,
+)
+import summaries
+from summaries import Summary, apply_summary, summarize
+
+BATCH_SIZE = 10000
+# records the full_xml dictionary is trained on
+DICTIONARY_SAMPLES = 1000
+# fewer records than this are stored uncompressed rather than trained on
+MIN_DICTIONARY_SAMPLES = 200
+
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA mmap_size = 1073741824",
+    "PRAGMA foreign_keys = OFF",
+]
+
+TABLES = [
+    """CREATE TABLE IF NOT EXISTS paper (
+        pmid INTEGER PRIMARY KEY,
+        title TEXT,
+        journal TEXT,
+        journal_abbreviation TEXT,
+        year TEXT,
+        month TEXT,
+        day TEXT,
+        pub_date TEXT,
+        page_numbers TEXT,
+        doi TEXT,
+        abstract TEXT,
+        quick_summary TEXT,
+        full_xml BLOB,
+        xml_hash TEXT,
+        xml_dictionary_id INTEGER REFERENCES xml_dictionary (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS xml_dictionary (
+        id INTEGER PRIMARY KEY,
+        codec TEXT NOT NULL,
+        dictionary BLOB NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS author (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        affiliation TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS author_paper (
+        author_id INTEGER NOT NULL REFERENCES author (id),
+        paper_id INTEGER NOT NULL REFERENCES paper (pmid),
+        position INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS mesh_term (
+        id INTEGER PRIMARY KEY,
+        term TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS paper_mesh_term (
+        paper_id INTEGER NOT NULL REFERENCES paper (pmid),
+        mesh_term_id INTEGER NOT NULL REFERENCES mesh_term (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS paper_reference (
+        paper_id INTEGER NOT NULL REFERENCES paper (pmid),
+        position INTEGER NOT NULL,
+        citation TEXT,
+        pmid TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS ingested_file (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT NOT NULL
+    )""",
+    # full-text index over title, abstract and MeSH terms, rowid is the PMID
+    """CREATE VIRTUAL TABLE IF NOT EXISTS paper_search USING fts5 (
+        title,
+        abstract,
+        mesh_terms,
+        tokenize = 'porter unicode61'
+    )""",
+    *summaries.TABLES,
+]
+
+PAPER_COLUMNS = [
+    "pmid",
+    "title",
+    "journal",
+    "journal_abbreviation",
+    "year",
+    "month",
+    "day",
+    "pub_date",
+    "page_numbers",
+    "doi",
+    "abstract",
+    "quick_summary",
+    "full_xml",
+    "xml_hash",
+    "xml_dictionary_id",
+]
+
+INDEXES = {
+    "author_name_affiliation": "CREATE UNIQUE INDEX IF NOT EXISTS author_name_affiliation ON author (name, affiliation)",
+    "mesh_term_term": "CREATE UNIQUE INDEX IF NOT EXISTS mesh_term_term ON mesh_term (term)",
+    "author_paper_author": "CREATE INDEX IF NOT EXISTS author_paper_author ON author_paper (author_id)",
+    "author_paper_paper": "CREATE INDEX IF NOT EXISTS author_paper_paper ON author_paper (paper_id)",
+    "paper_mesh_term_paper": "CREATE INDEX IF NOT EXISTS paper_mesh_term_paper ON paper_mesh_term (paper_id)",
+    "paper_mesh_term_term": "CREATE INDEX IF NOT EXISTS paper_mesh_term_term ON paper_mesh_term (mesh_term_id)",
+    "paper_reference_paper": "CREATE INDEX IF NOT EXISTS paper_reference_paper ON paper_reference (paper_id)",
+    "paper_reference_pmid": "CREATE INDEX IF NOT EXISTS paper_reference_pmid ON paper_reference (pmid)",
+}
+
+
+# kept during bulk loads, see drop_indexes
+LOAD_INDEXES = {"author_paper_paper", "paper_mesh_term_paper", "paper_reference_paper"}
+# pages of full-text index segments merged after an incremental load
+FTS_MERGE_PAGES = 500
+
+
+def connect_to_database(db_file: str = DB) -> sqlite3.Connection:
+    """
+    Open the database in autocommit mode, so transactions are managed
+    explicitly, and apply the pragmas tuned for bulk loading.
+    """
+    connection = sqlite3.connect(db_file, isolation_level=None)
+    for pragma in PRAGMAS:
+        connection.execute(pragma)
+    return connection
+
+
+def create_tables(connection: sqlite3.Connection) -> None:
+    """
+    Create the tables if they do not exist yet.
+    """
+    for statement in TABLES:
+        connection.execute(statement)
+    # databases created before incremental loading have no xml_hash column
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(paper)")]
+    if "xml_hash" not in columns:
+        connection.execute("ALTER TABLE paper ADD COLUMN xml_hash TEXT")
+    # nor, before compression, an xml_dictionary_id column
+    if "xml_dictionary_id" not in columns:
+        connection.execute(
+            "ALTER TABLE paper ADD COLUMN xml_dictionary_id INTEGER REFERENCES xml_dictionary (id)"
+        )
+
+
+def create_indexes(connection: sqlite3.Connection, bulk_load: bool = True) -> None:
+    """
+    Create the secondary indexes, run after a load is complete.
+
+    After a bulk load the full-text index is merged into one segment and
+    the whole database analyzed. Both cost time in proportion to the whole
+    database, so after an incremental load only a bounded amount of
+    full-text merging is done, and PRAGMA optimize analyzes the tables
+    whose statistics are out of date.
+    """
+    for statement in INDEXES.values():
+        connection.execute(statement)
+    if bulk_load:
+        # merge the full-text index segments written batch by batch
+        connection.execute(
+            "INSERT INTO paper_search (paper_search) VALUES ('optimize')"
+        )
+        connection.execute("ANALYZE")
+    else:
+        connection.execute(
+            "INSERT INTO paper_search (paper_search, rank) VALUES ('merge', ?)",
+            (FTS_MERGE_PAGES,),
+        )
+        connection.execute("PRAGMA optimize")
+
+
+def drop_indexes(connection: sqlite3.Connection) -> None:
+    """
+    Drop the secondary indexes so a bulk load does not maintain them row by
+    row. The paper_id indexes of the link tables are kept, as replacing a
+    revised or duplicate paper deletes its link rows by paper_id.
+    """
+    for name, statement in INDEXES.items():
+        if name in LOAD_INDEXES:
+            connection.execute(statement)
+        else:
+            connection.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def read_author_ids(connection: sqlite3.Connection) -> Dict[Tuple[str, str], int]:
+    """
+    Read the id of every author already in the database, keyed on (name, affiliation).
+    """
+    return {
+        (name, affiliation): author_id
+        for author_id, name, affiliation in connection.execute(
+            "SELECT id, name, affiliation FROM author"
+        )
+    }
+
+
+def read_mesh_term_ids(connection: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Read the id of every MeSH term already in the database.
+    """
+    return {
+        term: term_id
+        for term_id, term in connection.execute("SELECT id, term FROM mesh_term")
+    }
+
+
+def read_xml_codec(
+    connection: sqlite3.Connection, dictionary_id: int = None
+) -> Optional[XmlCodec]:
+    """
+    Read a full_xml dictionary, by default the latest, as a codec.
+    Return None if there is no such dictionary.
+    """
+    if dictionary_id is None:
+        row = connection.execute(
+            "SELECT id, codec, dictionary FROM xml_dictionary ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    else:
+        row = connection.execute(
+            "SELECT id, codec, dictionary FROM xml_dictionary WHERE id = ?",
+            (dictionary_id,),
+        ).fetchone()
+    if row is None:
+        return None
+    dictionary_id, codec, dictionary = row
+    return XmlCodec(codec, dictionary, dictionary_id)
+
+
+def train_xml_codec(
+    connection: sqlite3.Connection, papers: List[Paper]
+) -> Optional[XmlCodec]:
+    """
+    Train a full_xml dictionary on a sample of the papers, and of the papers
+    already stored uncompressed, and store it. Return None, leaving the
+    papers to be stored uncompressed, if there are fewer than
+    MIN_DICTIONARY_SAMPLES of them.
+    """
+    stored = [
+        full_xml
+        for (full_xml,) in connection.execute(
+            "SELECT full_xml FROM paper WHERE xml_dictionary_id IS NULL LIMIT ?",
+            (DICTIONARY_SAMPLES,),
+        )
+    ]
+    candidates = stored + [paper.full_xml for paper in papers]
+    if len(candidates) < MIN_DICTIONARY_SAMPLES:
+        logging.debug(
+            "Storing the full XML uncompressed until {} papers are loaded".format(
+                MIN_DICTIONARY_SAMPLES
+            )
+        )
+        return None
+    step = max(len(candidates) // DICTIONARY_SAMPLES, 1)
+    samples = candidates[::step][:DICTIONARY_SAMPLES]
+    codec = XmlCodec.train(samples)
+    codec.dictionary_id = connection.execute(
+        "INSERT INTO xml_dictionary (codec, dictionary) VALUES (?, ?)",
+        (codec.name, codec.dictionary),
+    ).lastrowid
+    logging.info(
+        "Trained a {} byte {} dictionary for the full XML".format(
+            len(codec.dictionary), codec.name
+        )
+    )
+    return codec
+
+
+def read_full_xml(connection: sqlite3.Connection, pmid: int) -> Optional[bytes]:
+    """
+    Read the full XML of a paper, decompressing it if it was stored compressed.
+    """
+    row = connection.execute(
+        "SELECT full_xml, xml_dictionary_id FROM paper WHERE pmid = ?", (pmid,)
+    ).fetchone()
+    if row is None:
+        return None
+    full_xml, dictionary_id = row
+    if dictionary_id is None:
+        return full_xml
+    return read_xml_codec(connection, dictionary_id).decompress(full_xml)
+
+
+def read_existing_hashes(
+    connection: sqlite3.Connection, pmids: List[int]
+) -> Dict[int, str]:
+    """
+    Return the XML hash of each of the given PMIDs already in the paper table.
+    """
+    existing = {}
+    # stay well below the sqlite limit on the number of bound parameters
+    for i in range(0, len(pmids), 900):
+        chunk = pmids[i : i + 900]
+        placeholders = ",".join("?" * len(chunk))
+        existing.update(
+            connection.execute(
+                f"SELECT pmid, xml_hash FROM paper WHERE pmid IN ({placeholders})",
+                chunk,
+            )
+        )
+    return existing
+
+
+def delete_papers(connection: sqlite3.Connection, pmids: List[int]) -> None:
+    """
+    Delete papers and their link rows, so that revised versions can be inserted.
+    """
+    for i in range(0, len(pmids), 900):
+        chunk = pmids[i : i + 900]
+        placeholders = ",".join("?" * len(chunk))
+        connection.execute(f"DELETE FROM paper WHERE pmid IN ({placeholders})", chunk)
+        connection.execute(
+            f"DELETE FROM paper_search WHERE rowid IN ({placeholders})", chunk
+        )
+        for table in ("author_paper", "paper_mesh_term", "paper_reference"):
+            connection.execute(
+                f"DELETE FROM {table} WHERE paper_id IN ({placeholders})", chunk
+            )
+
+
+def read_summary_of_papers(connection: sqlite3.Connection, pmids: List[int]) -> Summary:
+    """
+    Count the stored papers with the given PMIDs, so that their counts can
+    be taken out of the summary tables before they are replaced.
+    """
+    rows = {}
+    mesh_terms = {}
+    for i in range(0, len(pmids), 900):
+        chunk = pmids[i : i + 900]
+        placeholders = ",".join("?" * len(chunk))
+        for pmid, year, pub_date, journal in connection.execute(
+            f"SELECT pmid, year, pub_date, journal FROM paper WHERE pmid IN ({placeholders})",
+            chunk,
+        ):
+            rows[pmid] = (year, pub_date, journal)
+            mesh_terms[pmid] = []
+        for pmid, term in connection.execute(
+            f"""SELECT paper_mesh_term.paper_id, mesh_term.term FROM paper_mesh_term
+            JOIN mesh_term ON mesh_term.id = paper_mesh_term.mesh_term_id
+            WHERE paper_mesh_term.paper_id IN ({placeholders})""",
+            chunk,
+        ):
+            mesh_terms[pmid].append(term)
+    return summarize((*row, mesh_terms[pmid]) for pmid, row in rows.items())
+
+
+def insert_batch(
+    connection: sqlite3.Connection,
+    papers: List[Paper],
+    author_ids: Dict[Tuple[str, str], int],
+    mesh_term_ids: Dict[str, int],
+    codec: XmlCodec = None,
+) -> int:
+    """
+    Insert a batch of papers, with their authors, MeSH terms and references,
+    in a single transaction. Papers already in the database are skipped,
+    unless their XML has changed, in which case the stored paper is replaced.
+    The full XML is compressed with the codec, if one is given.
+
+    author_ids and mesh_term_ids are updated in place with any new rows.
+    Return the number of papers inserted or replaced.
+    """
+    existing = read_existing_hashes(connection, [int(p.pmc_id) for p in papers])
+    revised = []
+    seen = set()
+    paper_rows = []
+    new_authors = []
+    author_paper_rows = []
+    new_mesh_terms = []
+    paper_mesh_term_rows = []
+    reference_rows = []
+    search_rows = []
+    summary_rows = []
+    for paper in papers:
+        pmid = int(paper.pmc_id)
+        xml_hash = hashlib.sha256(paper.full_xml).hexdigest()
+        # also skips duplicates within the batch
+        if pmid in seen or existing.get(pmid) == xml_hash:
+            continue
+        seen.add(pmid)
+        if pmid in existing:
+            revised.append(pmid)
+        paper_rows.append(
+            (
+                pmid,
+                paper.title,
+                paper.journal,
+                paper.journal_abbreviation,
+                paper.year,
+                paper.month,
+                paper.day,
+                paper.pub_date,
+                paper.page_numbers,
+                paper.doi,
+                paper.abstract,
+                paper.quick_summary,
+                paper.full_xml if codec is None else codec.compress(paper.full_xml),
+                xml_hash,
+                None if codec is None else codec.dictionary_id,
+            )
+        )
+        for position, author in enumerate(paper.authors):
+            key = (author.name or "", author.affiliation or "")
+            author_id = author_ids.get(key)
+            if author_id is None:
+                author_id = len(author_ids) + 1
+                author_ids[key] = author_id
+                new_authors.append((author_id, key[0], key[1]))
+            author_paper_rows.append((author_id, pmid, position))
+        for term in paper.mesh_terms:
+            term_id = mesh_term_ids.get(term)
+            if term_id is None:
+                term_id = len(mesh_term_ids) + 1
+                mesh_term_ids[term] = term_id
+                new_mesh_terms.append((term_id, term))
+            paper_mesh_term_rows.append((pmid, term_id))
+        for position, reference in enumerate(paper.references):
+            reference_rows.append((pmid, position, reference.citation, reference.pmid))
+        search_rows.append(
+            (pmid, paper.title, paper.abstract, "; ".join(paper.mesh_terms))
+        )
+        summary_rows.append(
+            (paper.year, paper.pub_date, paper.journal, paper.mesh_terms)
+        )
+
+    connection.execute("BEGIN")
+    try:
+        apply_summary(connection, read_summary_of_papers(connection, revised), -1)
+        delete_papers(connection, revised)
+        connection.executemany(
+            "INSERT INTO paper ({}) VALUES ({})".format(
+                ", ".join(PAPER_COLUMNS), ", ".join("?" * len(PAPER_COLUMNS))
+            ),
+            paper_rows,
+        )
+        connection.executemany("INSERT INTO author VALUES (?, ?, ?)", new_authors)
+        connection.executemany(
+            "INSERT INTO author_paper VALUES (?, ?, ?)", author_paper_rows
+        )
+        connection.executemany("INSERT INTO mesh_term VALUES (?, ?)", new_mesh_terms)
+        connection.executemany(
+            "INSERT INTO paper_mesh_term VALUES (?, ?)", paper_mesh_term_rows
+        )
+        connection.executemany(
+            "INSERT INTO paper_reference VALUES (?, ?, ?, ?)", reference_rows
+        )
+        connection.executemany(
+            "INSERT INTO paper_search (rowid, title, abstract, mesh_terms) VALUES (?, ?, ?, ?)",
+            search_rows,
+        )
+        apply_summary(connection, summarize(summary_rows))
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        # forget the ids handed out for rows that were never written
+        for author_id, name, affiliation in new_authors:
+            del author_ids[(name, affiliation)]
+        for term_id, term in new_mesh_terms:
+            del mesh_term_ids[term]
+        raise
+    return len(paper_rows)
+
+
+def batched(records: Iterable[Paper], batch_size: int) -> Iterator[List[Paper]]:
+    """
+    Group a stream of records into lists of at most batch_size records.
+    """
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iterate_records(list_of_files: List[str], workers: int = 1) -> Iterator[Paper]:
+    """
+    Yield every record in the given files, streaming each file, or parsing
+    across a pool of worker processes if more than one worker is requested.
+    """
+    if workers > 1:
+        for fn, records in extract_data_from_files_in_parallel(
+            list_of_files, workers, SHARD_SIZE
+        ):
+            yield from records
+        return
+    for fn in list_of_files:
+        logging.info("Processing {}".format(fn))
+        yield from extract_data_from_file(fn, stream=True)
+
+
+def hash_file(file_name: str) -> str:
+    """
+    Compute the SHA-256 of a file's content, reading it in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_changed_files(
+    connection: sqlite3.Connection, list_of_files: List[str]
+) -> List[Tuple[str, int, int, str]]:
+    """
+    Return (path, size, mtime_ns, sha256) for each file that is new or has
+    changed since it was last loaded. A file whose size and modification
+    time are unchanged is not read; one whose content hash is unchanged is
+    skipped, but its new modification time is recorded.
+    """
+    changed = []
+    for fn in list_of_files:
+        path = os.path.abspath(fn)
+        stat = os.stat(path)
+        row = connection.execute(
+            "SELECT size, mtime_ns, sha256 FROM ingested_file WHERE path = ?", (path,)
+        ).fetchone()
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            logging.info("Unchanged, skipping {}".format(fn))
+            continue
+        sha256 = hash_file(path)
+        if row is not None and row[2] == sha256:
+            logging.info("Unchanged content, skipping {}".format(fn))
+            record_ingested_files(
+                connection, [(path, stat.st_size, stat.st_mtime_ns, sha256)]
+            )
+            continue
+        changed.append((path, stat.st_size, stat.st_mtime_ns, sha256))
+    return changed
+
+
+def record_ingested_files(
+    connection: sqlite3.Connection, files: List[Tuple[str, int, int, str]]
+) -> None:
+    """
+    Record the size, modification time and hash of files that have been loaded.
+    """
+    connection.execute("BEGIN")
+    connection.executemany(
+        "INSERT OR REPLACE INTO ingested_file VALUES (?, ?, ?, ?)", files
+    )
+    connection.execute("COMMIT")
+
+
+def load_files(
+    list_of_files: List[str],
+    db_file: str = DB,
+    batch_size: int = BATCH_SIZE,
+    workers: int = 1,
+    defer_indexes: bool = None,
+) -> int:
+    """
+    Load the records in the given files into the database, skipping files
+    and papers that have not changed since they were last loaded.
+
+    By default the indexes are only dropped and rebuilt around the load
+    when the database is empty; later loads keep them, as they are small
+    and need the indexes to replace revised papers.
+    Return the number of papers inserted or replaced.
+    """
+    connection = connect_to_database(db_file)
+    try:
+        create_tables(connection)
+        changed = find_changed_files(connection, list_of_files)
+        if not changed:
+            return 0
+        if defer_indexes is None:
+            defer_indexes = (
+                connection.execute("SELECT 1 FROM paper LIMIT 1").fetchone() is None
+            )
+        if defer_indexes:
+            drop_indexes(connection)
+        author_ids = read_author_ids(connection)
+        mesh_term_ids = read_mesh_term_ids(connection)
+        codec = read_xml_codec(connection)
+        inserted = 0
+        records = iterate_records([path for path, *_ in changed], workers)
+        for batch in batched(records, batch_size):
+            if codec is None:
+                codec = train_xml_codec(connection, batch)
+            inserted += insert_batch(
+                connection, batch, author_ids, mesh_term_ids, codec
+            )
+            logging.debug("Inserted {} papers".format(inserted))
+        create_indexes(connection, bulk_load=defer_indexes)
+        # only recorded once all their records are in, so an interrupted
+        # load picks the files up again and skips the papers already stored
+        record_ingested_files(connection, changed)
+    finally:
+        connection.close()
+    return inserted
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed Database Loader")
+    parser.add_argument("--db", default=DB, help="Database file (default: %(default)s)")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Number of papers written per transaction (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=1,
+        help="Number of worker processes to parse with (default: 1)",
+    )
+    parser.add_argument(
+        "--keep-indexes",
+        action="store_true",
+        default=None,
+        help="Keep the indexes during the load, even into an empty database",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="XML files to load (default: all XML files in the data directory)",
+    )
+    args = parser.parse_args(args)
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    list_of_files = args.files or find_xml_files()
+    inserted = load_files(
+        list_of_files,
+        args.db,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        defer_indexes=False if args.keep_indexes else None,
+    )
+    logging.info("Inserted or updated {} papers in {}".format(inserted, args.db))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Export parsed papers to a columnar file for analytics.
+
+Papers are streamed from extract_data_from_file and written in batches of
+--row-group-size, so memory stays bounded by one batch. Parquet (.parquet)
+and Arrow IPC (.arrow, .feather) files have one column per Paper field,
+with authors and references as lists of structs and MeSH terms as a list
+of strings, so a reader can load just the columns it needs:
+
+    pyarrow.parquet.read_table("papers.parquet", columns=["pmc_id", "mesh_terms"])
+
+Parquet and Arrow need the optional pyarrow package. Without it, or for
+.ndjson/.jsonl outputs, one JSON object per paper is written instead, with
+the same fields, to the output name with an .ndjson extension.
+
+Files are parsed incrementally, so only one batch of papers is held at a
+time; --no-stream loads each file in full instead, which is faster for
+small files. The raw XML of each paper is left out unless --full-xml is
+given.
+
+`usage: export.py [-h] [--output OUTPUT] [--row-group-size ROW_GROUP_SIZE]
+                 [--full-xml] [--no-stream] [--verbose] [files ...]`
+"""
+
+import argparse
+import dataclasses
+import json
+import logging
+import os
+import sys
+from typing import Iterable, Iterator, List
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from metrics import METRICS
+from parse_xml import Paper, extract_data_from_file, find_xml_files
+
+OUTPUT = "./data/papers.parquet"
+ROW_GROUP_SIZE = 10000
+PARQUET, ARROW, NDJSON = "parquet", "arrow", "ndjson"
+FORMATS = {
+    ".parquet": PARQUET,
+    ".arrow": ARROW,
+    ".feather": ARROW,
+    ".ndjson": NDJSON,
+    ".jsonl": NDJSON,
+}
+LIST_FIELDS = {"authors", "mesh_terms", "references"}
+
+
+def arrow_schema(full_xml: bool = False) -> "pyarrow.Schema":
+    """
+    The Arrow schema of the exported papers, in the field order of Paper.
+    """
+    types = {
+        "authors": pyarrow.list_(
+            pyarrow.struct(
+                [("name", pyarrow.string()), ("affiliation", pyarrow.string())]
+            )
+        ),
+        "mesh_terms": pyarrow.list_(pyarrow.string()),
+        "references": pyarrow.list_(
+            pyarrow.struct([("citation", pyarrow.string()), ("pmid", pyarrow.string())])
+        ),
+        "full_xml": pyarrow.binary(),
+    }
+    return pyarrow.schema(
+        [(name, types.get(name, pyarrow.string())) for name in column_names(full_xml)]
+    )
+
+
+def column_names(full_xml: bool = False) -> List[str]:
+    """
+    The exported fields of Paper, in order.
+    """
+    return [
+        field.name
+        for field in dataclasses.fields(Paper)
+        if full_xml or field.name != "full_xml"
+    ]
+
+
+def batches_of_columns(
+    papers: Iterable[Paper], names: List[str], size: int
+) -> Iterator[dict]:
+    """
+    Yield the papers as dicts of column lists, `size` papers at a time.
+    """
+    columns = {name: [] for name in names}
+    count = 0
+    for paper in papers:
+        for name, column in columns.items():
+            value = getattr(paper, name)
+            if name in LIST_FIELDS:
+                # authors and references become lists of plain dicts
+                value = [
+                    item if isinstance(item, str) else dataclasses.asdict(item)
+                    for item in value
+                ]
+            column.append(value)
+        count += 1
+        if count == size:
+            yield columns
+            columns = {name: [] for name in names}
+            count = 0
+    if count:
+        yield columns
+
+
+def write_arrow(
+    papers: Iterable[Paper],
+    output: str,
+    file_format: str,
+    row_group_size: int = ROW_GROUP_SIZE,
+    full_xml: bool = False,
+) -> int:
+    """
+    Write the papers to a Parquet or Arrow IPC file, one row group or
+    record batch per row_group_size papers. Return the number written.
+    """
+    schema = arrow_schema(full_xml)
+    if file_format == PARQUET:
+        writer = pyarrow.parquet.ParquetWriter(output, schema)
+    else:
+        writer = pyarrow.ipc.new_file(output, schema)
+    written = 0
+    with writer:
+        for columns in batches_of_columns(papers, schema.names, row_group_size):
+            with METRICS.time("write"):
+                batch = pyarrow.RecordBatch.from_pydict(columns, schema=schema)
+                writer.write_batch(batch)
+            written += batch.num_rows
+            logging.debug("Written {} papers".format(written))
+    return written
+
+
+def write_ndjson(
+    papers: Iterable[Paper],
+    output: str,
+    row_group_size: int = ROW_GROUP_SIZE,
+    full_xml: bool = False,
+) -> int:
+    """
+    Write the papers to a newline-delimited JSON file, one object per paper.
+    Return the number written.
+    """
+    names = column_names(full_xml)
+    written = 0
+    with open(output, "w", encoding="utf-8") as f:
+        for columns in batches_of_columns(papers, names, row_group_size):
+            with METRICS.time("write"):
+                if full_xml:
+                    columns["full_xml"] = [
+                        xml.decode("utf-8") for xml in columns["full_xml"]
+                    ]
+                rows = zip(*(columns[name] for name in names))
+                f.writelines(
+                    json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n"
+                    for row in rows
+                )
+            written += len(columns[names[0]])
+            logging.debug("Written {} papers".format(written))
+    return written
+
+
+def export_papers(
+    papers: Iterable[Paper],
+    output: str,
+    row_group_size: int = ROW_GROUP_SIZE,
+    full_xml: bool = False,
+) -> str:
+    """
+    Write the papers to the output file, in the format given by its
+    extension, falling back to NDJSON if pyarrow is not installed.
+    Return the name of the file written.
+    """
+    root, extension = os.path.splitext(output)
+    file_format = FORMATS.get(extension.lower())
+    if file_format is None:
+        raise ValueError(
+            "Unknown output format {!r}, expected one of {}".format(
+                extension, ", ".join(FORMATS)
+            )
+        )
+    if file_format != NDJSON and pyarrow is None:
+        output = root + ".ndjson"
+        logging.warning(
+            "pyarrow is not installed, writing NDJSON to {} instead".format(output)
+        )
+        file_format = NDJSON
+    if file_format == NDJSON:
+        count = write_ndjson(papers, output, row_group_size, full_xml)
+    else:
+        count = write_arrow(papers, output, file_format, row_group_size, full_xml)
+    logging.info("Exported {} papers to {}".format(count, output))
+    return output
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed Paper Exporter")
+    parser.add_argument(
+        "--output",
+        "-o",
+        default=OUTPUT,
+        help="Output file, .parquet, .arrow, .feather, .ndjson or .jsonl "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=ROW_GROUP_SIZE,
+        help="Number of papers per row group and write (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--full-xml", action="store_true", help="Include the raw XML of each paper"
+    )
+    parser.add_argument(
+        "--no-stream",
+        dest="stream",
+        action="store_false",
+        help="Load each file in full instead of parsing it incrementally",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="XML files to export (default: all XML files in the data directory)",
+    )
+    args = parser.parse_args(args)
+    if args.row_group_size < 1:
+        parser.error("--row-group-size must be at least 1")
+    if os.path.splitext(args.output)[1].lower() not in FORMATS:
+        parser.error("--output must end in one of {}".format(", ".join(FORMATS)))
+    return args
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    files = args.files or find_xml_files()
+    papers = (
+        paper
+        for file_name in files
+        for paper in extract_data_from_file(file_name, stream=args.stream)
+    )
+    export_papers(papers, args.output, args.row_group_size, args.full_xml)
+
+
+if __name__ == "__main__":
+    main()
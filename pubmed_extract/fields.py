@@ -0,0 +1,110 @@
+"""
+Declarative field specs, compiled into a single-pass XML extractor.
+
+Each field names a path of child tags from the record element, like the
+chains of find() calls it replaces. The paths of all the fields are merged
+when the spec is compiled, so filling a record looks up each element on
+the way to the wanted fields once, in a single descent from the record,
+instead of walking down from the record again for every field. The
+lookups are ElementTree's find() and findall() on single tags, which run
+in C, and every other subtree (e.g. the history lists) is skipped.
+
+Paths follow find() semantics: each step takes the first child with that
+tag. A field with `each` set instead collects every child matching the
+last step, converted by `each`, into a list, like findall(); children the
+conversion returns None for are left out. Fields whose path is not found
+get their default, or an empty list if repeated.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import xml.etree.ElementTree as ET
+
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    path: str
+    default: Any = None
+    each: Optional[Callable[[ET.Element], Any]] = None
+
+
+# the kinds of instruction in a compiled program
+DESCEND, TEXT, EACH = range(3)
+
+
+class CompiledFields:
+    """
+    A list of fields compiled into a flat program of find() and findall()
+    calls. The elements found on the way are held in numbered slots, slot 0
+    being the record, and each instruction reads its parent from a slot:
+
+        (DESCEND, parent, tag, slot, None)     find a child and store it
+        (TEXT, parent, tag, field, None)       read a child's text into a field
+        (EACH, parent, tag, field, convert)    convert every matching child
+
+    Shared path prefixes become a single DESCEND, so each element on the
+    paths is looked up once per record.
+    """
+
+    def __init__(self, fields: List[Field]):
+        self.fields = fields
+        self.names = [field.name for field in fields]
+        self.defaults = [field.default for field in fields]
+        slots: Dict[Tuple[str, ...], int] = {(): 0}
+        self.program: List[Tuple[int, int, str, int, Optional[Callable]]] = []
+        for index, field in enumerate(fields):
+            steps = field.path.split("/")
+            # descend instructions come before any instruction that uses their slot
+            for depth in range(1, len(steps)):
+                prefix = tuple(steps[:depth])
+                if prefix not in slots:
+                    slots[prefix] = len(slots)
+                    self.program.append(
+                        (
+                            DESCEND,
+                            slots[prefix[:-1]],
+                            steps[depth - 1],
+                            slots[prefix],
+                            None,
+                        )
+                    )
+            parent = slots[tuple(steps[:-1])]
+            if field.each is not None:
+                self.program.append((EACH, parent, steps[-1], index, field.each))
+            else:
+                self.program.append((TEXT, parent, steps[-1], index, None))
+        self.slot_count = len(slots)
+
+    def extract(self, element: ET.Element) -> List[Any]:
+        """
+        Return the values of the fields for a record element, in field order.
+        Fields whose path is missing keep their default, and repeated fields
+        whose parent is missing are empty lists.
+        """
+        values = self.defaults.copy()
+        slots = [element] + [None] * (self.slot_count - 1)
+        for kind, parent, tag, target, convert in self.program:
+            parent_element = slots[parent]
+            if kind == EACH:
+                values[target] = (
+                    []
+                    if parent_element is None
+                    else [
+                        value
+                        for value in map(convert, parent_element.findall(tag))
+                        if value is not None
+                    ]
+                )
+            elif parent_element is None:
+                continue
+            elif kind == DESCEND:
+                slots[target] = parent_element.find(tag)
+            else:
+                child = parent_element.find(tag)
+                if child is not None:
+                    values[target] = child.text
+        return values
+
+    def extract_dict(self, element: ET.Element) -> Dict[str, Any]:
+        return dict(zip(self.names, self.extract(element)))
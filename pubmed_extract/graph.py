@@ -0,0 +1,473 @@
+"""
+Citation and co-authorship graphs in compressed sparse row (CSR) form.
+
+Every node gets an integer id. The neighbours of all nodes are stored
+end to end in one typed array, with a second array holding the offset of
+each node's neighbours, so an edge costs four bytes instead of a Python
+object. Each graph keeps its transpose too, for in-degrees and reverse
+lookups (papers citing a paper).
+
+The citation graph links each paper to the PMIDs it references. The
+co-authorship graph links each pair of co-authors, weighted by the number
+of papers they share. As it is undirected, each pair is stored once, from
+the name that sorts first, and an author's co-authors are its neighbours
+in the graph and in its transpose. Papers with more than --max-authors
+authors are left out of it, as a consortium paper with thousands of
+authors would add millions of pairs. Both graphs can be built from parsed
+papers or from the tables written by database.py.
+
+`usage: graph.py [-h] [--verbose] {top-cited,cites,cited-by,hops,coauthors}
+                [--db DB] [--files [FILES ...]] [--max-authors MAX_AUTHORS] ...`
+"""
+
+import argparse
+from array import array
+from collections import Counter
+import heapq
+from itertools import chain, combinations
+import logging
+import sqlite3
+import sys
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from database import connect_to_database, create_tables
+from parse_xml import DB, Paper, extract_data_from_file
+
+# papers with more authors are left out of the co-author graph
+MAX_COAUTHORS = 100
+
+
+class CSRGraph:
+    """
+    Directed graph over nodes 0..node_count-1, with optional edge weights.
+    """
+
+    def __init__(self, offsets: array, targets: array, weights: array = None):
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+
+    @property
+    def node_count(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    @classmethod
+    def from_edges(
+        cls,
+        node_count: int,
+        sources: array,
+        targets: array,
+        weights: array = None,
+        merge: bool = False,
+    ) -> "CSRGraph":
+        """
+        Build the graph from parallel arrays of edge sources, targets and
+        optional weights with a counting sort. With merge=True, repeated edges
+        are merged into one edge whose weight is the sum of their weights
+        (the number of repeats for unweighted edges).
+        """
+        offsets = array("q", bytes(8 * (node_count + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for node in range(node_count):
+            offsets[node + 1] += offsets[node]
+        positions = array("q", offsets[:-1])
+        ordered = array("I", bytes(4 * len(targets)))
+        ordered_weights = (
+            None if weights is None else array("I", bytes(4 * len(targets)))
+        )
+        for edge, (source, target) in enumerate(zip(sources, targets)):
+            ordered[positions[source]] = target
+            if weights is not None:
+                ordered_weights[positions[source]] = weights[edge]
+            positions[source] += 1
+        graph = cls(offsets, ordered, ordered_weights)
+        return graph.merged() if merge else graph
+
+    def merged(self) -> "CSRGraph":
+        """
+        Return a copy with repeated edges merged, their weights summed,
+        and each node's neighbours sorted.
+        """
+        offsets = array("q", [0])
+        targets = array("I")
+        weights = array("I")
+        for node in range(self.node_count):
+            counts = Counter()
+            if self.weights is None:
+                counts.update(self.neighbors(node))
+            else:
+                for target, weight in zip(
+                    self.neighbors(node), self.edge_weights(node)
+                ):
+                    counts[target] += weight
+            for target in sorted(counts):
+                targets.append(target)
+                weights.append(counts[target])
+            offsets.append(len(targets))
+        return CSRGraph(offsets, targets, weights)
+
+    def transpose(self) -> "CSRGraph":
+        """
+        Return the graph with every edge reversed.
+        """
+        sources = array("I", bytes(4 * self.edge_count))
+        for node in range(self.node_count):
+            for position in range(self.offsets[node], self.offsets[node + 1]):
+                sources[position] = node
+        return CSRGraph.from_edges(self.node_count, self.targets, sources, self.weights)
+
+    def neighbors(self, node: int) -> array:
+        """
+        The targets of the edges out of a node.
+        """
+        return self.targets[self.offsets[node] : self.offsets[node + 1]]
+
+    def edge_weights(self, node: int) -> array:
+        """
+        The weights of the edges out of a node, in the order of neighbors().
+        """
+        return self.weights[self.offsets[node] : self.offsets[node + 1]]
+
+    def degree(self, node: int) -> int:
+        """
+        The number of edges out of a node.
+        """
+        return self.offsets[node + 1] - self.offsets[node]
+
+    def degrees(self) -> array:
+        """
+        The number of edges out of every node.
+        """
+        return array(
+            "I", (self.offsets[n + 1] - self.offsets[n] for n in range(self.node_count))
+        )
+
+    def k_hop(self, node: int, k: int) -> List[int]:
+        """
+        The nodes reachable from a node in at most k hops, excluding the node itself.
+        """
+        visited = bytearray(self.node_count)
+        visited[node] = 1
+        frontier = [node]
+        reached = []
+        for _ in range(k):
+            next_frontier = []
+            for current in frontier:
+                for target in self.neighbors(current):
+                    if not visited[target]:
+                        visited[target] = 1
+                        next_frontier.append(target)
+            reached.extend(next_frontier)
+            frontier = next_frontier
+            if not frontier:
+                break
+        return reached
+
+
+class LabelledGraph:
+    """
+    A CSRGraph and its transpose, with a label (PMID or author name) for each node id.
+    """
+
+    def __init__(
+        self,
+        labels: List[Hashable],
+        forward: CSRGraph,
+        ids: Dict[Hashable, int] = None,
+    ):
+        self.labels = labels
+        if ids is None:
+            ids = {label: node for node, label in enumerate(labels)}
+        self.ids = ids
+        self.forward = forward
+        self.reverse = forward.transpose()
+
+    def node(self, label: Hashable) -> Optional[int]:
+        return self.ids.get(label)
+
+    def out_neighbors(self, label: Hashable) -> List[Hashable]:
+        node = self.ids.get(label)
+        if node is None:
+            return []
+        return [self.labels[target] for target in self.forward.neighbors(node)]
+
+    def in_neighbors(self, label: Hashable) -> List[Hashable]:
+        node = self.ids.get(label)
+        if node is None:
+            return []
+        return [self.labels[source] for source in self.reverse.neighbors(node)]
+
+    def out_degree(self, label: Hashable) -> int:
+        node = self.ids.get(label)
+        return 0 if node is None else self.forward.degree(node)
+
+    def in_degree(self, label: Hashable) -> int:
+        node = self.ids.get(label)
+        return 0 if node is None else self.reverse.degree(node)
+
+    def k_hop(self, label: Hashable, k: int) -> List[Hashable]:
+        node = self.ids.get(label)
+        if node is None:
+            return []
+        return [self.labels[target] for target in self.forward.k_hop(node, k)]
+
+    def undirected_neighbors(self, label: Hashable) -> List[Tuple[Hashable, int]]:
+        """
+        The neighbours of a node along edges in either direction, with the
+        edge weights, for undirected graphs that store each edge once.
+        """
+        node = self.ids.get(label)
+        if node is None:
+            return []
+        edges = chain(
+            zip(self.forward.neighbors(node), self.forward.edge_weights(node)),
+            zip(self.reverse.neighbors(node), self.reverse.edge_weights(node)),
+        )
+        return [(self.labels[target], weight) for target, weight in edges]
+
+    def top_in_degree(self, n: int) -> List[Tuple[Hashable, int]]:
+        """
+        The n nodes with the most incoming edges, e.g. the most cited papers.
+        Ties are broken by label.
+        """
+        degrees = self.reverse.degrees()
+        top = heapq.nsmallest(
+            n, range(len(degrees)), key=lambda node: (-degrees[node], self.labels[node])
+        )
+        return [(self.labels[node], degrees[node]) for node in top]
+
+
+class GraphBuilder:
+    """
+    Collects edges between labelled nodes, assigning integer ids as new labels appear.
+    """
+
+    def __init__(self):
+        self.ids: Dict[Hashable, int] = {}
+        self.labels: List[Hashable] = []
+        self.sources = array("I")
+        self.targets = array("I")
+
+    def node(self, label: Hashable) -> int:
+        node = self.ids.get(label)
+        if node is None:
+            node = len(self.labels)
+            self.ids[label] = node
+            self.labels.append(label)
+        return node
+
+    def add_edge(self, source: Hashable, target: Hashable) -> None:
+        self.sources.append(self.node(source))
+        self.targets.append(self.node(target))
+
+    def build(self, merge: bool = False) -> LabelledGraph:
+        forward = CSRGraph.from_edges(
+            len(self.labels), self.sources, self.targets, merge=merge
+        )
+        # the edge lists are no longer needed once the CSR arrays are built
+        self.sources = self.targets = None
+        return LabelledGraph(self.labels, forward, self.ids)
+
+
+def add_coauthor_edges(
+    builder: GraphBuilder, names: List[str], max_authors: int = MAX_COAUTHORS
+) -> bool:
+    """
+    Link every pair of distinct authors of a paper once, from the name that
+    sorts first. Papers with more than max_authors authors (0 for no limit)
+    are skipped. Return whether the paper was linked.
+    """
+    authors = sorted(set(names))
+    if max_authors and len(authors) > max_authors:
+        return False
+    for first, second in combinations(authors, 2):
+        builder.add_edge(first, second)
+    return True
+
+
+def log_skipped_papers(skipped: int, max_authors: int) -> None:
+    """
+    Report the papers left out of the co-author graph, if any.
+    """
+    if skipped:
+        logging.info(
+            "Left {} papers with more than {} authors out of the co-author graph".format(
+                skipped, max_authors
+            )
+        )
+
+
+def build_graphs_from_papers(
+    papers: Iterable[Paper], max_authors: int = MAX_COAUTHORS
+) -> Tuple[LabelledGraph, LabelledGraph]:
+    """
+    Build the citation and co-authorship graphs from papers in a single pass.
+    """
+    citations = GraphBuilder()
+    coauthors = GraphBuilder()
+    skipped = 0
+    for paper in papers:
+        pmid = int(paper.pmc_id)
+        citations.node(pmid)
+        for reference in paper.references:
+            # references without a PubMed id cannot be linked to a node
+            if reference.pmid and reference.pmid.isdigit():
+                citations.add_edge(pmid, int(reference.pmid))
+        names = [author.name for author in paper.authors]
+        if not add_coauthor_edges(coauthors, names, max_authors):
+            skipped += 1
+    log_skipped_papers(skipped, max_authors)
+    return citations.build(), coauthors.build(merge=True)
+
+
+def iterate_paper_authors(
+    connection: sqlite3.Connection,
+) -> Iterator[List[str]]:
+    """
+    Yield the author names of each paper in the database.
+    """
+    current = None
+    names = []
+    for paper_id, name in connection.execute(
+        """SELECT author_paper.paper_id, author.name FROM author_paper
+        JOIN author ON author.id = author_paper.author_id
+        ORDER BY author_paper.paper_id"""
+    ):
+        if paper_id != current:
+            if names:
+                yield names
+            current = paper_id
+            names = []
+        names.append(name)
+    if names:
+        yield names
+
+
+def build_graphs_from_database(
+    connection: sqlite3.Connection, max_authors: int = MAX_COAUTHORS
+) -> Tuple[LabelledGraph, LabelledGraph]:
+    """
+    Build the citation and co-authorship graphs from the database tables.
+    """
+    citations = GraphBuilder()
+    for (pmid,) in connection.execute("SELECT pmid FROM paper ORDER BY pmid"):
+        citations.node(pmid)
+    for paper_id, pmid in connection.execute(
+        "SELECT paper_id, pmid FROM paper_reference"
+    ):
+        if pmid and pmid.isdigit():
+            citations.add_edge(paper_id, int(pmid))
+    coauthors = GraphBuilder()
+    skipped = 0
+    for names in iterate_paper_authors(connection):
+        if not add_coauthor_edges(coauthors, names, max_authors):
+            skipped += 1
+    log_skipped_papers(skipped, max_authors)
+    return citations.build(), coauthors.build(merge=True)
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed Citation and Co-author Graphs")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    # the sources follow the command, so --files cannot swallow its name
+    sources = argparse.ArgumentParser(add_help=False)
+    sources.add_argument(
+        "--db", default=DB, help="Database file (default: %(default)s)"
+    )
+    sources.add_argument(
+        "--files", nargs="*", help="Build the graphs from these XML files instead"
+    )
+    sources.add_argument(
+        "--max-authors",
+        type=int,
+        default=MAX_COAUTHORS,
+        help="Leave papers with more authors out of the co-author graph, "
+        "0 for no limit (default: %(default)s)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    top = subparsers.add_parser(
+        "top-cited", parents=[sources], help="Most cited papers"
+    )
+    top.add_argument("n", type=int, nargs="?", default=10, help="Number of papers")
+    cites = subparsers.add_parser(
+        "cites", parents=[sources], help="Papers cited by a paper"
+    )
+    cites.add_argument("pmid", type=int)
+    cited_by = subparsers.add_parser(
+        "cited-by", parents=[sources], help="Papers citing a paper"
+    )
+    cited_by.add_argument("pmid", type=int)
+    hops = subparsers.add_parser(
+        "hops", parents=[sources], help="Papers within k citation hops"
+    )
+    hops.add_argument("pmid", type=int)
+    hops.add_argument("k", type=int, nargs="?", default=2)
+    coauthors = subparsers.add_parser(
+        "coauthors", parents=[sources], help="Co-authors of an author"
+    )
+    coauthors.add_argument("name", help='Author name, e.g. "Marmot Michael M"')
+    args = parser.parse_args(args)
+    if args.max_authors < 0:
+        parser.error("--max-authors must be at least 0")
+    return args
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    if args.files is not None:
+        papers = chain.from_iterable(
+            extract_data_from_file(fn, stream=True) for fn in args.files
+        )
+        citations, coauthors = build_graphs_from_papers(papers, args.max_authors)
+    else:
+        connection = connect_to_database(args.db)
+        try:
+            create_tables(connection)
+            citations, coauthors = build_graphs_from_database(
+                connection, args.max_authors
+            )
+        finally:
+            connection.close()
+    logging.info(
+        "Citation graph: {} nodes, {} edges; co-author graph: {} nodes, {} edges".format(
+            citations.forward.node_count,
+            citations.forward.edge_count,
+            coauthors.forward.node_count,
+            coauthors.forward.edge_count,
+        )
+    )
+    if args.command == "top-cited":
+        for pmid, count in citations.top_in_degree(args.n):
+            print("{} - cited {} times".format(pmid, count))
+    elif args.command == "cites":
+        for pmid in citations.out_neighbors(args.pmid):
+            print(pmid)
+    elif args.command == "cited-by":
+        for pmid in citations.in_neighbors(args.pmid):
+            print(pmid)
+    elif args.command == "hops":
+        for pmid in citations.k_hop(args.pmid, args.k):
+            print(pmid)
+    elif args.command == "coauthors":
+        if coauthors.node(args.name) is None:
+            logging.error("Author not found: {}".format(args.name))
+            sys.exit(1)
+        shared = coauthors.undirected_neighbors(args.name)
+        for name, papers in sorted(shared, key=lambda pair: (-pair[1], pair[0])):
+            print("{} - {} papers".format(name, papers))
+
+
+if __name__ == "__main__":
+    main()
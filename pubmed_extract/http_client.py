@@ -0,0 +1,195 @@
+"""
+Small HTTP client for the E-utilities requests.
+
+Connections are kept alive and pooled per host, so consecutive requests
+skip the TCP and TLS handshakes. Responses are requested with
+Accept-Encoding: gzip and decompressed chunk by chunk as they are read.
+
+Proxies are taken from the environment (HTTP_PROXY, HTTPS_PROXY and
+NO_PROXY) as urllib.request.urlopen does: HTTPS requests are tunnelled
+through the proxy with CONNECT, and plain HTTP requests are sent to the
+proxy with the full URL.
+
+Errors are raised as urllib.error.HTTPError and urllib.error.URLError,
+the same exceptions urllib.request.urlopen raises.
+"""
+
+import base64
+import http.client
+import io
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = 60
+# idle connections kept per host, enough for one per download worker
+MAX_IDLE_CONNECTIONS = 16
+USER_AGENT = "pubmed_extract"
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of idle keep-alive connections, keyed on (scheme, host, port, proxy).
+    """
+
+    def __init__(self, max_idle: int = MAX_IDLE_CONNECTIONS, timeout: float = TIMEOUT):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle: Dict[Tuple, List[http.client.HTTPConnection]] = {}
+        self.lock = threading.Lock()
+
+    def get(
+        self,
+        scheme: str,
+        host: str,
+        port: int,
+        proxy: Optional[urllib.parse.SplitResult] = None,
+    ) -> http.client.HTTPConnection:
+        """
+        Take an idle connection to the host, or open a new one, through the
+        proxy if one is given.
+        """
+        with self.lock:
+            connections = self.idle.get((scheme, host, port, proxy))
+            if connections:
+                return connections.pop()
+        if proxy is None:
+            if scheme == "https":
+                return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+            return http.client.HTTPConnection(host, port, timeout=self.timeout)
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(
+                proxy.hostname, proxy.port or 80, timeout=self.timeout
+            )
+            connection.set_tunnel(host, port, headers=proxy_headers(proxy))
+            return connection
+        return http.client.HTTPConnection(
+            proxy.hostname, proxy.port or 80, timeout=self.timeout
+        )
+
+    def put(
+        self,
+        scheme: str,
+        host: str,
+        port: int,
+        proxy: Optional[urllib.parse.SplitResult],
+        connection: http.client.HTTPConnection,
+    ) -> None:
+        """
+        Return a connection to the pool, closing it if the pool is full.
+        """
+        with self.lock:
+            connections = self.idle.setdefault((scheme, host, port, proxy), [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def close(self) -> None:
+        """
+        Close every idle connection.
+        """
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+
+POOL = ConnectionPool()
+
+
+def find_proxy(scheme: str, host: str) -> Optional[urllib.parse.SplitResult]:
+    """
+    The proxy to reach the host through, from the environment, or None.
+    """
+    proxy = urllib.request.getproxies().get(scheme)
+    if not proxy or urllib.request.proxy_bypass(host):
+        return None
+    if "://" not in proxy:
+        proxy = "http://" + proxy
+    return urllib.parse.urlsplit(proxy)
+
+
+def proxy_headers(proxy: urllib.parse.SplitResult) -> Dict[str, str]:
+    """
+    The Proxy-Authorization header for a proxy URL with credentials, if any.
+    """
+    if proxy.username is None:
+        return {}
+    credentials = "{}:{}".format(
+        urllib.parse.unquote(proxy.username),
+        urllib.parse.unquote(proxy.password or ""),
+    )
+    return {
+        "Proxy-Authorization": "Basic "
+        + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    }
+
+
+def read_body(response: http.client.HTTPResponse) -> bytes:
+    """
+    Read the body of a response, decompressing it as a stream if it is gzip encoded.
+    """
+    encoding = (response.getheader("Content-Encoding") or "").lower()
+    # wbits=47 accepts both gzip and zlib headers
+    decompressor = zlib.decompressobj(47) if encoding in ("gzip", "deflate") else None
+    chunks = []
+    while True:
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        chunks.append(decompressor.decompress(chunk) if decompressor else chunk)
+    if decompressor:
+        chunks.append(decompressor.flush())
+    return b"".join(chunks)
+
+
+def get(url: str, pool: ConnectionPool = None) -> bytes:
+    """
+    GET a URL over a pooled keep-alive connection and return the decompressed body.
+
+    A pooled connection the server has since closed fails on first use,
+    so the request is retried once on a fresh connection in that case.
+    """
+    pool = pool or POOL
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme
+    host = parts.hostname
+    port = parts.port or (443 if scheme == "https" else 80)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    headers = {
+        "Accept-Encoding": "gzip",
+        "Connection": "keep-alive",
+        "User-Agent": USER_AGENT,
+    }
+    proxy = find_proxy(scheme, host)
+    if proxy is not None and scheme == "http":
+        # a plain HTTP proxy is sent the full URL instead of the path
+        path = url
+        headers.update(proxy_headers(proxy))
+    for attempt in range(2):
+        connection = pool.get(scheme, host, port, proxy)
+        reused = connection.sock is not None
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            body = read_body(response)
+        except (http.client.HTTPException, OSError, zlib.error) as error:
+            connection.close()
+            if reused and attempt == 0:
+                continue
+            raise urllib.error.URLError(error)
+        if response.will_close:
+            connection.close()
+        else:
+            pool.put(scheme, host, port, proxy, connection)
+        if response.status != 200:
+            raise urllib.error.HTTPError(
+                url, response.status, response.reason, response.msg, io.BytesIO(body)
+            )
+        return body
@@ -3,29 +3,213 @@
 Given an author, and a start and end year, collect a set of records from pubmed and save them to a file.
 Using the local data, count the number of papers per year.
 Present a Markdown table of the results: year, number of papers.
+With --counts-only, the table is built from one esearch count per year instead,
+without downloading any records.
 
-`usage: main.py [-h] [--output OUTPUT] [--verbose] author start_year [end_year]
+`usage: main.py [-h] [--output OUTPUT] [--gzip] [--cache-dir CACHE_DIR]
+                [--cache-ttl CACHE_TTL] [--cache-size CACHE_SIZE] [--offline]
+                [--resume] [--refresh] [--since SINCE] [--counts-only] [--verbose]
+                [--metrics METRICS] [--profile] [--workers WORKERS]
+                [--batch-size BATCH_SIZE] author start_year [end_year]
 """
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import datetime
+from functools import partial
+import gzip
+import json
 import logging
 import os
+import random
+import re
 import sys
-import urllib.request
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+import urllib.error
+import urllib.parse
 import xml.etree.ElementTree as ET
 
+from cache import DEFAULT_MAX_SIZE, DEFAULT_TTL, OfflineCacheMiss, ResponseCache
+import http_client
+from markdown_table import HEADINGS, convert_to_markdown
+from metrics import METRICS, METRICS_FILE, profile, profile_file_name
+
 # set global EMAIL from environment variable
 EMAIL = os.environ.get("EMAIL_ADDRESS")
 TOOL = "pubmed_extract"
+# an NCBI API key raises the request limit from 3 to 10 per second
+API_KEY = os.environ.get("NCBI_API_KEY")
+# overridable so the download can be run against a local stub server
+EUTILS_URL = os.environ.get(
+    "EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 1.0
+BATCH_SIZE = 500
+# efetch returns at most 10,000 records per request
+MAX_BATCH_SIZE = 10000
+# set by main when the response cache is enabled
+CACHE = None
+# cached searches are reused for at most an hour, so their WebEnv is still live
+SESSION_TTL = 60 * 60
+# query parameters that do not affect the content of a response
+VOLATILE_PARAMETERS = {"api_key", "email", "tool", "WebEnv", "query_key"}
+# maps each WebEnv to the search that created it, see cache_key
+SESSIONS = {}
+# an efetch response holds records only if it has one of these start tags
+RECORD_START_PATTERN = re.compile(rb"<Pubmed(Book)?Article[\s/>]")
+# a refresh also asks for the day before the last run, in case of clock or indexing lag
+REFRESH_OVERLAP = datetime.timedelta(days=1)
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter: at most `rate` requests per second,
+    with bursts of up to `capacity` requests.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Block until a token is available, then take it.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+RATE_LIMITER = TokenBucket(10 if API_KEY else 3)
+
+
+def cache_key(url: str) -> str:
+    """
+    Create the cache key for a URL.
+
+    The WebEnv changes with every esearch, so it is replaced by the search
+    term and count it was created for. That way a later run of the same
+    search hits the cached efetch pages even with a new history session.
+    """
+    parts = urllib.parse.urlsplit(url)
+    parameters = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    webenv = dict(parameters).get("WebEnv")
+    key = [(k, v) for k, v in parameters if k not in VOLATILE_PARAMETERS]
+    if webenv is not None:
+        key.append(("search", SESSIONS.get(webenv, webenv)))
+    return "{}?{}".format(
+        parts.path.rsplit("/", 1)[-1], urllib.parse.urlencode(sorted(key))
+    )
+
+
+def is_cacheable(url: str, data: bytes) -> bool:
+    """
+    Whether a response may be cached. E-utilities report errors such as an
+    expired history session with status 200 and an <ERROR> element, and an
+    efetch that returns no records is more likely a failure than an answer;
+    cached, either would be replayed to later searches through cache_key.
+    """
+    if b"<ERROR>" in data:
+        return False
+    if "efetch.fcgi" in url and "retmode=xml" in url:
+        return RECORD_START_PATTERN.search(data) is not None
+    return True
+
+
+def fetch_url(url: str, limiter: TokenBucket = None) -> bytes:
+    """
+    Fetch a URL through the response cache, if enabled, and the rate limiter,
+    retrying with exponential backoff on 429 and 5xx responses and on
+    connection errors.
+    """
+    if CACHE is not None:
+        key = cache_key(url)
+        data = CACHE.get(key, SESSION_TTL if "usehistory=y" in url else None)
+        if data is not None:
+            return data
+        data = fetch_url_from_network(url, limiter)
+        if is_cacheable(url, data):
+            CACHE.put(key, data)
+        else:
+            logging.warning("Not caching the response to {}".format(url))
+        return data
+    return fetch_url_from_network(url, limiter)
+
+
+def fetch_url_from_network(url: str, limiter: TokenBucket = None) -> bytes:
+    """
+    Fetch a URL over a pooled keep-alive connection through the rate limiter,
+    retrying with exponential backoff on 429 and 5xx responses and on
+    connection errors.
+    """
+    limiter = limiter or RATE_LIMITER
+    # the key is only added to the URL sent, so it never appears in the logs
+    request_url = "{}&api_key={}".format(url, API_KEY) if API_KEY else url
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            METRICS.count("retries")
+        with METRICS.time("rate_limit"):
+            limiter.acquire()
+        METRICS.count("requests")
+        start = time.perf_counter()
+        try:
+            data = http_client.get(request_url)
+            METRICS.count("bytes", len(data))
+            return data
+        except urllib.error.HTTPError as error:
+            METRICS.count("http_{}".format(error.code))
+            if error.code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                raise
+            retry_after = error.headers.get("Retry-After", "")
+            delay = (
+                float(retry_after)
+                if retry_after.isdigit()
+                else BACKOFF_FACTOR * 2**attempt
+            )
+            logging.warning("HTTP {} for {}".format(error.code, url))
+        except urllib.error.URLError as error:
+            METRICS.count("connection_errors")
+            if attempt == MAX_RETRIES:
+                raise
+            delay = BACKOFF_FACTOR * 2**attempt
+            logging.warning("{} for {}".format(error.reason, url))
+        finally:
+            latency = time.perf_counter() - start
+            METRICS.add_time("network", latency)
+            METRICS.observe("request_latency", latency)
+        # add jitter so concurrent workers do not retry in lockstep
+        delay += random.uniform(0, BACKOFF_FACTOR)
+        logging.info("Retrying in {:.1f}s".format(delay))
+        with METRICS.time("backoff"):
+            time.sleep(delay)
 
 
 def prepare_query_string(author: str, start_year: int, end_year: int) -> str:
     """
-    Prepare the query string for the pubmed search.
+    Prepare the query string for the pubmed search. Without an end year,
+    the search runs to the latest papers.
 
     """
     query_string = (
         '({}) AND (("{}"[Date - Publication] : "{}"[Date - Publication]))'.format(
-            author, start_year, end_year
+            author, start_year, "3000" if end_year is None else end_year
         )
     )
     # url encode the query string
@@ -33,12 +217,25 @@ def prepare_query_string(author: str, start_year: int, end_year: int) -> str:
     return query_string
 
 
+def prepare_refresh_query_string(query_string: str, since: datetime.date) -> str:
+    """
+    Restrict a prepared query string to the records added to Pubmed (entry
+    date) or revised (modification date) on or after the given date.
+    """
+    date_limit = (
+        ' AND (("{0}"[EDAT] : "3000"[EDAT]) OR ("{0}"[MDAT] : "3000"[MDAT]))'.format(
+            since.strftime("%Y/%m/%d")
+        )
+    )
+    return query_string + urllib.parse.quote(date_limit)
+
+
 def create_url_for_esearch(query_string: str) -> str:
     """
     Create the URL for the pubmed search with usehistory=y.
     """
-    return "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=pubmed&term={}&usehistory=y".format(
-        query_string
+    return "{}/esearch.fcgi?db=pubmed&term={}&usehistory=y".format(
+        EUTILS_URL, query_string
     )
 
 
@@ -48,8 +245,7 @@ def get_count_of_papers_using_esearch(query_string: str) -> int:
     """
     url = create_url_for_esearch(query_string)
     logging.info("URL: {}".format(url))
-    response = urllib.request.urlopen(url)
-    xml = response.read()
+    xml = fetch_url(url)
     root = ET.fromstring(xml)
 
     # extract count, webenv, and querykey from the search results
@@ -57,21 +253,53 @@ def get_count_of_papers_using_esearch(query_string: str) -> int:
     logging.info("Found {} publications".format(count))
     webenv = root.find("WebEnv").text
     querykey = root.find("QueryKey").text
+    SESSIONS[webenv] = "{}|{}".format(urllib.parse.unquote(query_string), count)
     return int(count), webenv, querykey
 
 
+def count_papers_using_esearch(query_string: str) -> int:
+    """
+    Get the count of papers for a search with rettype=count, which returns
+    only the count: no ids and no history session.
+    """
+    url = "{}/esearch.fcgi?db=pubmed&term={}&rettype=count&tool={}&email={}".format(
+        EUTILS_URL, query_string, TOOL, EMAIL
+    )
+    logging.debug("URL: {}".format(url))
+    root = ET.fromstring(fetch_url(url))
+    return int(root.find("Count").text)
+
+
+def count_papers_per_year(
+    author: str, start_year: int, end_year: int = None, workers: int = 1
+) -> List[Tuple[int, int]]:
+    """
+    Count the author's papers in each year from start_year to end_year
+    (by default the current year) with one count request per year, up to
+    `workers` at once within the rate limit. Return (year, count) in year order.
+    """
+    years = range(start_year, (end_year or datetime.date.today().year) + 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts = executor.map(
+            lambda year: count_papers_using_esearch(
+                prepare_query_string(author, year, year)
+            ),
+            years,
+        )
+        return list(zip(years, counts))
+
+
 def get_records_for_ids(
     ids: list, email: str, tool: str, webenv: str, querykey: str
 ) -> list:
     """
     Get the records for the given ids using efetch with the webenv and querykey.
     """
-    url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&retmode=xml&rettype=abstract&id={}&tool={}&email={}&WebEnv={}&query_key={}".format(
-        ",".join(ids), tool, email, webenv, querykey
+    url = "{}/efetch.fcgi?db=pubmed&retmode=xml&rettype=abstract&id={}&tool={}&email={}&WebEnv={}&query_key={}".format(
+        EUTILS_URL, ",".join(ids), tool, email, webenv, querykey
     )
     logging.info("URL: {}".format(url))
-    response = urllib.request.urlopen(url)
-    xml = response.read()
+    xml = fetch_url(url)
     root = ET.fromstring(xml)
     return root.findall("PubmedArticle")
 
@@ -80,48 +308,459 @@ def get_ids_for_batch(i: int, batch_size: int, webenv: str, querykey: str) -> li
     """
     Get the ids for a batch of records.
     """
-    core_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=pubmed&retmode=xml"
+    core_url = "{}/esearch.fcgi?db=pubmed&retmode=xml".format(EUTILS_URL)
     url = "{}&rettype=abstract&retstart={}&retmax={}&tool={}&email={}&WebEnv={}&query_key={}".format(
         core_url, i, batch_size, TOOL, EMAIL, webenv, querykey
     )
     logging.info("URL: {}".format(url))
-    response = urllib.request.urlopen(url)
-    xml = response.read()
+    xml = fetch_url(url)
     root = ET.fromstring(xml)
     ids = [id.text for id in root.findall("IdList/Id")]
     return ids
 
 
-def retrieve_all_records_in_batches(
-    query_string: str, email: str = EMAIL, tool: str = TOOL
+def create_url_for_efetch(
+    i: int, batch_size: int, email: str, tool: str, webenv: str, querykey: str
+) -> str:
+    """
+    Create the URL for efetch of the batch of records starting at position i
+    in the search results on the history server.
+    """
+    return "{}/efetch.fcgi?db=pubmed&retmode=xml&rettype=abstract&retstart={}&retmax={}&tool={}&email={}&WebEnv={}&query_key={}".format(
+        EUTILS_URL, i, batch_size, tool, email, webenv, querykey
+    )
+
+
+def retrieve_batch_of_records(
+    i: int, batch_size: int, email: str, tool: str, webenv: str, querykey: str
 ) -> list:
     """
-    Loop through all publications and collect the records for all papers in the search results.
+    Get the records for the batch of papers starting at position i in the search results,
+    paging efetch directly off the history server with retstart and retmax,
+    so no esearch is needed to look up the ids of the batch first.
+    """
+    url = create_url_for_efetch(i, batch_size, email, tool, webenv, querykey)
+    logging.info("URL: {}".format(url))
+    xml = fetch_url(url)
+    with METRICS.time("parse"):
+        root = ET.fromstring(xml)
+    return root.findall("PubmedArticle")
+
+
+def download_batches(
+    retrieve_batch: Callable[[int], list], offsets: Iterable[int], workers: int = 1
+) -> Iterator[Tuple[int, list]]:
+    """
+    Yield (offset, records) for each batch offset, in order.
+
+    With more than one worker, several batches are downloaded at once,
+    still within the rate limit. At most two batches per worker are held
+    at any time, so memory does not grow while a slow consumer catches up.
+    """
+    if workers == 1:
+        for i in offsets:
+            yield i, retrieve_batch(i)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for i in offsets:
+            pending.append((i, executor.submit(retrieve_batch, i)))
+            if len(pending) >= 2 * workers:
+                offset, future = pending.popleft()
+                yield offset, future.result()
+        while pending:
+            offset, future = pending.popleft()
+            yield offset, future.result()
+
+
+def iterate_batches_of_records(
+    query_string: str,
+    email: str = EMAIL,
+    tool: str = TOOL,
+    workers: int = 1,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[Tuple[int, list]]:
+    """
+    Yield (offset, records) for each batch of papers in the search results, in order.
     """
 
     # retrieve the search results and count using esearch
     count, webenv, querykey = get_count_of_papers_using_esearch(query_string)
 
     # retrieve the records in batches using efetch
-    batch_size = 100
+    retrieve_batch = partial(
+        retrieve_batch_of_records,
+        batch_size=batch_size,
+        email=email,
+        tool=tool,
+        webenv=webenv,
+        querykey=querykey,
+    )
+    yield from download_batches(retrieve_batch, range(0, count, batch_size), workers)
+
+
+def retrieve_all_records_in_batches(
+    query_string: str,
+    email: str = EMAIL,
+    tool: str = TOOL,
+    workers: int = 1,
+    batch_size: int = BATCH_SIZE,
+) -> list:
+    """
+    Loop through all publications and collect the records for all papers in the search results.
+    """
     records = []
-    for i in range(0, count, batch_size):
-        ids = get_ids_for_batch(i, batch_size, webenv, querykey)
-        records.extend(get_records_for_ids(ids, email, tool, webenv, querykey))
+    for i, batch in iterate_batches_of_records(
+        query_string, email, tool, workers, batch_size
+    ):
+        records.extend(batch)
     return records
 
 
+def manifest_file_name(output: str) -> str:
+    """
+    Name of the checkpoint manifest kept next to the output file during a download.
+    """
+    return output + ".manifest.json"
+
+
+def partial_file_name(output: str) -> str:
+    """
+    Name of the file the output is written to until the download is complete.
+    """
+    return output + ".part"
+
+
+def read_manifest(output: str) -> dict:
+    """
+    Read the checkpoint manifest for the output file.
+    """
+    with open(manifest_file_name(output)) as f:
+        return json.load(f)
+
+
+def write_manifest(output: str, manifest: dict) -> None:
+    """
+    Write the checkpoint manifest for the output file, replacing the old one
+    atomically so an interrupted write never leaves it half written.
+    """
+    file_name = manifest_file_name(output)
+    with open(file_name + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def encode_chunk(text: str, compress: bool) -> bytes:
+    """
+    Encode a piece of the output file, as a gzip member of its own if compressing,
+    so the file can be truncated back to any chunk boundary on resume.
+    """
+    data = text.encode("utf-8")
+    return gzip.compress(data) if compress else data
+
+
+def download_records_to_file(
+    query_string: str,
+    output: str,
+    email: str = EMAIL,
+    tool: str = TOOL,
+    workers: int = 1,
+    batch_size: int = BATCH_SIZE,
+    resume: bool = False,
+) -> int:
+    """
+    Stream batches of records into a PubmedArticleSet in the output file,
+    writing and flushing each batch as it arrives so that only one batch
+    is held in memory. The output is gzip compressed if its name ends in .gz.
+
+    The records are written to a partial file, and a manifest next to it
+    records the WebEnv/query_key, the count and the retstart offsets
+    completed so far. With resume=True only the missing batches are
+    downloaded. The partial file replaces the output once all batches are in.
+    Return the number of records written in this run.
+    """
+    compress = output.endswith(".gz")
+    count, webenv, querykey = get_count_of_papers_using_esearch(query_string)
+    if resume:
+        manifest = read_manifest(output)
+        if manifest["query"] != query_string or manifest["count"] != count:
+            logging.error(
+                "Search results have changed since the download started: {}".format(
+                    output
+                )
+            )
+            sys.exit(1)
+        # the history server session may have expired, use the new one
+        manifest.update(webenv=webenv, query_key=querykey)
+        batch_size = manifest["batch_size"]
+        f = open(partial_file_name(output), "r+b")
+        f.truncate(manifest["position"])
+        f.seek(manifest["position"])
+    else:
+        manifest = {
+            "query": query_string,
+            "webenv": webenv,
+            "query_key": querykey,
+            "count": count,
+            "batch_size": batch_size,
+            "completed": [],
+            "position": 0,
+        }
+        f = open(partial_file_name(output), "wb")
+        f.write(encode_chunk("<PubmedArticleSet>", compress))
+        f.flush()
+        manifest["position"] = f.tell()
+    write_manifest(output, manifest)
+
+    completed = set(manifest["completed"])
+    offsets = [i for i in range(0, count, batch_size) if i not in completed]
+    logging.info(
+        "Downloading {} of {} batches".format(
+            len(offsets), len(range(0, count, batch_size))
+        )
+    )
+    retrieve_batch = partial(
+        retrieve_batch_of_records,
+        batch_size=batch_size,
+        email=email,
+        tool=tool,
+        webenv=webenv,
+        querykey=querykey,
+    )
+    written = 0
+    with f:
+        for i, batch in download_batches(retrieve_batch, offsets, workers):
+            with METRICS.time("tostring"):
+                text = "".join(
+                    ET.tostring(record, encoding="unicode") for record in batch
+                )
+            with METRICS.time("write"):
+                chunk = encode_chunk(text, compress)
+                f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+                # only record the batch once its records are safely on disk
+                manifest["completed"].append(i)
+                manifest["position"] = f.tell()
+                write_manifest(output, manifest)
+            METRICS.count("records", len(batch))
+            METRICS.count("bytes_written", len(chunk))
+            written += len(batch)
+            logging.debug("Written {} records".format(written))
+        f.write(encode_chunk("</PubmedArticleSet>", compress))
+    os.replace(partial_file_name(output), output)
+    os.remove(manifest_file_name(output))
+    return written
+
+
+def updates_file_name(output: str) -> str:
+    """
+    Name of the file the new and revised records are downloaded to during a refresh.
+    """
+    return output + ".updates" + (".gz" if output.endswith(".gz") else "")
+
+
+def last_refresh_date(output: str) -> datetime.date:
+    """
+    The date the output file was last written, by a download or a refresh.
+    """
+    return datetime.date.fromtimestamp(os.path.getmtime(output))
+
+
+def open_records_file(file_name: str):
+    """
+    Open a downloaded records file for reading, decompressing it if it ends in .gz.
+    """
+    return (
+        gzip.open(file_name, "rb")
+        if file_name.endswith(".gz")
+        else open(file_name, "rb")
+    )
+
+
+def record_pmid(record: ET.Element) -> str:
+    """
+    The PMID of a PubmedArticle element.
+    """
+    return record.find("MedlineCitation").find("PMID").text
+
+
+def merge_records_into_file(output: str, updates: Dict[str, ET.Element]) -> int:
+    """
+    Rewrite the output file with each record replaced by its update, if any,
+    and the updates for records it did not have appended, streaming the old
+    file so only the updates are held in memory. Return the number of
+    records replaced.
+    """
+    compress = output.endswith(".gz")
+    pending = dict(updates)
+    replaced = 0
+    with open_records_file(output) as old, open(partial_file_name(output), "wb") as f:
+        f.write(encode_chunk("<PubmedArticleSet>", compress))
+        chunk = []
+        root = None
+        for event, element in ET.iterparse(old, events=("start", "end")):
+            if root is None:
+                root = element
+            if event != "end" or element.tag != "PubmedArticle":
+                continue
+            record = pending.pop(record_pmid(element), None)
+            if record is None:
+                record = element
+            else:
+                replaced += 1
+            chunk.append(ET.tostring(record, encoding="unicode"))
+            root.clear()
+            if len(chunk) >= BATCH_SIZE:
+                f.write(encode_chunk("".join(chunk), compress))
+                chunk = []
+        chunk.extend(
+            ET.tostring(record, encoding="unicode") for record in pending.values()
+        )
+        chunk.append("</PubmedArticleSet>")
+        f.write(encode_chunk("".join(chunk), compress))
+    os.replace(partial_file_name(output), output)
+    return replaced
+
+
+def refresh_records_in_file(
+    query_string: str,
+    output: str,
+    since: datetime.date = None,
+    workers: int = 1,
+    batch_size: int = BATCH_SIZE,
+) -> Tuple[int, int]:
+    """
+    Bring an earlier download of the search up to date. Only the records
+    added or revised since the output was last written (or since the given
+    date) are downloaded, to a separate updates file, and merged into the
+    output by PMID. Records deleted from Pubmed are kept.
+    Return the numbers of records replaced and added.
+    """
+    since = since or last_refresh_date(output) - REFRESH_OVERLAP
+    logging.info("Refreshing records added or revised since {}".format(since))
+    updates_file = updates_file_name(output)
+    count = download_records_to_file(
+        prepare_refresh_query_string(query_string, since),
+        updates_file,
+        workers=workers,
+        batch_size=batch_size,
+    )
+    if count:
+        with open_records_file(updates_file) as f:
+            records = ET.parse(f).getroot().findall("PubmedArticle")
+        updates = {record_pmid(record): record for record in records}
+        replaced = merge_records_into_file(output, updates)
+    else:
+        # touch the output, so the next refresh starts from today
+        os.utime(output)
+        updates, replaced = {}, 0
+    os.remove(updates_file)
+    return replaced, len(updates) - replaced
+
+
 def parse_and_validate_args(args: list) -> argparse.Namespace:
     """
     Parse and validate the command line arguments.
     """
     parser = argparse.ArgumentParser(description="Pubmed Extractor")
     parser.add_argument("--output", "-o", help="Output file")
+    parser.add_argument(
+        "--gzip", "-z", action="store_true", help="Compress the output file with gzip"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=os.environ.get("PUBMED_CACHE_DIR"),
+        help="Cache responses in this directory (default: $PUBMED_CACHE_DIR)",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_TTL / 3600,
+        help="Hours before a cached response expires (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_SIZE // (1024 * 1024),
+        help="Size limit of the cache in MB (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Replay responses from the cache without using the network",
+    )
+    parser.add_argument(
+        "--resume",
+        "-r",
+        action="store_true",
+        help="Resume an interrupted download into the output file",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Download only the records added or revised since the output file "
+        "was last written, and merge them into it by PMID",
+    )
+    parser.add_argument(
+        "--since",
+        type=lambda text: datetime.datetime.strptime(text, "%Y/%m/%d").date(),
+        help="With --refresh, the date to refresh from, as YYYY/MM/DD "
+        "(default: the day before the output file was last written)",
+    )
+    parser.add_argument(
+        "--counts-only",
+        action="store_true",
+        help="Print the papers per year from one count request per year, "
+        "without downloading the records",
+    )
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument(
+        "--metrics",
+        help="Write per-stage timings, counters and latencies to this JSON file",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Also run cProfile and tracemalloc, saving the profile next to the metrics",
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=1,
+        help="Number of batches to download at once (default: 1)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        "-b",
+        type=int,
+        default=BATCH_SIZE,
+        help="Number of records per efetch request, at most {} (default: %(default)s)".format(
+            MAX_BATCH_SIZE
+        ),
+    )
     parser.add_argument("author", help="Author to search for")
     parser.add_argument("start_year", type=int, help="Start year")
     parser.add_argument("end_year", type=int, nargs="?", default=None, help="End year")
-    return parser.parse_args(args)
+    args = parser.parse_args(args)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if not 1 <= args.batch_size <= MAX_BATCH_SIZE:
+        parser.error("--batch-size must be between 1 and {}".format(MAX_BATCH_SIZE))
+    if args.refresh and args.resume:
+        parser.error("--refresh and --resume cannot be used together")
+    if args.since and not args.refresh:
+        parser.error("--since requires --refresh")
+    if args.counts_only and (args.resume or args.refresh):
+        parser.error("--counts-only cannot be used with --resume or --refresh")
+    if args.end_year is not None and args.end_year < args.start_year:
+        parser.error("end_year must not be before start_year")
+    if args.offline and not args.cache_dir:
+        parser.error("--offline requires --cache-dir")
+    if args.profile and not args.metrics:
+        args.metrics = METRICS_FILE
+    return args
 
 
 def create_output_file_name(args: argparse.Namespace) -> None:
@@ -132,8 +771,37 @@ def create_output_file_name(args: argparse.Namespace) -> None:
         args.output = "./data/{}_{}_{}.xml".format(
             args.author, args.start_year, args.end_year
         )
+    if args.gzip and not args.output.endswith(".gz"):
+        args.output += ".gz"
+    if args.refresh:
+        if not os.path.exists(args.output):
+            logging.error("No output file to refresh: {}".format(args.output))
+            sys.exit(1)
+        if os.path.exists(manifest_file_name(updates_file_name(args.output))):
+            logging.error(
+                "Interrupted refresh found, remove {} and run again".format(
+                    updates_file_name(args.output) + ".*"
+                )
+            )
+            sys.exit(1)
+        return
     if os.path.exists(args.output):
-        logging.error("Output file already exists: {}".format(args.output))
+        logging.error(
+            "Output file already exists, use --refresh to update it: {}".format(
+                args.output
+            )
+        )
+        sys.exit(1)
+    manifest_exists = os.path.exists(manifest_file_name(args.output))
+    if args.resume and not manifest_exists:
+        logging.error("No interrupted download to resume: {}".format(args.output))
+        sys.exit(1)
+    if not args.resume and manifest_exists:
+        logging.error(
+            "Interrupted download found, run again with --resume: {}".format(
+                args.output
+            )
+        )
         sys.exit(1)
 
 
@@ -143,19 +811,67 @@ def main():
     """
     args = parse_and_validate_args(sys.argv[1:])
     logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
-    create_output_file_name(args)
+    if not args.counts_only:
+        create_output_file_name(args)
+    if args.cache_dir:
+        global CACHE
+        CACHE = ResponseCache(
+            args.cache_dir,
+            ttl=args.cache_ttl * 3600,
+            max_size=args.cache_size * 1024 * 1024,
+            offline=args.offline,
+        )
 
+    if args.metrics:
+        METRICS.enable()
     query_string = prepare_query_string(args.author, args.start_year, args.end_year)
-    records = retrieve_all_records_in_batches(query_string)
-    # log the number of records found
-    logging.info("Found {} records".format(len(records)))
-    # create root XML element called "PubmedArticleSet" and add records to it
-    root = ET.Element("PubmedArticleSet")
-    for record in records:
-        root.append(record)
-    # write the XML to the output file
-    with open(args.output, "w") as f:
-        f.write(ET.tostring(root, encoding="unicode"))
+    profiler = (
+        profile(profile_file_name(args.metrics)) if args.profile else nullcontext()
+    )
+    try:
+        with profiler:
+            if args.counts_only:
+                rows = count_papers_per_year(
+                    args.author, args.start_year, args.end_year, args.workers
+                )
+                print(convert_to_markdown(rows, HEADINGS["year"]))
+                logging.info(
+                    "Counted {} papers in {} years".format(
+                        sum(count for _, count in rows), len(rows)
+                    )
+                )
+            elif args.refresh:
+                replaced, added = refresh_records_in_file(
+                    query_string,
+                    args.output,
+                    since=args.since,
+                    workers=args.workers,
+                    batch_size=args.batch_size,
+                )
+                logging.info(
+                    "Refreshed {}: {} records revised, {} added".format(
+                        args.output, replaced, added
+                    )
+                )
+            else:
+                # write the XML to the output file as each batch arrives
+                count = download_records_to_file(
+                    query_string,
+                    args.output,
+                    workers=args.workers,
+                    batch_size=args.batch_size,
+                    resume=args.resume,
+                )
+                # log the number of records found
+                logging.info("Downloaded {} records".format(count))
+    except OfflineCacheMiss as error:
+        logging.error("Not in the cache, cannot fetch offline: {}".format(error))
+        sys.exit(1)
+    if CACHE is not None:
+        CACHE.report()
+    if args.metrics:
+        METRICS.write(args.metrics)
+        logging.info("Metrics written to {}".format(args.metrics))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,23 @@
+"""
+Markdown tables of paper counts, shared by main.py and aggregate.py so that
+printing a table does not import the database modules.
+"""
+
+from typing import List, Tuple
+
+HEADINGS = {
+    "year": ["Year", "Papers"],
+    "journal": ["Year", "Journal", "Papers"],
+    "mesh": ["Year", "MeSH term", "Papers"],
+}
+
+
+def convert_to_markdown(rows: List[Tuple], headings: List[str]) -> str:
+    """
+    Convert a list of rows to a Markdown table with headers.
+    """
+    output = "| " + " | ".join(headings) + " |\n"
+    output += "| " + " | ".join(["---"] * len(headings)) + " |\n"
+    for row in rows:
+        output += "| " + " | ".join(str(value) for value in row) + " |\n"
+    return output
@@ -0,0 +1,233 @@
+"""
+Per-stage timers, counters and latency histograms for the pipelines.
+
+The stages of main.py and parse_xml.py record into the module-level
+METRICS: time spent on the network, parsing XML, ET.tostring and writing,
+and counts of requests, bytes, records and retries. The report is a plain
+dict, written as JSON with --metrics.
+
+Recording is off until enable() is called, which the scripts do when
+--metrics or --profile is given. Until then every call returns at once,
+without taking the lock, so the per-record calls in the parsers cost next
+to nothing when no report is wanted.
+
+Stage times are summed over threads, so with several download workers the
+network time can exceed the elapsed time. Work done in parse worker
+processes is not recorded.
+
+profile() additionally runs cProfile and tracemalloc and adds the top
+functions and allocation sites to the report.
+"""
+
+import bisect
+import cProfile
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import ContextManager, Dict, Iterator, List
+
+# upper bounds of the latency histogram buckets, in seconds
+BUCKETS = [
+    0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60,
+]  # fmt: skip
+PROFILE_TOP = 25
+METRICS_FILE = "metrics.json"
+# what Metrics.time returns while recording is off
+NOT_TIMED = nullcontext()
+
+
+class Histogram:
+    """
+    Counts of observations in fixed latency buckets, plus an overflow bucket.
+    """
+
+    def __init__(self, bounds: List[float] = BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+        """
+        count = sum(self.counts)
+        seen = 0
+        for bound, bucket in zip(self.bounds + [self.maximum], self.counts):
+            seen += bucket
+            if seen >= q * count:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> dict:
+        count = sum(self.counts)
+        if not count:
+            return {"count": 0}
+        return {
+            "count": count,
+            "total": round(self.total, 6),
+            "mean": round(self.total / count, 6),
+            "min": round(self.minimum, 6),
+            "max": round(self.maximum, 6),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                "le_{}".format(bound): bucket
+                for bound, bucket in zip(self.bounds + ["inf"], self.counts)
+                if bucket
+            },
+        }
+
+
+class Metrics:
+    """
+    Thread-safe collection of stage timers, counters and histograms.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.lock = threading.Lock()
+        self.enabled = enabled
+        self.reset()
+
+    def enable(self) -> None:
+        """
+        Start recording, timing the elapsed time from now.
+        """
+        self.enabled = True
+        with self.lock:
+            self.started = time.perf_counter()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.started = time.perf_counter()
+            self.stages: Dict[str, List[float]] = {}
+            self.counters: Counter = Counter()
+            self.histograms: Dict[str, Histogram] = {}
+            self.profile: dict = {}
+
+    def count(self, name: str, value: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] += value
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    def observe(self, name: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    def time(self, stage: str) -> ContextManager[None]:
+        """
+        Add the time spent in the block to a stage, even if it raises.
+        """
+        if not self.enabled:
+            return NOT_TIMED
+        return self.timer(stage)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def report(self) -> dict:
+        with self.lock:
+            return {
+                "elapsed": round(time.perf_counter() - self.started, 6),
+                "stages": {
+                    stage: {"seconds": round(seconds, 6), "calls": calls}
+                    for stage, (seconds, calls) in sorted(self.stages.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+                "histograms": {
+                    name: histogram.to_dict()
+                    for name, histogram in sorted(self.histograms.items())
+                },
+                **({"profile": self.profile} if self.profile else {}),
+            }
+
+    def write(self, file_name: str) -> None:
+        with open(file_name, "w") as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+
+METRICS = Metrics()
+
+
+def profile_file_name(metrics_file: str) -> str:
+    """
+    Name of the cProfile output saved next to a metrics report.
+    """
+    return os.path.splitext(metrics_file)[0] + ".prof"
+
+
+@contextmanager
+def profile(prof_file: str, metrics: Metrics = METRICS) -> Iterator[None]:
+    """
+    Run the block under cProfile and tracemalloc. The raw profile is saved
+    to prof_file for pstats or snakeviz, and the top functions by cumulative
+    time, the top allocation sites and the peak traced memory are added to
+    the report.
+
+    cProfile only sees the calling thread, so time in download worker
+    threads shows up as waiting on their futures.
+    """
+    metrics.enable()
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profiler.dump_stats(prof_file)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(
+            PROFILE_TOP
+        )
+        metrics.profile = {
+            "prof_file": prof_file,
+            "functions": [
+                line for line in output.getvalue().splitlines() if line.strip()
+            ],
+            "peak_traced_memory": peak,
+            "allocations": [
+                {
+                    "location": str(stat.traceback),
+                    "size": stat.size,
+                    "count": stat.count,
+                }
+                for stat in snapshot.statistics("lineno")[:PROFILE_TOP]
+            ],
+        }
@@ -11,14 +11,30 @@ and the relation between them (one author can write multiple papers
 and one paper can have multiple authors).
 """
 
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
 from glob import glob
+import logging
+import mmap
 import os
-from typing import List, Iterator
+import re
+import sys
+import time
+from typing import List, Iterator, Optional, Tuple
 import xml.etree.ElementTree as ET
 
+from compression import is_compressed, open_xml_file
+from fields import CompiledFields, Field
+from metrics import METRICS, METRICS_FILE, profile, profile_file_name
+
 DATA_DIR = "data"
 DB = "./data/pubmed.db"
+SHARD_SIZE = 64 * 1024 * 1024
+ARTICLE_END_TAG = b"</PubmedArticle>"
+ARTICLE_START_PATTERN = re.compile(rb"<PubmedArticle[\s>]")
+XML_FILE_PATTERNS = ["*.xml", "*.xml.gz", "*.xml.zst"]
 
 
 @dataclass
@@ -53,11 +69,23 @@ class Paper:
     full_xml: str
 
 
+def find_xml_files(directory: str = DATA_DIR) -> List[str]:
+    """
+    List the plain and compressed XML files in a directory.
+    """
+    return sorted(
+        file_name
+        for pattern in XML_FILE_PATTERNS
+        for file_name in glob(os.path.join(directory, pattern))
+    )
+
+
 def load_xml_file(file_name: str) -> ET.Element:
     """
-    Load the XML file.
+    Load the XML file, which may be compressed (.xml.gz or .xml.zst).
     """
-    tree = ET.parse(file_name)
+    with METRICS.time("parse"), open_xml_file(file_name) as f:
+        tree = ET.parse(f)
     return tree.getroot()
 
 
@@ -145,17 +173,7 @@ def get_authors(root: ET.Element) -> list:
     """
     authors = []
     for article in root:
-        for author in (
-            article.find("MedlineCitation")
-            .find("Article")
-            .find("AuthorList")
-            .findall("Author")
-        ):
-            authors.append(
-                Author(
-                    retrieve_name_of_author(author), retrieve_author_affiliation(author)
-                )
-            )
+        authors.extend(AUTHOR_FIELDS.extract(article)[0])
     return authors
 
 
@@ -170,6 +188,84 @@ def create_date_string(year: str, month: str, day: str, medline_date: str) -> st
     return ds
 
 
+def retrieve_author(author_element: ET.Element) -> Author:
+    """
+    Retrieve the name and affiliation of the author in a single pass over its
+    children, with the same result as retrieve_name_of_author and
+    retrieve_author_affiliation.
+    """
+    name = ""
+    affiliation = ""
+    for child in author_element:
+        tag = child.tag
+        if tag == "LastName":
+            name = child.text
+        elif tag == "ForeName" or tag == "Initials":
+            name += " " + child.text
+        elif tag == "CollectiveName":
+            name = f"{child.text} (Collective)"
+        elif tag == "AffiliationInfo":
+            affiliation = child.find("Affiliation").text
+    return Author(name, affiliation)
+
+
+def retrieve_descriptor_name(mesh_heading: ET.Element) -> Optional[str]:
+    """
+    The MeSH term of a heading, or None for a heading without a descriptor,
+    which the mesh_terms field then leaves out.
+    """
+    descriptor = mesh_heading.find("DescriptorName")
+    return None if descriptor is None else descriptor.text
+
+
+def retrieve_reference(reference_element: ET.Element) -> Reference:
+    """
+    Retrieve the citation and the first article id (normally the PMID) of a reference.
+    """
+    citation = reference_element.find("Citation")
+    # single tags rather than a path, so find() stays on its fast path
+    article_ids = reference_element.find("ArticleIdList")
+    article_id = None if article_ids is None else article_ids.find("ArticleId")
+    return Reference(
+        None if citation is None else citation.text,
+        None if article_id is None else article_id.text,
+    )
+
+
+ARTICLE = "MedlineCitation/Article/"
+PUB_DATE = ARTICLE + "Journal/JournalIssue/PubDate/"
+# compiled once, so each record is filled in one traversal of its subtree
+PAPER_FIELDS = CompiledFields(
+    [
+        Field("title", ARTICLE + "ArticleTitle"),
+        Field("journal", ARTICLE + "Journal/Title"),
+        Field("journal_abbreviation", ARTICLE + "Journal/ISOAbbreviation"),
+        Field("year", PUB_DATE + "Year"),
+        Field("month", PUB_DATE + "Month"),
+        Field("day", PUB_DATE + "Day"),
+        Field("medline_date", PUB_DATE + "MedlineDate"),
+        Field("page_numbers", ARTICLE + "Pagination/MedlinePgn"),
+        Field("doi", ARTICLE + "ELocationID"),
+        Field("pmc_id", "MedlineCitation/PMID"),
+        Field("authors", ARTICLE + "AuthorList/Author", each=retrieve_author),
+        Field("abstract", ARTICLE + "Abstract/AbstractText", default=""),
+        Field(
+            "mesh_terms",
+            "MedlineCitation/MeshHeadingList/MeshHeading",
+            each=retrieve_descriptor_name,
+        ),
+        Field(
+            "references",
+            "PubmedData/ReferenceList/Reference",
+            each=retrieve_reference,
+        ),
+    ]
+)
+AUTHOR_FIELDS = CompiledFields(
+    [Field("authors", ARTICLE + "AuthorList/Author", each=retrieve_author)]
+)
+
+
 def retrieve_paper(paper_element: ET.Element) -> dict:
     """
         Extract the details of the paper given this XML structure:
@@ -263,125 +359,38 @@ def retrieve_paper(paper_element: ET.Element) -> dict:
         </PubmedData>
     </PubmedArticle>
     """
-    # Get the title of the paper
-    title = (
-        paper_element.find("MedlineCitation").find("Article").find("ArticleTitle").text
-    )
-    # Get the journal details
-    journal = (
-        paper_element.find("MedlineCitation")
-        .find("Article")
-        .find("Journal")
-        .find("Title")
-        .text
-    )
-    journal_abbreviation = (
-        paper_element.find("MedlineCitation")
-        .find("Article")
-        .find("Journal")
-        .find("ISOAbbreviation")
-        .text
-    )
-    # Get the date of publication element
-    pub_date_element = (
-        paper_element.find("MedlineCitation")
-        .find("Article")
-        .find("Journal")
-        .find("JournalIssue")
-        .find("PubDate")
-    )
-    # Get the year of publication testing for AttributeError
-    try:
-        year = pub_date_element.find("Year").text
-    except AttributeError:
-        year = None
-    # Get the month of publication testing for AttributeError
-    try:
-        month = pub_date_element.find("Month").text
-    except AttributeError:
-        month = None
-    # Get the day of publication testing for AttributeError
-    try:
-        day = pub_date_element.find("Day").text
-    except AttributeError:
-        day = None
-    # Get the MedlineDate inside the PubmedData element, testing for AttributeError
-    try:
-        medline_date = pub_date_element.find("MedlineDate").text
-    except AttributeError:
-        medline_date = None
+    timed = METRICS.enabled
+    if timed:
+        start = time.perf_counter()
+    (
+        title,
+        journal,
+        journal_abbreviation,
+        year,
+        month,
+        day,
+        medline_date,
+        page_numbers,
+        doi,
+        pmc_id,
+        authors,
+        abstract,
+        mesh_terms,
+        references,
+    ) = PAPER_FIELDS.extract(paper_element)
     # Create a date object from the year, month and day ensuring that all are not None
     pub_date = create_date_string(year, month, day, medline_date)
-    # Get the page numbers of the paper, testing for AttributeError
-    try:
-        page_numbers = (
-            paper_element.find("MedlineCitation")
-            .find("Article")
-            .find("Pagination")
-            .find("MedlinePgn")
-            .text
-        )
-    except AttributeError:
-        page_numbers = None
-    # Get the DOI of the paper testing for AttributeError
-    try:
-        doi = paper_element.find("MedlineCitation")
-        doi = doi.find("Article")
-        doi = doi.find("ELocationID")
-        doi = doi.text
-    except AttributeError:
-        doi = None
-    # Get the PMC ID of the paper
-    pmc_id = paper_element.find("MedlineCitation").find("PMID").text
-    # Get the authors of the paper
-    authors = []
-    for author in (
-        paper_element.find("MedlineCitation")
-        .find("Article")
-        .find("AuthorList")
-        .findall("Author")
-    ):
-        authors.append(
-            Author(retrieve_name_of_author(author), retrieve_author_affiliation(author))
-        )
-    # Get the abstract of the paper if it exists returning empty string in case of AttributeError
-    try:
-        abstract = (
-            paper_element.find("MedlineCitation")
-            .find("Article")
-            .find("Abstract")
-            .find("AbstractText")
-            .text
-        )
-    except AttributeError:
-        abstract = ""
-    # Get the mesh terms of the paper returning empty list in case of AttributeError
-    try:
-        mesh_terms = []
-        for mesh_term in (
-            paper_element.find("MedlineCitation")
-            .find("MeshHeadingList")
-            .findall("MeshHeading")
-        ):
-            mesh_terms.append(mesh_term.find("DescriptorName").text)
-    except AttributeError:
-        mesh_terms = []
-    # Get the references of the paper returns empty list in case of AttributeError
-    try:
-        references = []
-        for reference in (
-            paper_element.find("PubmedData").find("ReferenceList").findall("Reference")
-        ):
-            references.append(
-                Reference(
-                    reference.find("Citation").text,
-                    reference.find("ArticleIdList").find("ArticleId").text,
-                )
-            )
-    except AttributeError:
-        references = []
-    # Convert the full XML of the paper to a string
-    full_xml = ET.tostring(paper_element)
+    # Convert the full XML of the paper to a string, without the whitespace
+    # after its end tag, which iterparse has only sometimes read by then
+    tail, paper_element.tail = paper_element.tail, None
+    if timed:
+        METRICS.add_time("extract", time.perf_counter() - start)
+        with METRICS.time("tostring"):
+            full_xml = ET.tostring(paper_element)
+        METRICS.count("records")
+    else:
+        full_xml = ET.tostring(paper_element)
+    paper_element.tail = tail
     # display the ID, title, and date of the paper
     quick_summary = f"{pmc_id} - {pub_date} - {title} - {journal_abbreviation}"
     # Return the paper
@@ -406,27 +415,268 @@ def retrieve_paper(paper_element: ET.Element) -> dict:
     return record
 
 
-def extract_data_from_file(file_name: str) -> Iterator[Paper]:
+def iterparse_xml_file(file_name: str) -> Iterator[ET.Element]:
+    """
+    Yield each PubmedArticle element as soon as its end tag has been read,
+    without building the whole tree in memory.
+
+    Each element is cleared (and detached from the root) once the caller
+    has finished with it, so memory stays flat regardless of file size.
+    Compressed files are decompressed as they are read.
+    """
+    with open_xml_file(file_name) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        root = None
+        timed = METRICS.enabled
+        start = time.perf_counter()
+        for event, element in context:
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            if element.tag == "PubmedArticle":
+                # only the parsing is timed, not the caller's work between records
+                if timed:
+                    METRICS.add_time("parse", time.perf_counter() - start)
+                yield element
+                element.clear()
+                # drop the references the root keeps to finished articles
+                root.clear()
+                if timed:
+                    start = time.perf_counter()
+
+
+def extract_data_from_file(file_name: str, stream: bool = False) -> Iterator[Paper]:
     """
     Parse each record from a file containing an
     XML object representing the results of a PubMed search.
+
+    With stream=True the file is read incrementally with iterparse
+    rather than loaded in full with load_xml_file.
     """
+    if stream:
+        for paper_element in iterparse_xml_file(file_name):
+            yield retrieve_paper(paper_element)
+        return
     root = load_xml_file(file_name)
     for paper_element in root.findall("PubmedArticle"):
         yield retrieve_paper(paper_element)
 
 
-def main(list_of_files: List[str]) -> None:
+def iterate_article_offsets(file_name: str) -> Iterator[Tuple[int, int]]:
+    """
+    Scan the raw bytes of a file and yield (offset, length) of each
+    PubmedArticle element, from its start tag to the end of its end tag.
+
+    Offsets into a compressed file would point into the compressed bytes,
+    so compressed files raise a ValueError.
+    """
+    if is_compressed(file_name):
+        raise ValueError(
+            "Records cannot be located by byte offset in compressed file {}, "
+            "decompress it first".format(file_name)
+        )
+    with open(file_name, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            position = 0
+            while True:
+                match = ARTICLE_START_PATTERN.search(data, position)
+                if match is None:
+                    return
+                end = data.find(ARTICLE_END_TAG, match.start())
+                if end == -1:
+                    return
+                position = end + len(ARTICLE_END_TAG)
+                yield match.start(), position - match.start()
+
+
+def find_shard_boundaries(
+    file_name: str, shard_size: int = SHARD_SIZE
+) -> List[Tuple[int, int]]:
+    """
+    Split a file into (start, end) byte ranges of roughly shard_size bytes,
+    each ending just after a </PubmedArticle> tag (and any whitespace that
+    follows it) so no record is cut in two.
+    """
+    file_size = os.path.getsize(file_name)
+    boundaries = []
+    start = 0
+    with open(file_name, "rb") as f:
+        while start < file_size:
+            target = start + shard_size
+            if target >= file_size:
+                boundaries.append((start, file_size))
+                break
+            # read forward from the target until the next end tag is found
+            f.seek(target)
+            end = file_size
+            carry = b""
+            position = target
+            while True:
+                block = f.read(1024 * 1024)
+                if not block:
+                    break
+                buffer = carry + block
+                index = buffer.find(ARTICLE_END_TAG)
+                if index != -1:
+                    # keep the whitespace tail with the article it follows
+                    index += len(ARTICLE_END_TAG)
+                    while index < len(buffer) and buffer[index : index + 1].isspace():
+                        index += 1
+                    end = position - len(carry) + index
+                    break
+                # keep enough of the tail to catch a tag split across blocks
+                carry = buffer[-len(ARTICLE_END_TAG) :]
+                position += len(block)
+            boundaries.append((start, end))
+            start = end
+    return boundaries
+
+
+def parse_shard(shard: Tuple[str, int, int]) -> List[Paper]:
+    """
+    Parse the PubmedArticle records within one byte range of a file.
+
+    The range is trimmed to the first article start tag and the last article
+    end tag, then wrapped in a PubmedArticleSet so it parses on its own.
+    A compressed file is a single shard, with no end, parsed whole.
+    """
+    file_name, start, end = shard
+    if end is None:
+        return [
+            retrieve_paper(paper_element)
+            for paper_element in load_xml_file(file_name).findall("PubmedArticle")
+        ]
+    with open(file_name, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    match = ARTICLE_START_PATTERN.search(data)
+    last = data.rfind(ARTICLE_END_TAG)
+    if match is None or last == -1:
+        return []
+    last += len(ARTICLE_END_TAG)
+    while last < len(data) and data[last : last + 1].isspace():
+        last += 1
+    body = data[match.start() : last]
+    root = ET.fromstring(b"<PubmedArticleSet>" + body + b"</PubmedArticleSet>")
+    return [
+        retrieve_paper(paper_element) for paper_element in root.findall("PubmedArticle")
+    ]
+
+
+def extract_data_from_files_in_parallel(
+    list_of_files: List[str], workers: int, shard_size: int = SHARD_SIZE
+) -> Iterator[Tuple[str, List[Paper]]]:
+    """
+    Parse files across a pool of worker processes.
+
+    Whole files are distributed across the workers, and files larger than
+    shard_size are split into shards that are parsed in parallel. Results
+    are yielded as (file name, papers) in file order, then shard order.
+    Compressed files cannot be split by byte offset, so are not sharded.
+    """
+    shards = []
+    for fn in list_of_files:
+        if is_compressed(fn):
+            shards.append((fn, 0, None))
+            continue
+        for start, end in find_shard_boundaries(fn, shard_size):
+            shards.append((fn, start, end))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for shard, papers in zip(shards, executor.map(parse_shard, shards)):
+            yield shard[0], papers
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed XML Parser")
+    parser.add_argument(
+        "--stream",
+        "-s",
+        action="store_true",
+        help="Parse files incrementally instead of loading each one in full",
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=1,
+        help="Number of worker processes to parse with (default: 1)",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=SHARD_SIZE // (1024 * 1024),
+        help="Size in MB above which a file is split across workers",
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write per-stage timings and counters to this JSON file",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Also run cProfile and tracemalloc, saving the profile next to the metrics",
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="XML files to parse (default: all XML files in the data directory)",
+    )
+    args = parser.parse_args(args)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.shard_size < 1:
+        parser.error("--shard-size must be at least 1")
+    if args.profile and not args.metrics:
+        args.metrics = METRICS_FILE
+    return args
+
+
+def main(
+    list_of_files: List[str],
+    stream: bool = False,
+    workers: int = 1,
+    shard_size: int = SHARD_SIZE,
+) -> None:
     """
     Main function.
     """
+    if workers > 1:
+        current = None
+        for fn, records in extract_data_from_files_in_parallel(
+            list_of_files, workers, shard_size
+        ):
+            if fn != current:
+                print(f"Processing {fn}")
+                current = fn
+            for record in records:
+                print(record.title)
+        return
     for fn in list_of_files:
         print(f"Processing {fn}")
-        for record in extract_data_from_file(fn):
+        for record in extract_data_from_file(fn, stream=stream):
             print(record.title)
 
 
 if __name__ == "__main__":
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.INFO)
     # glob the XML files in the data directory
-    list_of_files = glob(os.path.join(DATA_DIR, "*.xml"))
-    main(list_of_files)
+    list_of_files = args.files or find_xml_files()
+    if args.metrics:
+        METRICS.enable()
+    with profile(profile_file_name(args.metrics)) if args.profile else nullcontext():
+        main(
+            list_of_files,
+            stream=args.stream,
+            workers=args.workers,
+            shard_size=args.shard_size * 1024 * 1024,
+        )
+    if args.metrics:
+        METRICS.write(args.metrics)
+        logging.info("Metrics written to {}".format(args.metrics))
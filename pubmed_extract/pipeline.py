@@ -0,0 +1,336 @@
+"""
+Download, parse and store a Pubmed search in one pipelined command.
+
+Instead of downloading every record to a file with main.py and loading
+the file with database.py afterwards, the three stages run at the same
+time, connected by bounded asyncio queues:
+
+    fetch   efetch batches from the history server, in a thread pool
+    parse   ET.fromstring and retrieve_paper, in a process pool
+    store   insert_batch into the database, in a single thread
+
+A full queue makes the stage before it wait, so memory stays bounded and
+the end-to-end time approaches that of the slowest stage rather than the
+sum of all three.
+
+`usage: pipeline.py [-h] [--db DB] [--workers WORKERS] [--parse-workers PARSE_WORKERS]
+                   [--batch-size BATCH_SIZE] [--store-batch-size STORE_BATCH_SIZE]
+                   [--queue-size QUEUE_SIZE] [--metrics METRICS] [--verbose]
+                   author start_year [end_year]`
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import logging
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Tuple
+import xml.etree.ElementTree as ET
+
+import database
+from database import (
+    connect_to_database,
+    create_indexes,
+    create_tables,
+    drop_indexes,
+    insert_batch,
+    read_author_ids,
+    read_mesh_term_ids,
+    read_xml_codec,
+    train_xml_codec,
+)
+import main as downloader
+from metrics import METRICS
+from parse_xml import DB, Paper, retrieve_paper
+
+# marks the end of a queue's input
+DONE = None
+
+
+def parse_batch(xml: bytes) -> List[Paper]:
+    """
+    Parse an efetch response into papers, run in a worker process.
+    """
+    root = ET.fromstring(xml)
+    return [retrieve_paper(element) for element in root.findall("PubmedArticle")]
+
+
+class Store:
+    """
+    The database connection and id maps of the store stage. Every method
+    runs on the store thread, as sqlite connections belong to their thread.
+    """
+
+    def __init__(self, db_file: str):
+        self.connection: sqlite3.Connection = connect_to_database(db_file)
+        create_tables(self.connection)
+        self.defer_indexes = (
+            self.connection.execute("SELECT 1 FROM paper LIMIT 1").fetchone() is None
+        )
+        if self.defer_indexes:
+            drop_indexes(self.connection)
+        self.author_ids: Dict[Tuple[str, str], int] = read_author_ids(self.connection)
+        self.mesh_term_ids: Dict[str, int] = read_mesh_term_ids(self.connection)
+        self.codec = read_xml_codec(self.connection)
+
+    def insert(self, papers: List[Paper]) -> int:
+        with METRICS.time("store"):
+            if self.codec is None:
+                self.codec = train_xml_codec(self.connection, papers)
+            return insert_batch(
+                self.connection,
+                papers,
+                self.author_ids,
+                self.mesh_term_ids,
+                self.codec,
+            )
+
+    def finish(self) -> None:
+        create_indexes(self.connection, bulk_load=self.defer_indexes)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+async def fetch_stage(
+    urls: List[str], responses: asyncio.Queue, executor: Executor, workers: int
+) -> None:
+    """
+    Fetch the URLs with up to `workers` requests in flight, through the rate
+    limiter, and put each response on the responses queue as it arrives.
+    """
+    loop = asyncio.get_running_loop()
+    pending = list(reversed(urls))
+
+    async def fetcher() -> None:
+        while pending:
+            url = pending.pop()
+            logging.info("URL: {}".format(url))
+            data = await loop.run_in_executor(executor, downloader.fetch_url, url)
+            # waits here while the parse stage is behind
+            await responses.put(data)
+
+    await asyncio.gather(*(fetcher() for _ in range(workers)))
+
+
+async def parse_stage(
+    responses: asyncio.Queue, parsed: asyncio.Queue, executor: Executor, workers: int
+) -> None:
+    """
+    Parse responses from the responses queue in up to `workers` processes at once.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def parser() -> None:
+        while True:
+            data = await responses.get()
+            if data is DONE:
+                return
+            start = time.perf_counter()
+            papers = await loop.run_in_executor(executor, parse_batch, data)
+            METRICS.add_time("parse", time.perf_counter() - start)
+            METRICS.count("records", len(papers))
+            await parsed.put(papers)
+
+    await asyncio.gather(*(parser() for _ in range(workers)))
+
+
+async def store_stage(
+    parsed: asyncio.Queue, store: Store, executor: Executor, batch_size: int
+) -> int:
+    """
+    Insert the papers from the parsed queue, batch_size papers per transaction.
+    """
+    loop = asyncio.get_running_loop()
+    inserted = 0
+    batch: List[Paper] = []
+    while True:
+        papers = await parsed.get()
+        if papers is not DONE:
+            batch.extend(papers)
+        if batch and (papers is DONE or len(batch) >= batch_size):
+            inserted += await loop.run_in_executor(executor, store.insert, batch)
+            logging.debug("Inserted {} papers".format(inserted))
+            batch = []
+        if papers is DONE:
+            return inserted
+
+
+async def run_stages(
+    urls: List[str],
+    store: Store,
+    executors: Tuple[Executor, Executor, Executor],
+    workers: int,
+    parse_workers: int,
+    store_batch_size: int,
+    queue_size: int,
+) -> int:
+    """
+    Run the three stages concurrently and return the number of papers stored.
+    If any stage fails, the others are cancelled and the error is raised.
+    """
+    fetch_executor, parse_executor, store_executor = executors
+    responses = asyncio.Queue(maxsize=queue_size)
+    parsed = asyncio.Queue(maxsize=queue_size)
+
+    async def fetch() -> None:
+        await fetch_stage(urls, responses, fetch_executor, workers)
+        for _ in range(parse_workers):
+            await responses.put(DONE)
+
+    async def parse() -> None:
+        await parse_stage(responses, parsed, parse_executor, parse_workers)
+        await parsed.put(DONE)
+
+    tasks = [
+        asyncio.create_task(fetch()),
+        asyncio.create_task(parse()),
+        asyncio.create_task(
+            store_stage(parsed, store, store_executor, store_batch_size)
+        ),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # a failed stage would leave the others blocked on its queue
+        for task in tasks:
+            task.cancel()
+    return tasks[2].result()
+
+
+def run_pipeline(
+    query_string: str,
+    db_file: str = DB,
+    workers: int = 1,
+    parse_workers: int = 1,
+    batch_size: int = downloader.BATCH_SIZE,
+    store_batch_size: int = database.BATCH_SIZE,
+    queue_size: int = None,
+) -> int:
+    """
+    Download the records of a search into the database, fetching, parsing and
+    storing at the same time. Return the number of papers inserted or replaced.
+    """
+    count, webenv, querykey = downloader.get_count_of_papers_using_esearch(query_string)
+    urls = [
+        downloader.create_url_for_efetch(
+            i, batch_size, downloader.EMAIL, downloader.TOOL, webenv, querykey
+        )
+        for i in range(0, count, batch_size)
+    ]
+    queue_size = queue_size or 2 * max(workers, parse_workers)
+    with ThreadPoolExecutor(workers) as fetch_executor, ProcessPoolExecutor(
+        parse_workers
+    ) as parse_executor, ThreadPoolExecutor(1) as store_executor:
+        # created on the store thread, so the connection is used on one thread only
+        store = store_executor.submit(Store, db_file).result()
+        try:
+            inserted = asyncio.run(
+                run_stages(
+                    urls,
+                    store,
+                    (fetch_executor, parse_executor, store_executor),
+                    workers,
+                    parse_workers,
+                    store_batch_size,
+                    queue_size,
+                )
+            )
+            store_executor.submit(store.finish).result()
+            return inserted
+        finally:
+            store_executor.submit(store.close).result()
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed Download Pipeline")
+    parser.add_argument("--db", default=DB, help="Database file (default: %(default)s)")
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=1,
+        help="Number of batches to download at once (default: 1)",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        "-p",
+        type=int,
+        default=1,
+        help="Number of worker processes to parse with (default: 1)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        "-b",
+        type=int,
+        default=downloader.BATCH_SIZE,
+        help="Number of records per efetch request, at most {} (default: %(default)s)".format(
+            downloader.MAX_BATCH_SIZE
+        ),
+    )
+    parser.add_argument(
+        "--store-batch-size",
+        type=int,
+        default=database.BATCH_SIZE,
+        help="Number of papers written per transaction (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        help="Batches held between stages (default: twice the number of workers)",
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write per-stage timings, counters and latencies to this JSON file",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument("author", help="Author to search for")
+    parser.add_argument("start_year", type=int, help="Start year")
+    parser.add_argument("end_year", type=int, nargs="?", default=None, help="End year")
+    args = parser.parse_args(args)
+    if args.workers < 1 or args.parse_workers < 1:
+        parser.error("--workers and --parse-workers must be at least 1")
+    if not 1 <= args.batch_size <= downloader.MAX_BATCH_SIZE:
+        parser.error(
+            "--batch-size must be between 1 and {}".format(downloader.MAX_BATCH_SIZE)
+        )
+    if args.store_batch_size < 1:
+        parser.error("--store-batch-size must be at least 1")
+    if args.queue_size is not None and args.queue_size < 1:
+        parser.error("--queue-size must be at least 1")
+    return args
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    if args.metrics:
+        METRICS.enable()
+    query_string = downloader.prepare_query_string(
+        args.author, args.start_year, args.end_year
+    )
+    inserted = run_pipeline(
+        query_string,
+        args.db,
+        workers=args.workers,
+        parse_workers=args.parse_workers,
+        batch_size=args.batch_size,
+        store_batch_size=args.store_batch_size,
+        queue_size=args.queue_size,
+    )
+    logging.info("Stored {} papers".format(inserted))
+    if args.metrics:
+        METRICS.write(args.metrics)
+        logging.info("Metrics written to {}".format(args.metrics))
+
+
+if __name__ == "__main__":
+    main()
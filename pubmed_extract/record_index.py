@@ -0,0 +1,229 @@
+"""
+Byte-offset index for random access to the records in the XML files.
+
+Each XML file gets a sidecar index, "<file>.idx", built by scanning the
+file once. It holds a header recording the size and modification time of
+the XML file, followed by fixed-size (PMID, offset, length) entries sorted
+by PMID. Compressed files cannot be indexed, as the offsets must point
+into the file as stored. A lookup binary searches the memory-mapped index and parses only
+the slice of the memory-mapped XML file holding that record.
+
+`usage: record_index.py [-h] {build,get} ...`
+"""
+
+import argparse
+from glob import glob
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+from typing import Iterator, List, Optional, Tuple
+import xml.etree.ElementTree as ET
+
+from parse_xml import DATA_DIR, Paper, iterate_article_offsets, retrieve_paper
+
+INDEX_SUFFIX = ".idx"
+MAGIC = b"PMIDIDX1"
+# magic, size and modification time of the XML file, number of entries
+HEADER = struct.Struct("<8sQQQ")
+# PMID, offset and length of each record
+ENTRY = struct.Struct("<QQQ")
+PMID_PATTERN = re.compile(rb"<PMID[^>]*>\s*(\d+)\s*</PMID>")
+
+
+def index_file_name(file_name: str) -> str:
+    """
+    Name of the sidecar index for an XML file.
+    """
+    return file_name + INDEX_SUFFIX
+
+
+def iterate_pmid_offsets(file_name: str) -> Iterator[Tuple[int, int, int]]:
+    """
+    Yield (PMID, offset, length) for each record in an XML file.
+
+    The first PMID element in a record is the one in MedlineCitation,
+    so the PMID is read with a regular expression instead of parsing.
+    """
+    with open(file_name, "rb") as f:
+        for offset, length in iterate_article_offsets(file_name):
+            f.seek(offset)
+            match = PMID_PATTERN.search(f.read(length))
+            if match is None:
+                logging.warning(
+                    "No PMID in record at offset {} of {}".format(offset, file_name)
+                )
+                continue
+            yield int(match.group(1)), offset, length
+
+
+def build_index(file_name: str) -> int:
+    """
+    Scan an XML file once and write its sidecar index.
+    Return the number of records indexed.
+    """
+    stat = os.stat(file_name)
+    entries = sorted(iterate_pmid_offsets(file_name))
+    index_name = index_file_name(file_name)
+    # write then rename, so a reader never sees a partial index
+    with open(index_name + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns, len(entries)))
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+    os.replace(index_name + ".tmp", index_name)
+    return len(entries)
+
+
+def index_is_current(file_name: str) -> bool:
+    """
+    Check that the sidecar index exists and was built from the file as it is now.
+    """
+    try:
+        with open(index_file_name(file_name), "rb") as f:
+            magic, size, mtime_ns, count = HEADER.unpack(f.read(HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return False
+    stat = os.stat(file_name)
+    return magic == MAGIC and size == stat.st_size and mtime_ns == stat.st_mtime_ns
+
+
+class IndexedFile:
+    """
+    An XML file and its sidecar index, both memory-mapped.
+    """
+
+    def __init__(self, file_name: str):
+        if not index_is_current(file_name):
+            build_index(file_name)
+        self.file_name = file_name
+        with open(index_file_name(file_name), "rb") as f:
+            self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = HEADER.unpack_from(self.index)[3]
+        self.data = b""
+        if self.count:
+            with open(file_name, "rb") as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def find(self, pmid: int) -> Optional[Tuple[int, int]]:
+        """
+        Binary search the index for a PMID and return (offset, length), or None.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry_pmid, offset, length = ENTRY.unpack_from(
+                self.index, HEADER.size + middle * ENTRY.size
+            )
+            if entry_pmid < pmid:
+                low = middle + 1
+            elif entry_pmid > pmid:
+                high = middle
+            else:
+                return offset, length
+        return None
+
+    def close(self) -> None:
+        """
+        Unmap the file and its index.
+        """
+        self.index.close()
+        if self.count:
+            self.data.close()
+
+
+class RecordIndex:
+    """
+    Point lookups of papers by PMID across a set of indexed XML files.
+    Sidecar indexes that are missing or out of date are rebuilt on opening.
+    """
+
+    def __init__(self, list_of_files: List[str]):
+        self.files = [IndexedFile(file_name) for file_name in list_of_files]
+
+    def locate(self, pmid: int) -> Optional[Tuple[str, int, int]]:
+        """
+        Return (file name, offset, length) of the record for a PMID, or None.
+        """
+        for indexed in self.files:
+            found = indexed.find(pmid)
+            if found is not None:
+                return (indexed.file_name, *found)
+        return None
+
+    def get(self, pmid: int) -> Optional[Paper]:
+        """
+        Parse and return the paper with the given PMID, or None if it is not indexed.
+        """
+        for indexed in self.files:
+            found = indexed.find(pmid)
+            if found is not None:
+                offset, length = found
+                return retrieve_paper(
+                    ET.fromstring(indexed.data[offset : offset + length])
+                )
+        return None
+
+    def close(self) -> None:
+        """
+        Unmap every file and index.
+        """
+        for indexed in self.files:
+            indexed.close()
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed Record Index")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Build the sidecar indexes")
+    build.add_argument(
+        "files",
+        nargs="*",
+        help="XML files to index (default: all XML files in the data directory)",
+    )
+    get = subparsers.add_parser("get", help="Look up papers by PMID")
+    get.add_argument("pmids", type=int, nargs="+", help="PMIDs to look up")
+    get.add_argument(
+        "--files",
+        nargs="*",
+        default=[],
+        help="XML files to search (default: all XML files in the data directory)",
+    )
+    return parser.parse_args(args)
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    list_of_files = args.files or sorted(glob(os.path.join(DATA_DIR, "*.xml")))
+    try:
+        if args.command == "build":
+            for fn in list_of_files:
+                count = build_index(fn)
+                logging.info("Indexed {} records in {}".format(count, fn))
+            return
+        index = RecordIndex(list_of_files)
+    except ValueError as error:
+        logging.error(error)
+        sys.exit(1)
+    try:
+        for pmid in args.pmids:
+            paper = index.get(pmid)
+            if paper is None:
+                logging.error("PMID not found: {}".format(pmid))
+                continue
+            print(paper.quick_summary)
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Full-text search over the titles, abstracts and MeSH terms in the database.
+
+The paper_search FTS5 table is filled by database.py as papers are loaded.
+Queries use the FTS5 syntax: words, "quoted phrases", prefix* terms,
+AND/OR/NOT and column filters such as title:equity. Results are ranked
+with BM25, weighting title and MeSH matches above abstract matches, and
+can be restricted to papers indexed with given MeSH terms.
+
+`usage: search.py [-h] [--db DB] [--mesh MESH] [--limit LIMIT] [--rebuild] [query]`
+"""
+
+import argparse
+from dataclasses import dataclass
+import logging
+import sqlite3
+import sys
+from typing import List
+
+from database import connect_to_database, create_tables
+from parse_xml import DB
+
+LIMIT = 20
+# BM25 weights of the title, abstract and mesh_terms columns
+WEIGHTS = (10.0, 1.0, 5.0)
+
+
+@dataclass
+class SearchResult:
+    pmid: int
+    title: str
+    pub_date: str
+    journal_abbreviation: str
+    score: float
+    snippet: str
+
+
+def search(
+    connection: sqlite3.Connection,
+    query: str,
+    mesh_terms: List[str] = (),
+    limit: int = LIMIT,
+) -> List[SearchResult]:
+    """
+    Return the papers matching an FTS5 query, best match first, restricted
+    to papers indexed with every one of the given MeSH terms.
+    """
+    sql = """SELECT paper.pmid, paper.title, paper.pub_date, paper.journal_abbreviation,
+            bm25(paper_search, ?, ?, ?) AS score,
+            snippet(paper_search, 1, '[', ']', '...', 16)
+        FROM paper_search JOIN paper ON paper.pmid = paper_search.rowid
+        WHERE paper_search MATCH ?"""
+    parameters = [*WEIGHTS, query]
+    for term in mesh_terms:
+        sql += """ AND paper_search.rowid IN (
+            SELECT paper_id FROM paper_mesh_term
+            JOIN mesh_term ON mesh_term.id = paper_mesh_term.mesh_term_id
+            WHERE mesh_term.term = ?)"""
+        parameters.append(term)
+    sql += " ORDER BY score LIMIT ?"
+    parameters.append(limit)
+    return [SearchResult(*row) for row in connection.execute(sql, parameters)]
+
+
+def rebuild_search_index(connection: sqlite3.Connection) -> int:
+    """
+    Refill the full-text index from the papers already in the database,
+    for databases loaded before it existed. Return the number of papers indexed.
+    """
+    connection.execute("BEGIN")
+    connection.execute("DELETE FROM paper_search")
+    connection.execute("""INSERT INTO paper_search (rowid, title, abstract, mesh_terms)
+        SELECT paper.pmid, paper.title, paper.abstract,
+            (SELECT group_concat(mesh_term.term, '; ') FROM paper_mesh_term
+             JOIN mesh_term ON mesh_term.id = paper_mesh_term.mesh_term_id
+             WHERE paper_mesh_term.paper_id = paper.pmid)
+        FROM paper""")
+    connection.execute("INSERT INTO paper_search (paper_search) VALUES ('optimize')")
+    connection.execute("COMMIT")
+    return connection.execute("SELECT count(*) FROM paper_search").fetchone()[0]
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Pubmed Full-Text Search")
+    parser.add_argument("--db", default=DB, help="Database file (default: %(default)s)")
+    parser.add_argument(
+        "--mesh",
+        "-m",
+        action="append",
+        default=[],
+        help="Only return papers with this MeSH term (may be repeated)",
+    )
+    parser.add_argument(
+        "--limit",
+        "-n",
+        type=int,
+        default=LIMIT,
+        help="Maximum number of results (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Rebuild the search index from the papers in the database",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument(
+        "query",
+        nargs="?",
+        help="Search query in FTS5 syntax, e.g. '\"health equity\" polic*'",
+    )
+    args = parser.parse_args(args)
+    if not args.query and not args.rebuild:
+        parser.error("a query is required unless --rebuild is given")
+    return args
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    connection = connect_to_database(args.db)
+    try:
+        create_tables(connection)
+        if args.rebuild:
+            count = rebuild_search_index(connection)
+            logging.info("Indexed {} papers".format(count))
+        if not args.query:
+            return
+        try:
+            results = search(connection, args.query, args.mesh, args.limit)
+        except sqlite3.OperationalError as error:
+            logging.error("Invalid query: {}".format(error))
+            sys.exit(1)
+    finally:
+        connection.close()
+    for result in results:
+        print(
+            "{} - {} - {} - {}".format(
+                result.pmid, result.pub_date, result.title, result.journal_abbreviation
+            )
+        )
+        if result.snippet:
+            print("    {}".format(result.snippet))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Materialized paper counts by year, year and journal, and year and MeSH term.
+
+The counts for a set of papers are collected into a Summary in a single
+pass, and added to (or, for replaced papers, subtracted from) the summary
+tables in the database, so the tables stay current as papers are loaded.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+import re
+import sqlite3
+from typing import Iterable, List, Optional, Tuple
+
+YEAR_PATTERN = re.compile(r"\d{4}")
+
+TABLES = [
+    """CREATE TABLE IF NOT EXISTS year_count (
+        year TEXT PRIMARY KEY,
+        papers INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS year_journal_count (
+        year TEXT NOT NULL,
+        journal TEXT NOT NULL,
+        papers INTEGER NOT NULL,
+        PRIMARY KEY (year, journal)
+    )""",
+    """CREATE TABLE IF NOT EXISTS year_mesh_term_count (
+        year TEXT NOT NULL,
+        mesh_term TEXT NOT NULL,
+        papers INTEGER NOT NULL,
+        PRIMARY KEY (year, mesh_term)
+    )""",
+]
+
+
+@dataclass
+class Summary:
+    years: Counter = field(default_factory=Counter)
+    year_journals: Counter = field(default_factory=Counter)
+    year_mesh_terms: Counter = field(default_factory=Counter)
+
+
+def year_of_publication(year: Optional[str], pub_date: Optional[str]) -> str:
+    """
+    Return the year of publication, taken from the MedlineDate in pub_date
+    (e.g. "2021 Nov-Dec") when the record has no separate year.
+    """
+    if year:
+        return year
+    match = YEAR_PATTERN.search(pub_date or "")
+    return match.group() if match else "Unknown"
+
+
+def summarize(
+    rows: Iterable[Tuple[Optional[str], Optional[str], Optional[str], List[str]]],
+) -> Summary:
+    """
+    Count papers given as (year, pub_date, journal, mesh_terms) in a single pass.
+    """
+    summary = Summary()
+    for year, pub_date, journal, mesh_terms in rows:
+        year = year_of_publication(year, pub_date)
+        summary.years[year] += 1
+        summary.year_journals[(year, journal or "Unknown")] += 1
+        for term in set(mesh_terms):
+            summary.year_mesh_terms[(year, term)] += 1
+    return summary
+
+
+def summarize_papers(papers: Iterable) -> Summary:
+    """
+    Count Paper records in a single pass.
+    """
+    return summarize(
+        (paper.year, paper.pub_date, paper.journal, paper.mesh_terms)
+        for paper in papers
+    )
+
+
+def apply_summary(
+    connection: sqlite3.Connection, summary: Summary, sign: int = 1
+) -> None:
+    """
+    Add the counts in a summary to the summary tables, or subtract them
+    with sign=-1. Run inside the transaction that changes the papers.
+    """
+    connection.executemany(
+        """INSERT INTO year_count VALUES (?, ?)
+        ON CONFLICT (year) DO UPDATE SET papers = papers + excluded.papers""",
+        [(year, sign * count) for year, count in summary.years.items()],
+    )
+    connection.executemany(
+        """INSERT INTO year_journal_count VALUES (?, ?, ?)
+        ON CONFLICT (year, journal) DO UPDATE SET papers = papers + excluded.papers""",
+        [(*key, sign * count) for key, count in summary.year_journals.items()],
+    )
+    connection.executemany(
+        """INSERT INTO year_mesh_term_count VALUES (?, ?, ?)
+        ON CONFLICT (year, mesh_term) DO UPDATE SET papers = papers + excluded.papers""",
+        [(*key, sign * count) for key, count in summary.year_mesh_terms.items()],
+    )
+    if sign < 0:
+        for table in ("year_count", "year_journal_count", "year_mesh_term_count"):
+            connection.execute(f"DELETE FROM {table} WHERE papers <= 0")
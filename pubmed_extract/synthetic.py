@@ -0,0 +1,240 @@
+"""
+Generate synthetic PubMed XML files for benchmarking.
+
+The records have the structure retrieve_paper reads, with field
+distributions close to those of real PubMed search results: a few
+authors per paper with a long tail of large author lists, most authors
+with an affiliation, abstracts of a few hundred words, around ten MeSH
+terms, and reference lists on most papers. Generation is seeded, so the
+same arguments always produce the same file.
+
+`usage: synthetic.py [-h] [--count COUNT] [--seed SEED] output`
+"""
+
+import argparse
+import logging
+import random
+import sys
+from typing import TextIO
+from xml.sax.saxutils import escape
+
+SEED = 2022
+FIRST_PMID = 20000000
+
+SURNAMES = [
+    "Smith", "Marmot", "Allen", "Goldblatt", "Wang", "Li", "Zhang", "Garcia",
+    "Müller", "Nguyen", "Kumar", "O'Brien", "de Negri", "van der Berg", "Silva",
+    "Kim", "Tanaka", "Rossi", "Dubois", "Kowalski", "Johansson", "Okafor",
+    "Hernández", "Cohen", "Ivanova", "Patel", "Ahmed", "Murphy", "Novak", "Bell",
+]  # fmt: skip
+FORENAMES = [
+    "Michael", "Jessica", "Peter", "Wei", "Maria", "Jean-Paul", "Anna Maria",
+    "Ruth", "Ahmed", "Yuki", "Shekhar", "Ellen", "John", "Li", "Olga", "Chinedu",
+    "Sofia", "Lars", "Priya", "Paulo",
+]  # fmt: skip
+INSTITUTIONS = [
+    "Department of Epidemiology and Public Health, University College London, London, UK.",
+    "UCL Institute of Health Equity, London, England.",
+    "School of Public Health, Harvard University, Boston, MA, USA.",
+    "Karolinska Institutet, Stockholm, Sweden.",
+    "Department of Medicine, University of Tokyo, Tokyo, Japan.",
+    "Fiocruz, Rio de Janeiro, Brazil.",
+    "Institute of Psychiatry, King's College London, London, UK.",
+    "Faculty of Medicine, University of Lagos, Lagos, Nigeria.",
+]
+JOURNALS = [
+    ("The Lancet", "Lancet", 0.15),
+    ("BMJ (Clinical research ed.)", "BMJ", 0.15),
+    ("Bulletin of the World Health Organization", "Bull World Health Organ", 0.1),
+    ("PloS one", "PLoS One", 0.25),
+    ("The New England journal of medicine", "N Engl J Med", 0.05),
+    ("International journal of epidemiology", "Int J Epidemiol", 0.1),
+    ("Social science & medicine (1982)", "Soc Sci Med", 0.2),
+]
+MESH_TERMS = [
+    "Humans", "Female", "Male", "Adult", "Middle Aged", "Aged", "Health Equity",
+    "Health Policy", "Socioeconomic Factors", "Social Determinants of Health",
+    "COVID-19", "Pandemics", "Mental Health", "Cohort Studies", "Risk Factors",
+    "Life Expectancy", "Public Health", "United Kingdom", "Sustainable Development",
+    "Health Status Disparities", "Poverty", "Child", "Adolescent", "Income",
+]  # fmt: skip
+WORDS = (
+    "health equity social determinants policy population mortality income "
+    "education cohort risk exposure outcome intervention survey analysis "
+    "inequality life expectancy children adults disease prevention community "
+    "evidence association increase decrease national regional study data"
+).split()
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]  # fmt: skip
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def write_author(out: TextIO, rng: random.Random) -> None:
+    out.write('<Author ValidYN="Y">')
+    if rng.random() < 0.02:
+        out.write(
+            "<CollectiveName>{} Study Group</CollectiveName>".format(
+                escape(rng.choice(MESH_TERMS))
+            )
+        )
+    else:
+        forename = rng.choice(FORENAMES)
+        initials = "".join(part[0] for part in forename.replace("-", " ").split())
+        out.write(
+            "<LastName>{}</LastName><ForeName>{}</ForeName><Initials>{}</Initials>".format(
+                escape(rng.choice(SURNAMES)), escape(forename), initials
+            )
+        )
+        if rng.random() < 0.8:
+            out.write(
+                "<AffiliationInfo><Affiliation>{}</Affiliation></AffiliationInfo>".format(
+                    escape(rng.choice(INSTITUTIONS))
+                )
+            )
+    out.write("</Author>\n")
+
+
+def write_article(out: TextIO, rng: random.Random, pmid: int) -> None:
+    """
+    Write one PubmedArticle element.
+    """
+    journal, abbreviation, _ = rng.choices(
+        JOURNALS, weights=[weight for *_, weight in JOURNALS]
+    )[0]
+    year = rng.randint(1990, 2022)
+    out.write('<PubmedArticle>\n<MedlineCitation Status="MEDLINE" Owner="NLM">\n')
+    out.write('<PMID Version="1">{}</PMID>\n'.format(pmid))
+    out.write(
+        '<Article PubModel="Print">\n<Journal>\n<JournalIssue CitedMedium="Print">\n'
+    )
+    out.write("<Volume>{}</Volume>\n<PubDate>".format(rng.randint(1, 400)))
+    if rng.random() < 0.05:
+        month = rng.randrange(11)
+        out.write(
+            "<MedlineDate>{} {}-{}</MedlineDate>".format(
+                year, MONTHS[month], MONTHS[month + 1]
+            )
+        )
+    else:
+        out.write("<Year>{}</Year>".format(year))
+        if rng.random() < 0.9:
+            out.write("<Month>{}</Month>".format(rng.choice(MONTHS)))
+            if rng.random() < 0.7:
+                out.write("<Day>{:02d}</Day>".format(rng.randint(1, 28)))
+    out.write("</PubDate>\n</JournalIssue>\n")
+    out.write(
+        "<Title>{}</Title>\n<ISOAbbreviation>{}</ISOAbbreviation>\n</Journal>\n".format(
+            escape(journal), escape(abbreviation)
+        )
+    )
+    out.write(
+        "<ArticleTitle>{}</ArticleTitle>\n".format(sentence(rng, rng.randint(6, 20)))
+    )
+    if rng.random() < 0.8:
+        first_page = rng.randint(1, 2000)
+        out.write(
+            "<Pagination><MedlinePgn>{}-{}</MedlinePgn></Pagination>\n".format(
+                first_page, first_page + rng.randint(1, 15)
+            )
+        )
+    if rng.random() < 0.85:
+        out.write(
+            '<ELocationID EIdType="doi" ValidYN="Y">10.{}/{}</ELocationID>\n'.format(
+                rng.randint(1000, 9999), pmid
+            )
+        )
+    if rng.random() < 0.85:
+        # abstract lengths are skewed: mostly 150-300 words, some much longer
+        words = min(int(rng.lognormvariate(5.3, 0.4)), 1000)
+        out.write(
+            "<Abstract><AbstractText>{}</AbstractText></Abstract>\n".format(
+                " ".join(sentence(rng, 15) for _ in range(max(words // 15, 1)))
+            )
+        )
+    # author counts are skewed too: a median of about five, a few very large
+    out.write('<AuthorList CompleteYN="Y">\n')
+    for _ in range(min(max(int(rng.lognormvariate(1.6, 0.8)), 1), 200)):
+        write_author(out, rng)
+    out.write("</AuthorList>\n<Language>eng</Language>\n</Article>\n")
+    mesh_count = min(max(int(rng.gauss(10, 4)), 0), len(MESH_TERMS))
+    if mesh_count:
+        out.write("<MeshHeadingList>\n")
+        for term in rng.sample(MESH_TERMS, mesh_count):
+            out.write(
+                '<MeshHeading><DescriptorName MajorTopicYN="N">{}</DescriptorName></MeshHeading>\n'.format(
+                    escape(term)
+                )
+            )
+        out.write("</MeshHeadingList>\n")
+    out.write("</MedlineCitation>\n<PubmedData>\n<ArticleIdList>\n")
+    out.write(
+        '<ArticleId IdType="pubmed">{}</ArticleId>\n</ArticleIdList>\n'.format(pmid)
+    )
+    if rng.random() < 0.6:
+        out.write("<ReferenceList>\n")
+        for _ in range(min(int(rng.expovariate(1 / 30)) + 1, 300)):
+            out.write(
+                "<Reference><Citation>{} {};{}:{}</Citation>"
+                '<ArticleIdList><ArticleId IdType="pubmed">{}</ArticleId></ArticleIdList>'
+                "</Reference>\n".format(
+                    escape(rng.choice(JOURNALS)[1]),
+                    rng.randint(1970, year),
+                    rng.randint(1, 400),
+                    rng.randint(1, 2000),
+                    rng.randint(FIRST_PMID // 2, pmid),
+                )
+            )
+        out.write("</ReferenceList>\n")
+    out.write("</PubmedData>\n</PubmedArticle>\n")
+
+
+def generate_corpus(file_name: str, count: int, seed: int = SEED) -> None:
+    """
+    Write a PubmedArticleSet of count synthetic articles to a file.
+    """
+    rng = random.Random(seed)
+    with open(file_name, "w", encoding="utf-8") as out:
+        out.write('<?xml version="1.0" ?>\n<!DOCTYPE PubmedArticleSet>\n')
+        out.write("<PubmedArticleSet>\n")
+        for i in range(count):
+            write_article(out, rng, FIRST_PMID + i)
+        out.write("</PubmedArticleSet>\n")
+
+
+def parse_and_validate_args(args: list) -> argparse.Namespace:
+    """
+    Parse and validate the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Synthetic Pubmed XML Generator")
+    parser.add_argument(
+        "--count",
+        "-n",
+        type=int,
+        default=10000,
+        help="Number of articles to generate (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=SEED, help="Random seed (default: %(default)s)"
+    )
+    parser.add_argument("output", help="XML file to write")
+    args = parser.parse_args(args)
+    if args.count < 1:
+        parser.error("--count must be at least 1")
+    return args
+
+
+def main():
+    """
+    Main function.
+    """
+    args = parse_and_validate_args(sys.argv[1:])
+    logging.basicConfig(level=logging.INFO)
+    generate_corpus(args.output, args.count, args.seed)
+    logging.info("Wrote {} articles to {}".format(args.count, args.output))
+
+
+if __name__ == "__main__":
+    main()
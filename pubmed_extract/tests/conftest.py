@@ -0,0 +1,103 @@
+"""
+Shared fixtures: a small synthetic corpus, a stub E-utilities server
+serving it (see benchmark.py), and main.py pointed at that server.
+"""
+
+import http.server
+import os
+import re
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from benchmark import start_stub_server  # noqa: E402
+import http_client  # noqa: E402
+import main as downloader  # noqa: E402
+from parse_xml import iterate_article_offsets  # noqa: E402
+from synthetic import generate_corpus  # noqa: E402
+
+CORPUS_SIZE = 120
+
+
+@pytest.fixture(scope="session")
+def corpus(tmp_path_factory) -> str:
+    file_name = str(tmp_path_factory.mktemp("corpus") / "synthetic.xml")
+    generate_corpus(file_name, CORPUS_SIZE)
+    return file_name
+
+
+def revise_article(article: bytes) -> bytes:
+    """
+    A revision of an article: a new title, and a year of publication of 1980.
+    """
+    article = article.replace(b"<ArticleTitle>", b"<ArticleTitle>Revised ", 1)
+    return re.sub(rb"<Year>\d{4}</Year>", b"<Year>1980</Year>", article, count=1)
+
+
+@pytest.fixture(scope="session")
+def revise():
+    """
+    Copy a corpus, revising the articles in positions [start, stop).
+    """
+
+    def copy(source: str, target: str, start: int, stop: int) -> str:
+        with open(source, "rb") as f:
+            data = f.read()
+        pieces = []
+        position = 0
+        offsets = list(iterate_article_offsets(source))
+        for offset, length in offsets[start:stop]:
+            pieces.append(data[position:offset])
+            pieces.append(revise_article(data[offset : offset + length]))
+            position = offset + length
+        pieces.append(data[position:])
+        with open(target, "wb") as f:
+            f.write(b"".join(pieces))
+        return target
+
+    return copy
+
+
+@pytest.fixture(scope="session")
+def stub_url(corpus) -> str:
+    server = start_stub_server(corpus)
+    yield "http://127.0.0.1:{}".format(server.server_address[1])
+    server.shutdown()
+
+
+@pytest.fixture
+def eutils(stub_url, monkeypatch) -> str:
+    """
+    Point main.py at the stub server, with no rate limit, cache or API key.
+    """
+    monkeypatch.setattr(downloader, "EUTILS_URL", stub_url)
+    monkeypatch.setattr(downloader, "RATE_LIMITER", downloader.TokenBucket(1000, 1000))
+    monkeypatch.setattr(downloader, "CACHE", None)
+    monkeypatch.setattr(downloader, "API_KEY", None)
+    for name in ("http_proxy", "https_proxy", "HTTP_PROXY", "HTTPS_PROXY"):
+        monkeypatch.delenv(name, raising=False)
+    yield stub_url
+    http_client.POOL.close()
+
+
+@pytest.fixture
+def serve():
+    """
+    Start servers for a test's own request handlers on free local ports,
+    shutting them down after the test.
+    """
+    servers = []
+
+    def start(handler: type) -> str:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return "http://127.0.0.1:{}".format(server.server_address[1])
+
+    yield start
+    for server in servers:
+        server.shutdown()
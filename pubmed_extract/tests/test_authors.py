@@ -0,0 +1,111 @@
+"""
+Author resolution: name variants of one person are merged within their
+block, different people sharing a block are kept apart, and ids are stable
+across runs.
+"""
+
+from itertools import chain
+
+import authors
+import database
+from authors import block_key, make_occurrences, resolve, split_name
+
+UCL = "UCL Institute of Health Equity, London, England."
+TOKYO = "Department of Medicine, University of Tokyo, Tokyo, Japan."
+KAROLINSKA = "Karolinska Institutet, Stockholm, Sweden."
+
+
+def occurrences(*papers) -> list:
+    """
+    The occurrences of papers given as lists of (name, affiliation), with
+    the position of each paper in the arguments as its id.
+    """
+    return list(
+        chain.from_iterable(
+            make_occurrences(paper_id, paper) for paper_id, paper in enumerate(papers)
+        )
+    )
+
+
+def resolved_names(resolved: list) -> list:
+    return sorted(
+        sorted(occurrence.name for occurrence in author.occurrences)
+        for author in resolved
+    )
+
+
+def test_names_are_split_and_blocked():
+    assert split_name("de Negri Armando A") == ("de Negri", "Armando", "A")
+    assert split_name("Garcia Jean-Paul JP") == ("Garcia", "Jean-Paul", "JP")
+    assert split_name("Health Equity Study Group (Collective)")[1:] == ("", "")
+    assert block_key("Müller", "J") == block_key("Muller", "JA") == "muller j"
+    assert block_key("O'Brien", "M") == "obrien m"
+
+
+def test_variants_with_shared_evidence_are_merged():
+    resolved = resolve(
+        occurrences(
+            [("Marmot Michael M", UCL), ("Allen Jessica J", UCL), ("Bell Ruth R", UCL)],
+            [("Marmot M", UCL)],
+            # no affiliations, but the same co-authors
+            [("Allen Jessica J", None), ("Bell Ruth R", None), ("Marmot M", None)],
+        )
+    )
+    marmot = [author for author in resolved if author.block == "marmot m"]
+    assert len(marmot) == 1
+    assert marmot[0].name == "Marmot M"
+    assert [o.paper_id for o in marmot[0].occurrences] == [0, 1, 2]
+    assert resolved_names(resolved) == [
+        ["Allen Jessica J", "Allen Jessica J"],
+        ["Bell Ruth R", "Bell Ruth R"],
+        ["Marmot M", "Marmot M", "Marmot Michael M"],
+    ]
+
+
+def test_conflicting_names_and_missing_evidence_are_split():
+    resolved = resolve(
+        occurrences(
+            [("Marmot Michael M", UCL)],
+            # a different forename at the same institution
+            [("Marmot Mark M", UCL)],
+            # middle initials that differ
+            [("Marmot Michael G MG", UCL)],
+            [("Marmot Michael A MA", TOKYO)],
+            # a compatible name with nothing in common
+            [("Marmot M", KAROLINSKA)],
+        )
+    )
+    assert resolved_names(resolved) == [
+        ["Marmot M"],
+        ["Marmot Mark M"],
+        ["Marmot Michael A MA"],
+        ["Marmot Michael G MG", "Marmot Michael M"],
+    ]
+    assert {author.block for author in resolved} == {"marmot m"}
+
+
+def test_ids_are_kept_across_runs(corpus, tmp_path):
+    db = str(tmp_path / "pubmed.db")
+    database.load_files([corpus], db)
+    connection = database.connect_to_database(db)
+    try:
+        first = authors.resolve_authors_in_database(connection)
+        assert len({author.id for author in first}) == len(first)
+        (stored,) = connection.execute(
+            "SELECT count(*) FROM author_occurrence"
+        ).fetchone()
+        (loaded,) = connection.execute("SELECT count(*) FROM author_paper").fetchone()
+        assert stored == loaded == sum(len(author.occurrences) for author in first)
+        second = authors.resolve_authors_in_database(connection)
+    finally:
+        connection.close()
+    ids = {
+        (o.paper_id, o.position): author.id
+        for author in first
+        for o in author.occurrences
+    }
+    assert all(
+        ids[(o.paper_id, o.position)] == author.id
+        for author in second
+        for o in author.occurrences
+    )
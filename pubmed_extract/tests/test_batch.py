@@ -0,0 +1,139 @@
+"""
+Batch downloads: PMIDs are paged off the history server past the esearch
+limit, each paper is fetched once across searches, and counts-only runs
+ask for counts alone.
+"""
+
+import http.server
+import json
+import re
+import urllib.parse
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import batch
+import main as downloader
+
+LIMIT = 10
+# the PMIDs and years of publication of each author's papers
+PAPERS = {
+    "Smith J": {pmid: 2000 + pmid % 3 for pmid in range(1, 26)},
+    "Marmot M": {pmid: 2001 for pmid in range(15, 38)},
+}
+
+
+class PubmedHandler(http.server.BaseHTTPRequestHandler):
+    """
+    E-utilities over PAPERS: esearch returns at most the first LIMIT ids,
+    the rest can only be paged with efetch rettype=uilist.
+    """
+
+    protocol_version = "HTTP/1.1"
+    paths = []
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def matching(self, term: str) -> list:
+        author = term[1 : term.index(")")]
+        start, end = map(int, re.findall(r'"(\d{4})"\[Date', term))
+        return [
+            str(pmid)
+            for pmid, year in PAPERS.get(author, {}).items()
+            if start <= year <= end
+        ]
+
+    def do_GET(self) -> None:
+        self.paths.append(self.path)
+        path, _, query = self.path.partition("?")
+        parameters = dict(urllib.parse.parse_qsl(query))
+        if path.endswith("esearch.fcgi"):
+            pmids = self.matching(parameters["term"])
+            ids = (
+                ""
+                if parameters.get("rettype") == "count"
+                else "".join(
+                    "<Id>{}</Id>".format(pmid)
+                    for pmid in pmids[: min(int(parameters.get("retmax", 20)), LIMIT)]
+                )
+            )
+            body = (
+                "<eSearchResult><Count>{}</Count><IdList>{}</IdList>"
+                "<WebEnv>{}</WebEnv><QueryKey>1</QueryKey></eSearchResult>"
+            ).format(len(pmids), ids, urllib.parse.quote(parameters["term"]))
+        elif parameters.get("rettype") == "uilist":
+            pmids = self.matching(urllib.parse.unquote(parameters["WebEnv"]))
+            start = int(parameters["retstart"])
+            body = "\n".join(pmids[start : start + int(parameters["retmax"])]) + "\n"
+        else:
+            body = "<PubmedArticleSet>{}</PubmedArticleSet>".format(
+                "".join(
+                    "<PubmedArticle><MedlineCitation><PMID>{}</PMID>"
+                    "</MedlineCitation></PubmedArticle>".format(pmid)
+                    for pmid in parameters["id"].split(",")
+                )
+            )
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def pubmed(eutils, serve, monkeypatch) -> type:
+    handler = type("Handler", (PubmedHandler,), {"paths": []})
+    monkeypatch.setattr(downloader, "EUTILS_URL", serve(handler))
+    monkeypatch.setattr(batch, "MAX_IDS_PER_SEARCH", LIMIT)
+    return handler
+
+
+def query(author: str) -> str:
+    return downloader.prepare_query_string(author, 2000, 2022)
+
+
+def test_pmids_past_the_esearch_limit_are_paged(pubmed):
+    assert batch.search_pmids(query("Smith J")) == [str(p) for p in range(1, 26)]
+    pages = [p for p in pubmed.paths if "rettype=uilist" in p]
+    assert [re.search(r"retstart=(\d+)", p).group(1) for p in pages] == ["10", "20"]
+
+
+def test_searches_within_the_limit_are_not_paged(pubmed):
+    assert batch.search_pmids(
+        downloader.prepare_query_string("Smith J", 2000, 2000)
+    ) == [str(p) for p in range(3, 26, 3)]
+    assert len(pubmed.paths) == 1
+
+
+def test_each_paper_is_fetched_once(pubmed, tmp_path, monkeypatch):
+    queries = tmp_path / "queries.tsv"
+    queries.write_text("# author\tstart\tend\nSmith J\t2000\t2022\nMarmot M\t2000\n")
+    output = str(tmp_path / "records.xml")
+    monkeypatch.setattr(
+        "sys.argv",
+        ["batch.py", str(queries), "--output", output, "--batch-size", "7"],
+    )
+    batch.main()
+    with open(output, "rb") as f:
+        pmids = [e.text for e in ET.parse(f).getroot().iter("PMID")]
+    assert pmids == [str(p) for p in range(1, 38)]
+    fetched = [
+        pmid
+        for path in pubmed.paths
+        for name, value in urllib.parse.parse_qsl(urllib.parse.urlsplit(path).query)
+        if name == "id"
+        for pmid in value.split(",")
+    ]
+    assert sorted(fetched, key=int) == pmids
+    with open(output + ".queries.json") as f:
+        mapping = json.load(f)
+    assert mapping["count"] == len(pmids)
+    assert [len(s["pmids"]) for s in mapping["searches"]] == [25, 23]
+
+
+def test_counts_only_asks_for_counts_per_year(pubmed):
+    rows = downloader.count_papers_per_year("Smith J", 2000, 2003, workers=2)
+    assert rows == [(2000, 8), (2001, 9), (2002, 8), (2003, 0)]
+    assert len(pubmed.paths) == 4
+    assert all("rettype=count" in p and "usehistory" not in p for p in pubmed.paths)
@@ -0,0 +1,175 @@
+"""
+The on-disk response cache: TTL expiry, LRU eviction, offline mode, and
+how main.py keys and filters what it caches.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from cache import OfflineCacheMiss, ResponseCache
+import main as downloader
+
+
+def age(cache: ResponseCache, key: str, seconds: float) -> None:
+    """
+    Make an entry look as if it was written and last read `seconds` ago.
+    """
+    then = time.time() - seconds
+    os.utime(cache.path(key), (then, then))
+
+
+def test_get_returns_what_was_put(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.get("a") is None
+    cache.put("a", b"response")
+    assert cache.get("a") == b"response"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.put("a", b"response")
+    age(cache, "a", 30)
+    assert cache.get("a") == b"response"
+    age(cache, "a", 90)
+    assert cache.get("a") is None
+    # a longer ttl for this read only
+    assert cache.get("a", ttl=120) == b"response"
+
+
+def test_reading_does_not_refresh_the_age(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.put("a", b"response")
+    age(cache, "a", 50)
+    cache.get("a")
+    assert time.time() - os.path.getmtime(cache.path("a")) >= 50
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=350)
+    for key, seconds in (("old", 300), ("read", 200), ("new", 100)):
+        cache.put(key, b"x" * 100)
+        age(cache, key, seconds)
+    # reading an entry makes it the most recently used
+    assert cache.get("read") is not None
+    cache.put("newest", b"x" * 100)
+    assert cache.get("old") is None
+    assert cache.get("new") is not None
+    assert cache.get("read") is not None
+    assert cache.get("newest") is not None
+    assert cache.evictions == 1
+    assert cache.size == 300
+
+
+def test_size_is_restored_from_disk(tmp_path):
+    ResponseCache(str(tmp_path)).put("a", b"x" * 123)
+    assert ResponseCache(str(tmp_path)).size == 123
+
+
+def test_offline_mode_serves_stale_entries_and_fails_on_misses(tmp_path):
+    ResponseCache(str(tmp_path)).put("a", b"response")
+    cache = ResponseCache(str(tmp_path), ttl=60, offline=True)
+    age(cache, "a", 3600)
+    assert cache.get("a") == b"response"
+    with pytest.raises(OfflineCacheMiss):
+        cache.get("b")
+
+
+def test_concurrent_puts_keep_the_size_exact(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=20 * 1000)
+
+    def put_many(thread: int) -> None:
+        for i in range(50):
+            cache.put("{}-{}".format(thread, i % 20), b"x" * (100 + i))
+
+    threads = [threading.Thread(target=put_many, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.size == sum(os.path.getsize(path) for path in cache.entries())
+    assert cache.size <= 20 * 1000
+
+
+def test_cache_key_ignores_volatile_parameters_and_order():
+    first = downloader.cache_key(
+        "https://host/efetch.fcgi?db=pubmed&retstart=0&tool=a&email=x&api_key=1"
+    )
+    second = downloader.cache_key(
+        "http://other/eutils/efetch.fcgi?email=y&retstart=0&db=pubmed&tool=b"
+    )
+    assert first == second == "efetch.fcgi?db=pubmed&retstart=0"
+    assert first != downloader.cache_key(
+        "https://host/efetch.fcgi?db=pubmed&retstart=20"
+    )
+
+
+def test_cache_key_replaces_the_webenv_with_its_search(monkeypatch):
+    monkeypatch.setattr(
+        downloader,
+        "SESSIONS",
+        {"ENV1": "smith|12", "ENV2": "smith|12", "ENV3": "jones|3"},
+    )
+
+    def key(webenv: str) -> str:
+        return downloader.cache_key(
+            "https://host/efetch.fcgi?db=pubmed&retstart=0&WebEnv={}&query_key=1".format(
+                webenv
+            )
+        )
+
+    assert key("ENV1") == key("ENV2")
+    assert key("ENV1") != key("ENV3")
+
+
+def test_error_and_empty_responses_are_not_cacheable():
+    efetch = "https://host/efetch.fcgi?db=pubmed&retmode=xml&retstart=0"
+    assert downloader.is_cacheable(efetch, b"<PubmedArticleSet><PubmedArticle>...")
+    assert not downloader.is_cacheable(efetch, b"<PubmedArticleSet></PubmedArticleSet>")
+    assert not downloader.is_cacheable(
+        "https://host/esearch.fcgi?db=pubmed",
+        b"<eSearchResult><ERROR>Invalid query</ERROR></eSearchResult>",
+    )
+    assert downloader.is_cacheable(
+        "https://host/esearch.fcgi?db=pubmed", b"<eSearchResult><Count>0</Count>"
+    )
+
+
+def test_fetch_url_reuses_cached_responses(eutils, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "CACHE", ResponseCache(str(tmp_path)))
+    requests = []
+    fetch = downloader.fetch_url_from_network
+    monkeypatch.setattr(
+        downloader,
+        "fetch_url_from_network",
+        lambda url, limiter=None: requests.append(url) or fetch(url, limiter),
+    )
+    url = "{}/efetch.fcgi?db=pubmed&retmode=xml&retstart=0&retmax=5".format(eutils)
+    assert downloader.fetch_url(url) == downloader.fetch_url(url)
+    assert len(requests) == 1
+    # nothing past the end of the corpus, so nothing to cache
+    url = "{}/efetch.fcgi?db=pubmed&retmode=xml&retstart=100000&retmax=5".format(eutils)
+    downloader.fetch_url(url)
+    downloader.fetch_url(url)
+    assert len(requests) == 3
+
+
+def test_offline_misses_end_main_with_the_missing_request(
+    eutils, tmp_path, monkeypatch, caplog
+):
+    output = str(tmp_path / "records.xml")
+    monkeypatch.setattr(
+        "sys.argv",
+        ["main.py", "Smith J", "2000", "2022", "--output", output]
+        + ["--cache-dir", str(tmp_path / "cache"), "--offline"],
+    )
+    with pytest.raises(SystemExit) as exit_info:
+        downloader.main()
+    assert exit_info.value.code == 1
+    [record] = [r for r in caplog.records if r.levelname == "ERROR"]
+    assert "esearch.fcgi?" in record.getMessage()
+    assert "Smith+J" in record.getMessage()
+    assert not os.path.exists(output)
@@ -0,0 +1,101 @@
+"""
+Compressed XML files, and full_xml stored compressed against a trained
+dictionary.
+"""
+
+import gzip
+import hashlib
+import shutil
+
+import pytest
+
+from compact import extract_compact_data_from_files
+import compression
+from compression import XmlCodec
+import database
+from parse_xml import extract_data_from_file, iterate_article_offsets
+
+HEAD = 50
+
+
+@pytest.fixture(scope="module")
+def samples(corpus) -> list:
+    return [paper.full_xml for paper in extract_data_from_file(corpus)]
+
+
+@pytest.fixture
+def gzipped(corpus, tmp_path) -> str:
+    file_name = str(tmp_path / "synthetic.xml.gz")
+    with open(corpus, "rb") as source, gzip.open(file_name, "wb") as target:
+        shutil.copyfileobj(source, target)
+    return file_name
+
+
+def test_zlib_codec_round_trips(samples):
+    codec = XmlCodec.train(samples, compression.ZLIB)
+    assert codec.name == compression.ZLIB
+    assert 0 < len(codec.dictionary) <= compression.ZLIB_DICTIONARY_SIZE
+    compressed = [codec.compress(sample) for sample in samples]
+    assert [codec.decompress(data) for data in compressed] == samples
+    # the dictionary pays for itself on records it was trained on
+    plain = XmlCodec(compression.ZLIB, b"")
+    assert sum(map(len, compressed)) < sum(
+        len(plain.compress(sample)) for sample in samples
+    )
+
+
+def test_zstd_codec_round_trips(samples):
+    pytest.importorskip("zstandard")
+    codec = XmlCodec.train(samples, compression.ZSTD)
+    restored = XmlCodec(codec.name, codec.dictionary)
+    assert [restored.decompress(codec.compress(s)) for s in samples] == samples
+
+
+def test_unknown_codecs_are_refused():
+    with pytest.raises(ValueError):
+        XmlCodec("lzma", b"")
+
+
+def test_compressed_files_parse_like_plain_ones(corpus, gzipped):
+    assert list(extract_data_from_file(gzipped, stream=True)) == list(
+        extract_data_from_file(corpus)
+    )
+
+
+def test_offset_readers_refuse_compressed_files(gzipped):
+    with pytest.raises(ValueError, match="compressed"):
+        list(iterate_article_offsets(gzipped))
+    with pytest.raises(ValueError, match="compressed"):
+        list(extract_compact_data_from_files([gzipped]))
+
+
+def test_full_xml_reads_back_before_and_after_training(corpus, tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "MIN_DICTIONARY_SAMPLES", HEAD + 20)
+    # a first load of too few records to train on is stored uncompressed
+    with open(corpus, "rb") as f:
+        data = f.read()
+    offset, length = list(iterate_article_offsets(corpus))[HEAD - 1]
+    head = str(tmp_path / "head.xml")
+    with open(head, "wb") as f:
+        f.write(data[: offset + length] + b"\n</PubmedArticleSet>\n")
+    db = str(tmp_path / "pubmed.db")
+    assert database.load_files([head], db) == HEAD
+    connection = database.connect_to_database(db)
+    try:
+        assert database.read_xml_codec(connection) is None
+    finally:
+        connection.close()
+    # the next load trains the dictionary, and compresses the new records
+    database.load_files([corpus], db)
+    connection = database.connect_to_database(db)
+    try:
+        codec = database.read_xml_codec(connection)
+        assert codec is not None
+        stored = dict(connection.execute("SELECT pmid, xml_dictionary_id FROM paper"))
+        assert list(stored.values()).count(None) == HEAD
+        assert list(stored.values()).count(codec.dictionary_id) == len(stored) - HEAD
+        for pmid, xml_hash in connection.execute("SELECT pmid, xml_hash FROM paper"):
+            full_xml = database.read_full_xml(connection, pmid)
+            assert hashlib.sha256(full_xml).hexdigest() == xml_hash
+    finally:
+        connection.close()
@@ -0,0 +1,125 @@
+"""
+Incremental loading: unchanged records are skipped, revised records
+replace the stored ones, and the summary tables follow.
+"""
+
+import shutil
+
+import pytest
+
+from aggregate import read_summary, rebuild_summaries
+import database
+from parse_xml import extract_data_from_file
+
+REVISED = 10
+
+
+@pytest.fixture
+def db(tmp_path) -> str:
+    return str(tmp_path / "pubmed.db")
+
+
+@pytest.fixture
+def papers(corpus) -> list:
+    return list(extract_data_from_file(corpus))
+
+
+def count_rows(db: str, table: str) -> int:
+    connection = database.connect_to_database(db)
+    try:
+        return connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_unchanged_files_and_records_are_skipped(corpus, db, papers, tmp_path):
+    assert database.load_files([corpus], db) == len(papers)
+    assert database.load_files([corpus], db) == 0
+    # a copy is a new file, but every record in it is already stored
+    copy = str(tmp_path / "copy.xml")
+    shutil.copyfile(corpus, copy)
+    assert database.load_files([copy], db) == 0
+    assert count_rows(db, "paper") == len(papers)
+    assert count_rows(db, "author_paper") == sum(len(p.authors) for p in papers)
+
+
+def test_revised_records_replace_the_stored_ones(corpus, db, papers, revise, tmp_path):
+    database.load_files([corpus], db)
+    revised = revise(corpus, str(tmp_path / "revised.xml"), 0, REVISED)
+    assert database.load_files([revised], db) == REVISED
+    connection = database.connect_to_database(db)
+    try:
+        titles = dict(connection.execute("SELECT pmid, title FROM paper"))
+        for i, paper in enumerate(papers):
+            title = titles[int(paper.pmc_id)]
+            assert title.startswith("Revised ") == (i < REVISED)
+        # the link rows of the old versions are gone
+        for table, rows in (
+            ("author_paper", sum(len(p.authors) for p in papers)),
+            ("paper_mesh_term", sum(len(p.mesh_terms) for p in papers)),
+            ("paper_reference", sum(len(p.references) for p in papers)),
+            ("paper_search", len(papers)),
+        ):
+            assert count_rows(db, table) == rows
+        revised_paper = int(papers[0].pmc_id)
+        assert database.read_full_xml(connection, revised_paper).count(b"Revised ") == 1
+    finally:
+        connection.close()
+
+
+def test_duplicates_across_files_in_a_bulk_load(corpus, db, papers, revise, tmp_path):
+    revised = revise(corpus, str(tmp_path / "revised.xml"), 0, REVISED)
+    # the revisions replace the first versions within one deferred-index load
+    assert database.load_files([corpus, revised], db, batch_size=50) == (
+        len(papers) + REVISED
+    )
+    assert count_rows(db, "paper") == len(papers)
+    assert count_rows(db, "author_paper") == sum(len(p.authors) for p in papers)
+
+
+def test_summaries_match_a_rebuild_after_revisions(corpus, db, revise, tmp_path):
+    database.load_files([corpus], db)
+    revised = revise(corpus, str(tmp_path / "revised.xml"), 0, REVISED)
+    database.load_files([revised], db)
+    connection = database.connect_to_database(db)
+    try:
+        incremental = read_summary(connection)
+        assert incremental.years["1980"] >= 1
+        rebuild_summaries(connection)
+        assert read_summary(connection) == incremental
+    finally:
+        connection.close()
+
+
+def test_only_bulk_loads_optimize_the_whole_database(
+    corpus, db, revise, tmp_path, monkeypatch
+):
+    calls = []
+    create_indexes = database.create_indexes
+
+    def record(connection, bulk_load=True):
+        calls.append(bulk_load)
+        create_indexes(connection, bulk_load)
+
+    monkeypatch.setattr(database, "create_indexes", record)
+    database.load_files([corpus], db)
+    database.load_files([revise(corpus, str(tmp_path / "revised.xml"), 0, 1)], db)
+    assert calls == [True, False]
+
+
+def test_paper_id_indexes_are_kept_during_bulk_loads(db):
+    connection = database.connect_to_database(db)
+    try:
+        database.create_tables(connection)
+        database.create_indexes(connection)
+        database.drop_indexes(connection)
+        indexes = {
+            name
+            for (name,) in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+        }
+    finally:
+        connection.close()
+    assert database.LOAD_INDEXES <= indexes
+    assert not (set(database.INDEXES) - database.LOAD_INDEXES) & indexes
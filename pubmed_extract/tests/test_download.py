@@ -0,0 +1,115 @@
+"""
+Downloading search results to a file, and resuming an interrupted
+download from its manifest.
+"""
+
+import gzip
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import main as downloader
+from parse_xml import iterate_article_offsets
+
+QUERY = downloader.prepare_query_string("Smith J", 2000, 2022)
+
+
+def read_pmids(file_name: str) -> list:
+    """
+    The PMIDs of the records in a downloaded file, in order.
+    """
+    opener = gzip.open if file_name.endswith(".gz") else open
+    with opener(file_name, "rb") as f:
+        root = ET.fromstring(f.read())
+    return [
+        article.findtext("MedlineCitation/PMID")
+        for article in root.iter("PubmedArticle")
+    ]
+
+
+def interrupt_at(monkeypatch, offset: int) -> None:
+    """
+    Make the download fail when it reaches the batch at an offset.
+    """
+    retrieve = downloader.retrieve_batch_of_records
+
+    def retrieve_until(i: int, *args, **kwargs) -> list:
+        if i == offset:
+            raise ConnectionError("interrupted")
+        return retrieve(i, *args, **kwargs)
+
+    monkeypatch.setattr(downloader, "retrieve_batch_of_records", retrieve_until)
+
+
+@pytest.fixture
+def expected(eutils, tmp_path) -> list:
+    """
+    The PMIDs of a download in one go.
+    """
+    output = str(tmp_path / "expected.xml")
+    downloader.download_records_to_file(QUERY, output, batch_size=50)
+    return read_pmids(output)
+
+
+def test_download_writes_every_record(expected, corpus):
+    count = sum(1 for _ in iterate_article_offsets(corpus))
+    assert len(expected) == len(set(expected)) == count
+
+
+@pytest.mark.parametrize("name", ["records.xml", "records.xml.gz"])
+def test_interrupted_download_resumes_from_the_manifest(
+    name, expected, tmp_path, monkeypatch
+):
+    output = str(tmp_path / name)
+    with monkeypatch.context() as patch:
+        interrupt_at(patch, 40)
+        with pytest.raises(ConnectionError):
+            downloader.download_records_to_file(QUERY, output, batch_size=20)
+    assert not os.path.exists(output)
+    manifest = downloader.read_manifest(output)
+    assert manifest["completed"] == [0, 20]
+    assert manifest["count"] == len(expected)
+    assert manifest["position"] == os.path.getsize(downloader.partial_file_name(output))
+
+    # bytes written after the last checkpoint are discarded on resume
+    with open(downloader.partial_file_name(output), "ab") as f:
+        f.write(b"<PubmedArticle>half a record")
+    written = downloader.download_records_to_file(
+        QUERY, output, batch_size=50, resume=True
+    )
+    assert written == len(expected) - 40
+    assert read_pmids(output) == expected
+    assert not os.path.exists(downloader.manifest_file_name(output))
+    assert not os.path.exists(downloader.partial_file_name(output))
+
+
+def test_resume_uses_the_batch_size_of_the_manifest(expected, tmp_path, monkeypatch):
+    output = str(tmp_path / "records.xml")
+    with monkeypatch.context() as patch:
+        interrupt_at(patch, 60)
+        with pytest.raises(ConnectionError):
+            downloader.download_records_to_file(QUERY, output, batch_size=30)
+    requested = []
+    retrieve = downloader.retrieve_batch_of_records
+
+    def record(i: int, *args, **kwargs) -> list:
+        requested.append(i)
+        return retrieve(i, *args, **kwargs)
+
+    monkeypatch.setattr(downloader, "retrieve_batch_of_records", record)
+    downloader.download_records_to_file(QUERY, output, batch_size=7, resume=True)
+    assert requested == [60, 90]
+    assert read_pmids(output) == expected
+
+
+def test_resume_refuses_changed_search_results(expected, tmp_path, monkeypatch):
+    output = str(tmp_path / "records.xml")
+    with monkeypatch.context() as patch:
+        interrupt_at(patch, 20)
+        with pytest.raises(ConnectionError):
+            downloader.download_records_to_file(QUERY, output, batch_size=20)
+    manifest = downloader.read_manifest(output)
+    downloader.write_manifest(output, dict(manifest, count=len(expected) - 1))
+    with pytest.raises(SystemExit):
+        downloader.download_records_to_file(QUERY, output, resume=True)
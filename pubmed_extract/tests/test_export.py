@@ -0,0 +1,24 @@
+"""
+Exporting papers to NDJSON, streaming the input files by default.
+"""
+
+import json
+
+import export
+from parse_xml import extract_data_from_file
+
+
+def test_files_are_streamed_by_default():
+    assert export.parse_and_validate_args([]).stream
+    assert not export.parse_and_validate_args(["--no-stream"]).stream
+
+
+def test_ndjson_export_has_one_row_per_paper(corpus, tmp_path):
+    output = str(tmp_path / "papers.ndjson")
+    papers = list(extract_data_from_file(corpus, stream=True))
+    assert export.export_papers(iter(papers), output, row_group_size=7) == output
+    with open(output, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert [row["pmc_id"] for row in rows] == [paper.pmc_id for paper in papers]
+    assert rows[0]["title"] == papers[0].title
+    assert "full_xml" not in rows[0]
@@ -0,0 +1,135 @@
+"""
+The CSR graphs: out and in neighbours match the edge lists they were
+built from, and the co-author graph counts the papers each pair shares.
+"""
+
+from array import array
+from collections import Counter
+from itertools import combinations
+import random
+
+import pytest
+
+import database
+from graph import CSRGraph, build_graphs_from_database, build_graphs_from_papers
+from parse_xml import extract_data_from_file
+
+NODES = 50
+EDGES = 400
+
+
+@pytest.fixture(scope="module")
+def edges() -> list:
+    rng = random.Random(15)
+    return [(rng.randrange(NODES), rng.randrange(NODES)) for _ in range(EDGES)]
+
+
+@pytest.fixture(scope="module")
+def papers(corpus) -> list:
+    return list(extract_data_from_file(corpus))
+
+
+def build(edges: list, merge: bool = False) -> CSRGraph:
+    sources, targets = zip(*edges)
+    return CSRGraph.from_edges(
+        NODES, array("I", sources), array("I", targets), merge=merge
+    )
+
+
+def test_neighbours_match_the_edge_list(edges):
+    graph = build(edges)
+    reverse = graph.transpose()
+    assert graph.edge_count == reverse.edge_count == len(edges)
+    for node in range(NODES):
+        # the counting sort keeps the edges of a node in their original order
+        assert list(graph.neighbors(node)) == [t for s, t in edges if s == node]
+        assert sorted(reverse.neighbors(node)) == sorted(
+            s for s, t in edges if t == node
+        )
+        assert graph.degree(node) == sum(1 for s, _ in edges if s == node)
+
+
+def test_merged_edges_sum_their_repeats(edges):
+    graph = build(edges, merge=True)
+    counts = Counter(edges)
+    assert graph.edge_count == len(counts)
+    for node in range(NODES):
+        weights = dict(zip(graph.neighbors(node), graph.edge_weights(node)))
+        assert weights == {t: n for (s, t), n in counts.items() if s == node}
+    reverse = graph.transpose()
+    for node in range(NODES):
+        weights = dict(zip(reverse.neighbors(node), reverse.edge_weights(node)))
+        assert weights == {s: n for (s, t), n in counts.items() if t == node}
+
+
+def test_k_hop_matches_a_breadth_first_search(edges):
+    graph = build(edges)
+    reached = {0}
+    frontier = {0}
+    for _ in range(2):
+        frontier = {t for s, t in edges if s in frontier} - reached
+        reached |= frontier
+    assert set(graph.k_hop(0, 2)) == reached - {0}
+
+
+def test_citation_graph_links_papers_to_their_references(papers):
+    citations, _ = build_graphs_from_papers(papers)
+    cited = Counter()
+    for paper in papers:
+        references = [
+            int(r.pmid) for r in paper.references if r.pmid and r.pmid.isdigit()
+        ]
+        assert citations.out_neighbors(int(paper.pmc_id)) == references
+        cited.update(references)
+    assert cited
+    for pmid, count in cited.most_common(5):
+        assert citations.in_degree(pmid) == count
+        assert sorted(citations.in_neighbors(pmid)) == sorted(
+            int(paper.pmc_id)
+            for paper in papers
+            for r in paper.references
+            if r.pmid == str(pmid)
+        )
+    assert citations.top_in_degree(1)[0][1] == cited.most_common(1)[0][1]
+
+
+def shared_papers(papers: list, max_authors: int) -> Counter:
+    pairs = Counter()
+    for paper in papers:
+        names = sorted(set(author.name for author in paper.authors))
+        if not max_authors or len(names) <= max_authors:
+            pairs.update(combinations(names, 2))
+    return pairs
+
+
+@pytest.mark.parametrize("max_authors", [0, 4])
+def test_coauthor_graph_counts_shared_papers(papers, max_authors):
+    _, coauthors = build_graphs_from_papers(papers, max_authors)
+    pairs = shared_papers(papers, max_authors)
+    # each pair is stored once, from the name that sorts first
+    assert coauthors.forward.edge_count == len(pairs)
+    for name in coauthors.labels:
+        expected = {b: n for (a, b), n in pairs.items() if a == name}
+        expected.update({a: n for (a, b), n in pairs.items() if b == name})
+        assert dict(coauthors.undirected_neighbors(name)) == expected
+
+
+def test_database_graphs_match_the_parsed_ones(corpus, papers, tmp_path):
+    db = str(tmp_path / "pubmed.db")
+    database.load_files([corpus], db)
+    connection = database.connect_to_database(db)
+    try:
+        citations, coauthors = build_graphs_from_database(connection, 4)
+    finally:
+        connection.close()
+    parsed_citations, parsed_coauthors = build_graphs_from_papers(papers, 4)
+    for paper in papers:
+        pmid = int(paper.pmc_id)
+        assert sorted(citations.out_neighbors(pmid)) == sorted(
+            parsed_citations.out_neighbors(pmid)
+        )
+    assert set(coauthors.labels) == set(parsed_coauthors.labels)
+    for name in coauthors.labels:
+        assert sorted(coauthors.undirected_neighbors(name)) == sorted(
+            parsed_coauthors.undirected_neighbors(name)
+        )
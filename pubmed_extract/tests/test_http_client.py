@@ -0,0 +1,155 @@
+"""
+The pooled keep-alive HTTP client: gzip decoding, connection reuse,
+errors and proxies.
+"""
+
+import gzip
+import http.server
+import urllib.error
+
+import pytest
+
+import http_client
+
+
+def recording_handler(gzip_body: bool = False) -> type:
+    """
+    A handler answering every request with the same body, recording the
+    request line, headers and client port of each request.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        body = b"<eSearchResult><Count>42</Count></eSearchResult>" * 100
+        requests = []
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            self.requests.append(
+                (self.requestline, dict(self.headers), self.client_address[1])
+            )
+            body = gzip.compress(self.body) if gzip_body else self.body
+            self.send_response(200)
+            if gzip_body:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_CONNECT(self) -> None:
+            self.requests.append(
+                (self.requestline, dict(self.headers), self.client_address[1])
+            )
+            self.send_response(502)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    return Handler
+
+
+@pytest.fixture
+def pool():
+    pool = http_client.ConnectionPool()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def no_proxy(monkeypatch):
+    for name in ("http_proxy", "https_proxy", "HTTP_PROXY", "HTTPS_PROXY"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_gzip_responses_are_decoded(serve, pool, no_proxy):
+    handler = recording_handler(gzip_body=True)
+    url = serve(handler) + "/esearch.fcgi?db=pubmed"
+    assert http_client.get(url, pool) == handler.body
+    assert handler.requests[0][1]["Accept-Encoding"] == "gzip"
+
+
+def test_gzip_stub_records_match_the_corpus(eutils, pool, corpus):
+    url = eutils + "/efetch.fcgi?db=pubmed&retmode=xml&retstart=0&retmax=10"
+    body = http_client.get(url, pool)
+    assert body.count(b"<PubmedArticle>") == 10
+    with open(corpus, "rb") as f:
+        assert body.split(b"<PubmedArticle>")[1] in f.read()
+
+
+def test_connections_are_reused(serve, pool, no_proxy):
+    handler = recording_handler()
+    url = serve(handler) + "/esearch.fcgi?db=pubmed"
+    for _ in range(3):
+        http_client.get(url, pool)
+    assert len({port for _, _, port in handler.requests}) == 1
+    assert sum(len(idle) for idle in pool.idle.values()) == 1
+
+
+def test_a_dead_pooled_connection_is_replaced(serve, pool, no_proxy):
+    handler = recording_handler()
+    url = serve(handler) + "/esearch.fcgi?db=pubmed"
+    http_client.get(url, pool)
+    (connection,) = [idle[0] for idle in pool.idle.values()]
+    connection.sock.close()
+    assert http_client.get(url, pool) == handler.body
+    assert len({port for _, _, port in handler.requests}) == 2
+
+
+def test_the_pool_keeps_at_most_max_idle_connections(serve, no_proxy):
+    handler = recording_handler()
+    url = serve(handler) + "/esearch.fcgi?db=pubmed"
+    pool = http_client.ConnectionPool(max_idle=1)
+    connections = [pool.get("http", "127.0.0.1", 80) for _ in range(3)]
+    for connection in connections:
+        pool.put("http", "127.0.0.1", 80, None, connection)
+    assert sum(len(idle) for idle in pool.idle.values()) == 1
+    pool.close()
+    assert pool.idle == {}
+    assert http_client.get(url, pool) == handler.body
+
+
+def test_error_statuses_raise_http_error(eutils, pool):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        http_client.get(eutils + "/unknown.fcgi", pool)
+    assert error.value.code == 404
+
+
+def test_refused_connections_raise_url_error(pool, no_proxy):
+    with pytest.raises(urllib.error.URLError):
+        http_client.get("http://127.0.0.1:9/esearch.fcgi", pool)
+
+
+def test_http_requests_go_through_the_proxy(serve, pool, monkeypatch):
+    handler = recording_handler()
+    proxy = serve(handler).replace("http://", "http://user:p%40ss@")
+    monkeypatch.setenv("http_proxy", proxy)
+    monkeypatch.delenv("no_proxy", raising=False)
+    monkeypatch.delenv("NO_PROXY", raising=False)
+    url = "http://eutils.example.org/esearch.fcgi?db=pubmed"
+    assert http_client.get(url, pool) == handler.body
+    requestline, headers, _ = handler.requests[0]
+    assert requestline == "GET {} HTTP/1.1".format(url)
+    # base64 of "user:p@ss"
+    assert headers["Proxy-Authorization"] == "Basic dXNlcjpwQHNz"
+
+
+def test_https_requests_are_tunnelled_through_the_proxy(serve, pool, monkeypatch):
+    handler = recording_handler()
+    monkeypatch.setenv("https_proxy", serve(handler))
+    monkeypatch.delenv("no_proxy", raising=False)
+    monkeypatch.delenv("NO_PROXY", raising=False)
+    with pytest.raises(urllib.error.URLError):
+        http_client.get("https://eutils.example.org/esearch.fcgi?db=pubmed", pool)
+    assert handler.requests[0][0].startswith("CONNECT eutils.example.org:443 ")
+
+
+def test_no_proxy_hosts_are_reached_directly(serve, pool, monkeypatch):
+    proxy_handler = recording_handler()
+    direct_handler = recording_handler()
+    monkeypatch.setenv("http_proxy", serve(proxy_handler))
+    monkeypatch.setenv("no_proxy", "127.0.0.1")
+    url = serve(direct_handler) + "/esearch.fcgi?db=pubmed"
+    assert http_client.get(url, pool) == direct_handler.body
+    assert proxy_handler.requests == []
+    assert len(direct_handler.requests) == 1
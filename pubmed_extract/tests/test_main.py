@@ -0,0 +1,132 @@
+"""
+Rate limiting, retries and backoff of the E-utilities requests in main.py.
+"""
+
+import http.server
+import logging
+import time
+import urllib.error
+
+import pytest
+
+import main as downloader
+
+
+def scripted_handler(statuses: list, headers: dict = None) -> type:
+    """
+    A handler answering with the given statuses in turn, then 200, and
+    recording the path of each request.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        paths = []
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            status = statuses.pop(0) if statuses else 200
+            self.paths.append(self.path)
+            body = b"<eSearchResult><Count>1</Count></eSearchResult>"
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+@pytest.fixture
+def sleeps(eutils, monkeypatch) -> list:
+    """
+    Record the backoff delays instead of sleeping, with no jitter.
+    """
+    delays = []
+    monkeypatch.setattr(downloader.time, "sleep", delays.append)
+    monkeypatch.setattr(downloader.random, "uniform", lambda low, high: 0.0)
+    monkeypatch.setattr(downloader, "BACKOFF_FACTOR", 1.0)
+    return delays
+
+
+def test_token_bucket_limits_the_rate():
+    bucket = downloader.TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # the first token is there at the start, the other five take 1/50 s each
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+
+
+def test_token_bucket_allows_a_burst_up_to_its_capacity():
+    bucket = downloader.TokenBucket(rate=1, capacity=5)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.5
+
+
+def test_retries_on_429_and_5xx(serve, sleeps):
+    handler = scripted_handler([429, 503, 500])
+    url = serve(handler) + "/esearch.fcgi?db=pubmed&term=x"
+    assert downloader.fetch_url(url).startswith(b"<eSearchResult>")
+    assert len(handler.paths) == 4
+    assert sleeps == [1.0, 2.0, 4.0]
+
+
+def test_does_not_retry_other_errors(serve, sleeps):
+    handler = scripted_handler([400])
+    url = serve(handler) + "/esearch.fcgi?db=pubmed&term=x"
+    with pytest.raises(urllib.error.HTTPError) as error:
+        downloader.fetch_url(url)
+    assert error.value.code == 400
+    assert len(handler.paths) == 1
+    assert sleeps == []
+
+
+def test_gives_up_after_max_retries(serve, sleeps, monkeypatch):
+    monkeypatch.setattr(downloader, "MAX_RETRIES", 2)
+    handler = scripted_handler([503] * 10)
+    url = serve(handler) + "/esearch.fcgi?db=pubmed&term=x"
+    with pytest.raises(urllib.error.HTTPError) as error:
+        downloader.fetch_url(url)
+    assert error.value.code == 503
+    assert len(handler.paths) == 3
+    assert sleeps == [1.0, 2.0]
+
+
+def test_honours_retry_after(serve, sleeps):
+    handler = scripted_handler([429], headers={"Retry-After": "3"})
+    url = serve(handler) + "/esearch.fcgi?db=pubmed&term=x"
+    downloader.fetch_url(url)
+    assert sleeps == [3.0]
+
+
+def test_retries_connection_errors(sleeps, monkeypatch):
+    monkeypatch.setattr(downloader, "MAX_RETRIES", 1)
+    # nothing listens on port 9 of localhost
+    with pytest.raises(urllib.error.URLError):
+        downloader.fetch_url("http://127.0.0.1:9/esearch.fcgi?db=pubmed")
+    assert sleeps == [1.0]
+
+
+def test_api_key_is_sent_but_not_logged(serve, sleeps, monkeypatch, caplog):
+    monkeypatch.setattr(downloader, "API_KEY", "SECRET-KEY")
+    handler = scripted_handler([503])
+    url = serve(handler) + "/esearch.fcgi?db=pubmed&term=x"
+    with caplog.at_level(logging.DEBUG):
+        downloader.fetch_url(url)
+    assert all(path.endswith("&api_key=SECRET-KEY") for path in handler.paths)
+    assert "SECRET-KEY" not in caplog.text
+
+
+def test_rate_limiter_is_applied_to_every_attempt(serve, sleeps, monkeypatch):
+    acquired = []
+    limiter = downloader.TokenBucket(1000, 1000)
+    monkeypatch.setattr(limiter, "acquire", lambda: acquired.append(1))
+    handler = scripted_handler([503, 503])
+    url = serve(handler) + "/esearch.fcgi?db=pubmed&term=x"
+    downloader.fetch_url(url, limiter)
+    assert len(acquired) == 3
@@ -0,0 +1,81 @@
+"""
+Sharded and streamed parsing give the same papers as a sequential parse,
+and MeSH headings without a descriptor are left out of the terms.
+"""
+
+import gzip
+import shutil
+
+import pytest
+
+import database
+from parse_xml import (
+    ARTICLE_END_TAG,
+    extract_data_from_file,
+    extract_data_from_files_in_parallel,
+    find_shard_boundaries,
+    parse_shard,
+)
+
+
+@pytest.fixture(scope="module")
+def sequential(corpus) -> list:
+    return list(extract_data_from_file(corpus))
+
+
+def test_streamed_parse_matches_sequential_parse(corpus, sequential):
+    assert list(extract_data_from_file(corpus, stream=True)) == sequential
+
+
+@pytest.mark.parametrize("shard_size", [1, 10 * 1024, 100 * 1024 * 1024])
+def test_shards_cover_the_file_and_end_after_a_record(corpus, shard_size):
+    boundaries = find_shard_boundaries(corpus, shard_size)
+    with open(corpus, "rb") as f:
+        data = f.read()
+    assert boundaries[0][0] == 0
+    assert boundaries[-1][1] == len(data)
+    for (_, end), (start, _) in zip(boundaries, boundaries[1:]):
+        assert end == start
+        assert data[:end].rstrip().endswith(ARTICLE_END_TAG)
+
+
+@pytest.mark.parametrize("shard_size", [1, 10 * 1024, 100 * 1024 * 1024])
+def test_sharded_parse_matches_sequential_parse(corpus, sequential, shard_size):
+    papers = [
+        paper
+        for shard in find_shard_boundaries(corpus, shard_size)
+        for paper in parse_shard((corpus,) + shard)
+    ]
+    assert papers == sequential
+
+
+def test_parallel_parse_matches_sequential_parse(corpus, sequential, tmp_path):
+    # a compressed copy is parsed whole, as it cannot be split by offset
+    compressed = str(tmp_path / "synthetic.xml.gz")
+    with open(corpus, "rb") as source, gzip.open(compressed, "wb") as target:
+        shutil.copyfileobj(source, target)
+    results = list(
+        extract_data_from_files_in_parallel(
+            [corpus, compressed], workers=2, shard_size=16 * 1024
+        )
+    )
+    assert [fn for fn, _ in results].count(compressed) == 1
+    for fn in (corpus, compressed):
+        papers = [paper for name, batch in results if name == fn for paper in batch]
+        assert papers == sequential
+
+
+def test_mesh_headings_without_a_descriptor_are_skipped(corpus, sequential, tmp_path):
+    with open(corpus, "rb") as f:
+        data = f.read()
+    heading = b"<MeshHeading><QualifierName>epidemiology</QualifierName></MeshHeading>"
+    assert b"<MeshHeadingList>" in data
+    file_name = str(tmp_path / "headings.xml")
+    with open(file_name, "wb") as f:
+        f.write(data.replace(b"<MeshHeadingList>", b"<MeshHeadingList>" + heading))
+    papers = list(extract_data_from_file(file_name))
+    assert [paper.mesh_terms for paper in papers] == [
+        paper.mesh_terms for paper in sequential
+    ]
+    db = str(tmp_path / "pubmed.db")
+    assert database.load_files([file_name], db) == len(papers)
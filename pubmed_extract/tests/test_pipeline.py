@@ -0,0 +1,78 @@
+"""
+The download pipeline stores the same rows as downloading the records to
+a file and loading it with database.py.
+"""
+
+import pytest
+
+import database
+import main as downloader
+import pipeline
+
+QUERY = downloader.prepare_query_string("Smith J", 2000, 2022)
+
+
+def read_rows(db: str) -> dict:
+    """
+    The contents of the paper tables, with the ids assigned on insert
+    replaced by what they stand for, in a canonical order.
+    """
+    connection = database.connect_to_database(db)
+    try:
+        queries = {
+            "paper": """SELECT pmid, title, journal, journal_abbreviation, year,
+                month, day, pub_date, page_numbers, doi, abstract, quick_summary,
+                xml_hash FROM paper""",
+            "author_paper": """SELECT paper_id, position, name, affiliation
+                FROM author_paper JOIN author ON author.id = author_id""",
+            "paper_mesh_term": """SELECT paper_id, term
+                FROM paper_mesh_term JOIN mesh_term ON mesh_term.id = mesh_term_id""",
+            "paper_reference": "SELECT * FROM paper_reference",
+            "paper_search": "SELECT rowid, * FROM paper_search",
+            "year_count": "SELECT * FROM year_count",
+            "year_journal_count": "SELECT * FROM year_journal_count",
+            "year_mesh_term_count": "SELECT * FROM year_mesh_term_count",
+        }
+        rows = {
+            table: sorted(connection.execute(sql), key=repr)
+            for table, sql in queries.items()
+        }
+        rows["full_xml"] = sorted(
+            database.read_full_xml(connection, pmid) for pmid, *_ in rows["paper"]
+        )
+        return rows
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def expected(eutils, tmp_path) -> dict:
+    output = str(tmp_path / "records.xml")
+    downloader.download_records_to_file(QUERY, output, batch_size=50)
+    db = str(tmp_path / "expected.db")
+    database.load_files([output], db)
+    return read_rows(db)
+
+
+@pytest.mark.parametrize("workers,parse_workers", [(1, 1), (3, 2)])
+def test_pipeline_stores_the_same_rows_as_database_py(
+    expected, tmp_path, workers, parse_workers
+):
+    db = str(tmp_path / "pipeline.db")
+    inserted = pipeline.run_pipeline(
+        QUERY,
+        db,
+        workers=workers,
+        parse_workers=parse_workers,
+        batch_size=17,
+        store_batch_size=25,
+    )
+    assert inserted == len(expected["paper"])
+    assert read_rows(db) == expected
+
+
+def test_a_second_run_stores_nothing_new(expected, tmp_path):
+    db = str(tmp_path / "pipeline.db")
+    pipeline.run_pipeline(QUERY, db, batch_size=50)
+    assert pipeline.run_pipeline(QUERY, db, batch_size=50) == 0
+    assert read_rows(db) == expected
@@ -0,0 +1,107 @@
+"""
+Refreshing a download: the new and revised records are merged into the
+earlier download by PMID.
+"""
+
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from benchmark import start_stub_server
+import main as downloader
+from parse_xml import iterate_article_offsets
+from synthetic import generate_corpus
+
+QUERY = downloader.prepare_query_string("Smith J", 2000, 2022)
+REVISED = 3
+ADDED = 5
+
+
+def read_records(file_name: str) -> list:
+    """
+    The PMIDs and raw bytes of the records in a downloaded file, in order.
+    """
+    with open(file_name, "rb") as f:
+        data = f.read()
+    records = []
+    for offset, length in iterate_article_offsets(file_name):
+        record = data[offset : offset + length]
+        records.append((ET.fromstring(record).findtext("MedlineCitation/PMID"), record))
+    return records
+
+
+@pytest.fixture
+def download(eutils, tmp_path) -> str:
+    output = str(tmp_path / "records.xml")
+    downloader.download_records_to_file(QUERY, output, batch_size=50)
+    return output
+
+
+@pytest.fixture
+def updates_corpus(corpus, revise, tmp_path) -> str:
+    """
+    A corpus of the first records of the download revised, and new records
+    the download does not have.
+    """
+    count = sum(1 for _ in iterate_article_offsets(corpus))
+    grown = str(tmp_path / "grown.xml")
+    generate_corpus(grown, count + ADDED)
+    revised = revise(grown, str(tmp_path / "revised.xml"), 0, REVISED)
+    with open(revised, "rb") as f:
+        data = f.read()
+    offsets = list(iterate_article_offsets(revised))
+    file_name = str(tmp_path / "updates.xml")
+    with open(file_name, "wb") as f:
+        f.write(b"<PubmedArticleSet>\n")
+        for offset, length in offsets[:REVISED] + offsets[count:]:
+            f.write(data[offset : offset + length] + b"\n")
+        f.write(b"</PubmedArticleSet>\n")
+    return file_name
+
+
+def check_merge(before: list, after: list) -> None:
+    """
+    Revised records are replaced in place, new records are appended, and
+    the untouched records keep their bytes.
+    """
+    assert [pmid for pmid, _ in after[: len(before)]] == [pmid for pmid, _ in before]
+    assert len(after) == len(before) + ADDED
+    for i, ((_, old), (_, new)) in enumerate(zip(before, after)):
+        if i < REVISED:
+            assert b"<ArticleTitle>Revised " in new
+            assert b"<Year>1980</Year>" in new
+        else:
+            assert new == old
+    assert all(b"Revised " not in record for _, record in after[len(before) :])
+
+
+def test_merge_replaces_in_place_and_appends(download, updates_corpus):
+    before = read_records(download)
+    with open(updates_corpus, "rb") as f:
+        records = ET.parse(f).getroot().findall("PubmedArticle")
+    updates = {downloader.record_pmid(record): record for record in records}
+    assert downloader.merge_records_into_file(download, updates) == REVISED
+    check_merge(before, read_records(download))
+    assert not os.path.exists(downloader.partial_file_name(download))
+
+
+def test_refresh_downloads_and_merges_the_updates(
+    download, updates_corpus, monkeypatch
+):
+    before = read_records(download)
+    server = start_stub_server(updates_corpus)
+    try:
+        monkeypatch.setattr(
+            downloader,
+            "EUTILS_URL",
+            "http://127.0.0.1:{}".format(server.server_address[1]),
+        )
+        assert downloader.refresh_records_in_file(QUERY, download, batch_size=4) == (
+            REVISED,
+            ADDED,
+        )
+    finally:
+        server.shutdown()
+    check_merge(before, read_records(download))
+    assert not os.path.exists(downloader.updates_file_name(download))
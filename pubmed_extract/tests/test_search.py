@@ -0,0 +1,92 @@
+"""
+Full-text search: BM25 ranking with title matches above abstract matches,
+and the MeSH term filter.
+"""
+
+import re
+
+import pytest
+
+import database
+from parse_xml import extract_data_from_file, iterate_article_offsets
+import search
+
+WORD = "zyzzogeton"
+MESH_TERMS = ["Poverty", "Income"]
+
+
+@pytest.fixture(scope="module")
+def corpus_with_word(corpus, tmp_path_factory) -> str:
+    """
+    A copy of the corpus with a word found nowhere else added to the title
+    of the first article and the abstract of the next one with an abstract.
+    """
+    with open(corpus, "rb") as f:
+        data = f.read()
+    offsets = list(iterate_article_offsets(corpus))
+    articles = [data[offset : offset + length] for offset, length in offsets]
+    articles[0] = articles[0].replace(
+        b"<ArticleTitle>", b"<ArticleTitle>" + WORD.encode() + b" ", 1
+    )
+    second = next(i for i, a in enumerate(articles) if i and b"<AbstractText>" in a)
+    articles[second] = articles[second].replace(
+        b"<AbstractText>", b"<AbstractText>" + WORD.encode() + b" ", 1
+    )
+    file_name = str(tmp_path_factory.mktemp("search") / "words.xml")
+    with open(file_name, "wb") as f:
+        f.write(
+            b"<PubmedArticleSet>\n" + b"\n".join(articles) + b"\n</PubmedArticleSet>\n"
+        )
+    return file_name
+
+
+@pytest.fixture(scope="module")
+def papers(corpus_with_word) -> list:
+    return list(extract_data_from_file(corpus_with_word))
+
+
+@pytest.fixture
+def connection(corpus_with_word, tmp_path):
+    db = str(tmp_path / "pubmed.db")
+    database.load_files([corpus_with_word], db)
+    connection = database.connect_to_database(db)
+    yield connection
+    connection.close()
+
+
+def words(paper) -> set:
+    text = " ".join([paper.title or "", paper.abstract or ""] + paper.mesh_terms)
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def test_title_matches_rank_above_abstract_matches(connection, papers):
+    in_abstract = next(p for p in papers if WORD in (p.abstract or ""))
+    results = search.search(connection, WORD)
+    assert [result.pmid for result in results] == [
+        int(papers[0].pmc_id),
+        int(in_abstract.pmc_id),
+    ]
+    assert results[0].score < results[1].score
+    assert "[{}]".format(WORD) in results[1].snippet
+
+
+def test_results_are_restricted_to_the_mesh_terms(connection, papers):
+    expected = {
+        int(paper.pmc_id)
+        for paper in papers
+        if "health" in words(paper) and set(MESH_TERMS) <= set(paper.mesh_terms)
+    }
+    assert expected
+    results = search.search(connection, "health", MESH_TERMS, limit=len(papers))
+    assert {result.pmid for result in results} == expected
+    scores = [result.score for result in results]
+    assert scores == sorted(scores)
+    unfiltered = search.search(connection, "health", limit=len(papers))
+    assert len(unfiltered) > len(results)
+
+
+def test_rebuilt_index_gives_the_same_results(connection, papers):
+    before = search.search(connection, "health", MESH_TERMS[:1], limit=len(papers))
+    assert search.rebuild_search_index(connection) == len(papers)
+    after = search.search(connection, "health", MESH_TERMS[:1], limit=len(papers))
+    assert [r.pmid for r in after] == [r.pmid for r in before]
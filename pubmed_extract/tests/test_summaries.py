@@ -0,0 +1,68 @@
+"""
+The summary tables: kept current by incremental loads, they hold the same
+counts as a fresh rebuild and as a streaming pass over the XML.
+"""
+
+import pytest
+
+from aggregate import read_summary, rebuild_summaries, summarize_files, table_rows
+import database
+from summaries import summarize, year_of_publication
+
+REVISED = 15
+
+
+@pytest.fixture
+def loaded(corpus, revise, tmp_path):
+    """
+    A database loaded from the corpus, then from a copy with the first
+    records revised, and the revised copy.
+    """
+    db = str(tmp_path / "pubmed.db")
+    revised = revise(corpus, str(tmp_path / "revised.xml"), 0, REVISED)
+    database.load_files([corpus], db)
+    database.load_files([revised], db)
+    connection = database.connect_to_database(db)
+    yield connection, revised
+    connection.close()
+
+
+def test_incremental_counts_match_a_fresh_rebuild(loaded):
+    connection, revised = loaded
+    incremental = read_summary(connection)
+    assert incremental == summarize_files([revised])
+    rebuild_summaries(connection)
+    assert read_summary(connection) == incremental
+    assert incremental.years["1980"] >= 1
+    assert sum(incremental.years.values()) == sum(incremental.year_journals.values())
+
+
+def test_year_of_publication_falls_back_to_the_medline_date():
+    assert year_of_publication("2021", "2020 Dec") == "2021"
+    assert year_of_publication(None, "2021 Nov-Dec") == "2021"
+    assert year_of_publication("", None) == "Unknown"
+
+
+def test_repeated_mesh_terms_are_counted_once_per_paper():
+    summary = summarize(
+        [
+            ("2020", None, "BMJ", ["Humans", "Humans", "Poverty"]),
+            ("2020", None, None, ["Humans"]),
+        ]
+    )
+    assert summary.years == {"2020": 2}
+    assert summary.year_journals == {("2020", "BMJ"): 1, ("2020", "Unknown"): 1}
+    assert summary.year_mesh_terms == {("2020", "Humans"): 2, ("2020", "Poverty"): 1}
+
+
+def test_table_rows_keep_the_top_terms_of_each_year(loaded):
+    connection, _ = loaded
+    summary = read_summary(connection)
+    rows = table_rows(summary, "mesh", top=2)
+    assert [row[0] for row in rows] == sorted(row[0] for row in rows)
+    for year in set(year for year, _ in summary.year_mesh_terms):
+        counts = sorted(
+            (n for (y, _), n in summary.year_mesh_terms.items() if y == year),
+            reverse=True,
+        )
+        assert [n for y, _, n in rows if y == year] == counts[:2]